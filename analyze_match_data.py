@@ -1,7 +1,8 @@
 import os
-import json
-from collections import defaultdict
+import time
 from dotenv import load_dotenv
+from app.matchindex import MatchIndex
+from app.matchstats import MatchStats, analyze_match_logs, analyze_matches, load_state, save_state
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,154 +11,76 @@ load_dotenv()
 
 PRINT_CARD_STATS = False
 
-# Make the directory to download this dir + tests\match_logs
-current_directory = os.getcwd()
-match_logs_dir = os.path.join(current_directory, "tests", "match_logs")
-
-# Initialize counters and totals
-oshi_usage = defaultdict(int)
-oshi_wins = defaultdict(int)
-total_games = 0
-first_player_wins = 0
-total_turns = 0
-total_time_used = 0.0
-total_clocks = 0
-
-card_usage = defaultdict(int)
-card_wins = defaultdict(int)
-
-deck_usage = defaultdict(int)
-deck_wins = defaultdict(int)
-
-# Iterate over all match logs
-for file_name in os.listdir(match_logs_dir):
-    if file_name.endswith(".json"):
-        # Load the match log
-        with open(os.path.join(match_logs_dir, file_name), "r") as file:
-            match_data = json.load(file)
-
-        # Extract relevant data
-        player_info = match_data["player_info"]
-        winner = match_data["winner"]
-        starting_player = match_data["starting_player"]
-        first_turn_player = match_data["first_turn_player"] if "first_turn_player" in match_data else starting_player
-        player_clocks = match_data["player_clocks"]
-        turn_number = match_data["turn_number"]
-
-        # Increment total games count
-        total_games += 1
-
-        # Track oshi usage and wins
-        for player in player_info:
-            oshi_id = player["oshi_id"]
-            username = player["username"]
-
-            # Count oshi usage
-            oshi_usage[oshi_id] += 1
-
-            # Build the deck string. This is a unique identifier for the deck.
-            deck = player["deck"]
-            cheer_deck = player["cheer_deck"]
-            deck_str = oshi_id + ","
-            for card_id, card_count in deck.items():
-                deck_str += card_id + ":" + str(card_count) + ","
-            for card_id, card_count in cheer_deck.items():
-                deck_str += card_id + ":" + str(card_count) + ","
-            deck_str = deck_str[:-1]  # Remove trailing comma
-            if deck_str not in deck_usage:
-                deck_usage[deck_str] = 1
-            else:
-                deck_usage[deck_str] += 1
-
-            # Check if this player won the game
-            if username == winner:
-                oshi_wins[oshi_id] += 1
-                deck_wins[deck_str] += 1
-
-            for card_id in deck.keys():
-                card_usage[card_id] += 1
-                if username == winner:
-                    card_wins[card_id] += 1
-
-        # Track if the first_turn_player won
-        if first_turn_player == winner:
-            first_player_wins += 1
-
-        # Track total turns
-        total_turns += turn_number
+# Decks are listed when they have more games than this and win more than half of them.
+DECK_MIN_GAMES = 20
 
-        # Track time used (both players' clocks)
-        total_time_used += sum(player_clocks)
-        total_clocks += 2  # Since player_clocks contains time for both players
+# Filters, 0 days back is all of them. Filtered runs find the matches with an index of the logs.
+ANALYZE_DAYS_BACK = int(os.getenv("ANALYZE_DAYS_BACK", "0"))
+ANALYZE_PLAYER = os.getenv("ANALYZE_PLAYER") or None
+ANALYZE_OSHI = os.getenv("ANALYZE_OSHI") or None
 
-# Calculate final statistics
-average_turns = total_turns / total_games if total_games else 0
-average_time_per_player = total_time_used / total_clocks if total_clocks else 0
-first_player_win_percentage = (first_player_wins / total_games * 100) if total_games else 0
+# Unfiltered runs keep their counts here and only read the matches added since the last run.
+ANALYZE_STATE_PATH = os.getenv("ANALYZE_STATE_PATH", os.path.join("data", "match_stats.json"))
 
-# Print results
-print("Oshi Usage Totals:")
-for oshi, count in oshi_usage.items():
-    print(f"{oshi}: {count} times")
-
-print("\nOshi Wins:")
-for oshi, wins in oshi_wins.items():
-    print(f"{oshi}: {wins} wins")
-
-print("\nOshi Win Percentages:")
-for oshi, count in oshi_usage.items():
-    win_percentage = (oshi_wins[oshi] / count * 100) if count else 0
-    print(f"{oshi}: {win_percentage:.2f}%")
-
-# Calculate total oshi usage across all games
-total_oshi_usage = sum(oshi_usage.values())
-
-# Prepare and sort oshi stats by win percentage
-oshi_stats = []
-for oshi, count in oshi_usage.items():
-    win_percentage = (oshi_wins[oshi] / count * 100) if count else 0
-    usage_percentage = (count / total_oshi_usage * 100) if total_oshi_usage else 0
-    oshi_stats.append((oshi, win_percentage, usage_percentage, count))
-
-# Sort by win percentage in descending order
-oshi_stats.sort(key=lambda x: x[1], reverse=True)
-
-# Print formatted table
-print("\nOshi Stats (sorted by win percentage):")
-print(f"{'Oshi ID':<15} {'Win %':<10} {'Usage %':<10} {'Total Usage':<12}")
-for oshi, win_percentage, usage_percentage, count in oshi_stats:
-    print(f"{oshi:<15} {win_percentage:<10.2f} {usage_percentage:<10.2f} {count:<12}")
-
-card_stats = []
-for card, count in card_usage.items():
-    win_percentage = (card_wins[card] / count * 100) if count else 0
-    usage_percentage = (count / (total_games * 2) * 100) if (total_games * 2) else 0
-    card_stats.append((card, win_percentage, usage_percentage, count))
-
-card_stats.sort(key=lambda x: x[1], reverse=True)
-if PRINT_CARD_STATS:
-    print("\nCard Stats (sorted by win percentage):")
-    print(f"{'Card ID':<15} {'Win %':<10} {'Usage %':<10} {'Total Usage':<12}")
-    for card, win_percentage, usage_percentage, count in card_stats:
-        print(f"{card:<15} {win_percentage:<10.2f} {usage_percentage:<10.2f} {count:<12}")
-
-
-print(f"\nTotal games analyzed: {total_games}")
-print(f"Average time used per player: {average_time_per_player:.2f} seconds")
-print(f"First player win percentage: {first_player_win_percentage:.2f}%")
-print(f"Average number of turns: {average_turns:.2f}")
-
-# Order the deck_wins by win rate.
-deck_stats = []
-for deck, count in deck_usage.items():
-    win_percentage = (deck_wins[deck] / count * 100) if count else 0
-    win_count = deck_wins[deck]
-    usage_percentage = (count / total_games * 100) if total_games else 0
-    deck_stats.append((deck, win_percentage, usage_percentage, win_count, count))
-
-deck_stats.sort(key=lambda x: x[1], reverse=True)
-
-print("\nDeck Usage Totals:")
-for deck, win_percentage, usage_percentage, win_count, count in deck_stats:
-    if count > 20 and win_percentage > 50:
-        print(f"{deck}\nWon {win_count} / {count} times. Win rate: {win_percentage:.2f}%")
\ No newline at end of file
+# Make the directory to download this dir + tests\match_logs
+current_directory = os.getcwd()
+match_logs_dir = os.path.join(current_directory, "tests", "match_logs")
+# The index for filtered runs is kept with the logs, it isn't read as a match log.
+match_index_path = os.path.join(match_logs_dir, "match_index.sqlite3")
+
+def print_win_rates(title, label, rows):
+    print(f"\n{title} (sorted by win percentage):")
+    print(f"{label:<15} {'Win %':<10} {'95% CI':<16} {'Usage %':<10} {'Total Usage':<12}")
+    for row in rows:
+        interval = f"{row.low_percentage:.1f}-{row.high_percentage:.1f}"
+        print(f"{row.key:<15} {row.win_percentage:<10.2f} {interval:<16} {row.usage_percentage:<10.2f} {row.games:<12}")
+
+def main():
+    filtered = ANALYZE_DAYS_BACK or ANALYZE_PLAYER or ANALYZE_OSHI
+    if filtered:
+        stats, analyzed_match_ids = MatchStats(), set()
+    else:
+        stats, analyzed_match_ids = load_state(ANALYZE_STATE_PATH)
+
+    # The matches always come from match_logs_dir, filtered runs look them up in its index.
+    if filtered:
+        start_time = time.time() - ANALYZE_DAYS_BACK * 24 * 60 * 60 if ANALYZE_DAYS_BACK else None
+        match_index = MatchIndex(match_index_path)
+        # Logs that aren't in the index yet are added first, dated by their file times.
+        match_index.add_unindexed_logs(match_logs_dir)
+        # Logs removed from the directory are left out.
+        file_names = set(os.listdir(match_logs_dir))
+        matches = [match for match in match_index.find_matches(start_time=start_time, username=ANALYZE_PLAYER, oshi_id=ANALYZE_OSHI) if match["match_id"] in file_names]
+        new_stats, new_match_ids = analyze_matches(matches, analyzed_match_ids)
+    else:
+        new_stats, new_match_ids = analyze_match_logs(match_logs_dir, analyzed_match_ids)
+    logger.info(f"Analyzed {len(new_match_ids)} new matches, {len(analyzed_match_ids)} from earlier runs")
+    stats.merge(new_stats)
+    if not filtered:
+        save_state(ANALYZE_STATE_PATH, stats, analyzed_match_ids.union(new_match_ids))
+
+    oshi_stats = stats.oshi_win_rates()
+    print("Oshi Usage Totals:")
+    for row in oshi_stats:
+        print(f"{row.key}: {row.games} times")
+
+    print("\nOshi Wins:")
+    for row in oshi_stats:
+        print(f"{row.key}: {row.wins} wins")
+
+    print_win_rates("Oshi Stats", "Oshi ID", oshi_stats)
+    if PRINT_CARD_STATS:
+        print_win_rates("Card Stats", "Card ID", stats.card_win_rates())
+
+    print(f"\nTotal games analyzed: {stats.total_games}")
+    print(f"Average time used per player: {stats.average_time_per_player():.2f} seconds")
+    print(f"First player win percentage: {stats.first_player_win_percentage():.2f}%")
+    print(f"Average number of turns: {stats.average_turns():.2f}")
+
+    print("\nDeck Usage Totals:")
+    for row in stats.deck_win_rates():
+        if row.games > DECK_MIN_GAMES and row.win_percentage > 50:
+            print(f"{row.key}\nWon {row.wins} / {row.games} times. Win rate: {row.win_percentage:.2f}% (95% CI {row.low_percentage:.2f}-{row.high_percentage:.2f}%)")
+
+if __name__ == "__main__":
+    main()
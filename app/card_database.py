@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 import json
 from typing import Dict, List, Any
+from collections.abc import KeysView, ValuesView, ItemsView
 from copy import deepcopy
 import logging
 logger = logging.getLogger(__name__)
@@ -17,9 +18,152 @@ ALLOWED_DECK_TYPES = [
     "support",
 ]
 
+def _read_only(*args, **kwargs):
+    raise TypeError("Card definitions are read-only, use CardDatabase.copy_card_by_id for a mutable copy.")
+
+class ReadOnlyDict(dict):
+    # Shared card definition data.
+    # Every game reads from the same objects, so any mutation would leak into other rooms.
+    # Copying (deepcopy, copy(), dict(...)) gives back plain mutable containers.
+    __slots__ = ()
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return (freeze_definition, (self.__deepcopy__({}),))
+
+class ReadOnlyList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __iadd__ = __imul__ = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return (freeze_definition, (self.__deepcopy__({}),))
+
+def freeze_definition(value, compile_condition=None):
+    # compile_condition, when given, is applied to every condition in a "conditions"-style list.
+    if isinstance(value, (ReadOnlyDict, ReadOnlyList)):
+        return value
+    if isinstance(value, dict):
+        frozen = {}
+        for key, item in value.items():
+            if compile_condition and key.endswith("conditions") and isinstance(item, list):
+                frozen[key] = ReadOnlyList(compile_condition(condition) for condition in item)
+            else:
+                frozen[key] = freeze_definition(item, compile_condition)
+        return ReadOnlyDict(frozen)
+    if isinstance(value, list):
+        return ReadOnlyList(freeze_definition(item, compile_condition) for item in value)
+    return value
+
+class GameCard(dict):
+    # A card instance in a game.
+    # Only the per-game fields (ids, damage, attachments...) are stored in the dict itself.
+    # Everything else is read from the shared definition, so building a deck doesn't copy arts and effects.
+    # Writing a static field stores an override on this card only.
+    __slots__ = ("definition", "zone_index")
+
+    def __init__(self, definition, **fields):
+        super().__init__(**fields)
+        self.definition = definition
+        # Set by the game engine once the card belongs to a player, keeps attachment zones indexed.
+        self.zone_index = None
+
+    def __setitem__(self, key, value):
+        if self.zone_index is not None:
+            value = self.zone_index.on_card_field_set(self, key, value)
+        dict.__setitem__(self, key, value)
+
+    def __missing__(self, key):
+        return self.definition[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.definition
+
+    def __iter__(self):
+        yield from self.definition
+        for key in dict.__iter__(self):
+            if key not in self.definition:
+                yield key
+
+    def __len__(self):
+        return len(self.definition) + len(dict.keys(self) - self.definition.keys())
+
+    def __bool__(self):
+        # Checked often (`if card:`), avoid counting the keys.
+        return bool(self.definition) or dict.__len__(self) > 0
+
+    def __eq__(self, other):
+        if isinstance(other, GameCard):
+            return self.definition is other.definition and dict.__eq__(self, other)
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.definition.get(key, default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        # Only per-game fields can be removed.
+        return dict.pop(self, key, *args)
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def copy(self):
+        return GameCard(self.definition, **dict(dict.items(self)))
+
+    def __deepcopy__(self, memo):
+        card = GameCard(self.definition)
+        memo[id(self)] = card
+        for key, value in dict.items(self):
+            dict.__setitem__(card, key, deepcopy(value, memo))
+        return card
+
+    def __reduce__(self):
+        return (GameCard, (self.definition,), (None, {"zone_index": self.zone_index}), None, iter(dict.items(self)))
+
 class CardDatabase:
     def __init__(self):
         self.all_cards = []
+        self.cards_by_id : Dict[str, ReadOnlyDict] = {}
+        self.cards_by_alt_id : Dict[str, List[ReadOnlyDict]] = {}
 
         # The card_definitions.json file is in root\decks\card_definitions.json
         # This file is in root\app
@@ -44,13 +188,33 @@ class CardDatabase:
                     alt_card["rarity"] = rarity
                     del alt_card["alternates"]
                     card_data.append(alt_card)
-            self.all_cards = card_data
+            # Imported here since the game engine imports this module.
+            from app.gameengine import compile_condition
+            self.all_cards = [freeze_definition(card, compile_condition) for card in card_data]
+        self.build_indices()
 
-    def get_card_by_id(self, card_id):
+    def build_indices(self):
+        self.cards_by_id = {}
+        self.cards_by_alt_id = {}
         for card in self.all_cards:
-            if card["card_id"] == card_id:
-                return deepcopy(card)
-        return None
+            # Keep the first definition if an id is duplicated, same as the old linear scan.
+            self.cards_by_id.setdefault(card["card_id"], card)
+            if "alt_id" in card:
+                self.cards_by_alt_id.setdefault(card["alt_id"], []).append(card)
+
+    def get_card_by_id(self, card_id):
+        # Returns the shared read-only definition, do not modify it.
+        return self.cards_by_id.get(card_id)
+
+    def copy_card_by_id(self, card_id):
+        # Returns a mutable copy of the definition for callers that need to change it.
+        card = self.cards_by_id.get(card_id)
+        if card is None:
+            return None
+        return deepcopy(card)
+
+    def get_cards_by_alt_id(self, alt_id):
+        return self.cards_by_alt_id.get(alt_id, [])
 
     def validate_deck(self, oshi_id : str, deck : Dict[str, int], cheer_deck: Dict[str, int]):
 
@@ -60,9 +224,16 @@ class CardDatabase:
             logger.info("--Deck Invalid: Oshi")
             return False
 
+        # Count copies per alt group up front so each entry is a single lookup.
+        alt_copies = {}
+        for card_id, count in deck.items():
+            deck_card = self.get_card_by_id(card_id)
+            if deck_card and "alt_id" in deck_card:
+                alt_id = deck_card["alt_id"]
+                alt_copies[alt_id] = alt_copies.get(alt_id, 0) + count
+
         # Check the deck
         deck_count = 0
-        alt_copies = {}
         for card_id, count in deck.items():
             deck_card = self.get_card_by_id(card_id)
             if not deck_card or deck_card["card_type"] not in ALLOWED_DECK_TYPES:
@@ -79,16 +250,8 @@ class CardDatabase:
             if "special_deck_limit" in deck_card:
                 deck_limit = deck_card["special_deck_limit"]
 
-            card_copies = 0
             if "alt_id" in deck_card:
-                alt_id = deck_card["alt_id"]
-                if alt_id in alt_copies:
-                    card_copies = alt_copies[alt_id]
-                else:
-                    for key in deck.keys():
-                        if key.startswith(alt_id):
-                            card_copies += deck[key]
-                    alt_copies[alt_id] = card_copies
+                card_copies = alt_copies[deck_card["alt_id"]]
             else:
                 card_copies = count
 
@@ -115,4 +278,4 @@ class CardDatabase:
             logger.info("--Deck Invalid: Cheer deck count wrong")
             return False
 
-        return True
\ No newline at end of file
+        return True
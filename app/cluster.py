@@ -0,0 +1,300 @@
+import asyncio
+import json
+import traceback
+from typing import Dict
+from app.coordinator import CLUSTER_MESSAGE_LIMIT
+from app.gameroom import send_observer_dropped
+from app.matchmaking import GameTypeInfo, get_queue_friendly_name
+from app.playermanager import Player
+from app.serialization import encode_json
+import logging
+logger = logging.getLogger(__name__)
+
+CONNECT_ATTEMPTS = 20
+CONNECT_RETRY_SECONDS = 0.5
+# Waits between attempts to reconnect, doubling up to the max.
+RECONNECT_RETRY_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 10
+
+class ClusterClient:
+    # A worker's connection to the coordinator, see app/coordinator.py.
+    # on_message is called with each message from the coordinator, in order. When the connection is
+    # lost it is called with coordinator_lost, and with coordinator_reconnected once it is back.
+    def __init__(self, socket_path : str, worker_id : str):
+        self.socket_path = socket_path
+        self.worker_id = worker_id
+        self.on_message = None
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.connected = False
+
+        # The lobby as the other workers last published it, and what this worker last published.
+        self.remote_lobby_states = {}
+        self.published_lobby_state = None
+
+    async def connect(self, on_message):
+        self.on_message = on_message
+        # The coordinator is started next to the workers, it can take a moment to be up.
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                await self.open_connection()
+                break
+            except OSError:
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(CONNECT_RETRY_SECONDS)
+        self.read_task = asyncio.create_task(self.read_messages())
+        logger.info(f"Worker {self.worker_id} connected to coordinator at {self.socket_path}")
+
+    async def open_connection(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path, limit=CLUSTER_MESSAGE_LIMIT)
+        self.connected = True
+        self.send({"type": "hello", "worker_id": self.worker_id})
+
+    async def reconnect(self):
+        # Messages sent until it is back are dropped. The coordinator forgot this worker's queued
+        # players and lobby, the lobby is published again here and the queues by the server.
+        self.connected = False
+        self.writer.close()
+        self.remote_lobby_states = {}
+        self.dispatch({"type": "coordinator_lost"})
+        delay = RECONNECT_RETRY_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.open_connection()
+                break
+            except OSError as e:
+                logger.error(f"Worker {self.worker_id} could not reconnect to the coordinator, retrying in {delay} seconds: {e}")
+                delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+        logger.info(f"Worker {self.worker_id} reconnected to coordinator at {self.socket_path}")
+        if self.published_lobby_state:
+            self.send({"type": "lobby_state", **self.published_lobby_state})
+        self.dispatch({"type": "coordinator_reconnected"})
+
+    async def close(self):
+        self.connected = False
+        if self.read_task:
+            self.read_task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    def send(self, message : dict):
+        if not self.connected:
+            logger.warning(f"Worker {self.worker_id} is not connected to the coordinator, dropped {message['type']}")
+            return
+        self.writer.write(encode_json(message).encode("utf-8") + b"\n")
+
+    def forward(self, worker_id : str, message : dict):
+        self.send({"type": "forward", "worker_id": worker_id, "message": message})
+
+    async def drain(self):
+        if not self.connected:
+            return
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            # The read loop finds out and reconnects.
+            pass
+
+    async def read_messages(self):
+        while True:
+            try:
+                line = await self.reader.readline()
+            except ConnectionError:
+                line = b""
+            if not line:
+                logger.error(f"Worker {self.worker_id} lost the connection to the coordinator, reconnecting")
+                await self.reconnect()
+                continue
+            try:
+                message = json.loads(line)
+            except Exception as e:
+                logger.error(f"Invalid coordinator message: {e}")
+                continue
+            if message["type"] == "lobby_states":
+                self.remote_lobby_states = message["lobby_states"]
+            self.dispatch(message)
+
+    def dispatch(self, message : dict):
+        try:
+            self.on_message(message)
+        except Exception as e:
+            error_details = traceback.format_exc()
+            logger.error(f"Error handling coordinator message: {e} Callstack: {error_details}")
+
+    def publish_lobby_state(self, players_info, rooms_info):
+        # Only sent when it changed, the coordinator passes it on to the other workers.
+        lobby_state = {"players_info": players_info, "rooms_info": rooms_info}
+        if lobby_state != self.published_lobby_state:
+            self.published_lobby_state = lobby_state
+            self.send({"type": "lobby_state", **lobby_state})
+
+    def get_remote_lobby_state(self):
+        players_info = {}
+        rooms_info = {}
+        for lobby_state in self.remote_lobby_states.values():
+            players_info.update(lobby_state["players_info"])
+            rooms_info.update(lobby_state["rooms_info"])
+        return players_info, rooms_info
+
+    def get_room_worker(self, room_id : str):
+        for worker_id, lobby_state in self.remote_lobby_states.items():
+            if room_id in lobby_state["rooms_info"]:
+                return worker_id
+        return None
+
+class RemoteConnection:
+    # Stands in for the websocket of a player connected to another worker, frames are passed on
+    # through the coordinator and queued on the player's real connection there.
+    def __init__(self, cluster : ClusterClient, worker_id : str, player_id : str):
+        self.cluster = cluster
+        self.worker_id = worker_id
+        self.player_id = player_id
+
+    async def send_text(self, text : str):
+        self.cluster.forward(self.worker_id, {"type": "frame", "player_id": self.player_id, "text": text})
+        await self.cluster.drain()
+
+    async def close(self):
+        pass
+
+class RemotePlayer(Player):
+    # A player in a room on this worker that is connected to another worker.
+    def __init__(self, cluster : ClusterClient, player_info : dict):
+        super().__init__(player_info["player_id"], RemoteConnection(cluster, player_info["worker_id"], player_info["player_id"]))
+        self.worker_id = player_info["worker_id"]
+        self.username = player_info["username"]
+        self.game_event_batches = player_info["game_event_batches"]
+        self.save_deck_info(player_info["oshi_id"], player_info["deck"], player_info["cheer_deck"])
+
+def get_cluster_player_info(cluster : ClusterClient, player : Player):
+    # What another worker needs to make a RemotePlayer for this player.
+    return {
+        **player.get_player_game_info(),
+        "worker_id": cluster.worker_id,
+        "game_event_batches": player.game_event_batches,
+    }
+
+class RemoteRoom:
+    # A room that runs on another worker, for the players and observers on this one.
+    # Their messages are passed on to the owning worker, which sends back their events.
+    def __init__(self, cluster : ClusterClient, room_id : str, room_name : str, owner_worker_id : str, players):
+        self.cluster = cluster
+        self.room_id = room_id
+        self.room_name = room_name
+        self.owner_worker_id = owner_worker_id
+        self.players = players
+        self.observers = []
+        self.closed = False
+        for player in self.players:
+            player.current_game_room = self
+
+    def get_room_name(self):
+        return self.room_name
+
+    def is_ai_game(self):
+        return False
+
+    def is_ready_for_cleanup(self):
+        return self.closed
+
+    def is_game_over(self):
+        # The owning worker says when the room closes.
+        return False
+
+    def shutdown(self):
+        pass
+
+    def forward(self, player_id : str, message : dict):
+        self.cluster.forward(self.owner_worker_id, {**message, "room_id": self.room_id, "player_id": player_id})
+
+    async def handle_game_message(self, player_id : str, action_type : str, action_data : dict):
+        self.forward(player_id, {"type": "room_action", "action_type": action_type, "action_data": action_data})
+
+    async def handle_emote_message(self, player_id : str, emote_id : int):
+        self.forward(player_id, {"type": "room_emote", "emote_id": emote_id})
+
+    async def join_as_observer(self, player : Player, from_snapshot : bool = False):
+        self.observers.append(player)
+        player.current_game_room = self
+        self.forward(player.player_id, {"type": "room_observe", "player": get_cluster_player_info(self.cluster, player), "from_snapshot": from_snapshot})
+
+    async def observer_request_next_events(self, player : Player, starting_event_index):
+        self.forward(player.player_id, {"type": "room_observer_events", "next_event_index": starting_event_index})
+
+    async def handle_player_quit(self, player : Player):
+        # Out of the room here right away, the owning worker may be gone and never send room_closed.
+        if player in self.observers:
+            self.observers.remove(player)
+        if player in self.players:
+            self.players.remove(player)
+        player.current_game_room = None
+        self.forward(player.player_id, {"type": "room_quit"})
+
+    async def handle_player_disconnect(self, player : Player):
+        self.forward(player.player_id, {"type": "room_disconnect"})
+
+    def drop_observer(self, player : Player):
+        # Same as GameRoom.drop_observer, the owning worker stops sending to them.
+        if player in self.observers:
+            self.observers.remove(player)
+        player.current_game_room = None
+        self.forward(player.player_id, {"type": "room_quit"})
+        send_observer_dropped(player)
+
+class ClusterMatchmaking:
+    # Matchmaking shared by all workers through the coordinator, with the same interface as
+    # Matchmaking. Matches are never made right away, the coordinator sends them to the workers.
+    def __init__(self, cluster : ClusterClient):
+        self.cluster = cluster
+        self.queue_info = []
+        self.player_queues : Dict[str, str] = {}
+        # What each queued player was sent to the coordinator with, to send again after a reconnect.
+        self.queue_messages : Dict[str, dict] = {}
+
+    def is_game_type_valid(self, game_type: str):
+        return game_type in GameTypeInfo
+
+    def is_valid_queue_name(self, queue_name: str):
+        if not queue_name:
+            return False
+        return True
+
+    def get_player_queue(self, player: Player):
+        return self.player_queues.get(player.player_id)
+
+    def add_player_to_queue(self, player: Player, queue_name: str, custom_game: bool, game_type: str):
+        logger.info(f"MATCHMAKING: Sending player {player.get_username()} to coordinator queue {queue_name} (game_type: {game_type})")
+        self.player_queues[player.player_id] = queue_name
+        player.set_queue(get_queue_friendly_name(queue_name))
+        message = {
+            "type": "queue",
+            "player": get_cluster_player_info(self.cluster, player),
+            "queue_name": queue_name,
+            "custom_game": custom_game,
+            "game_type": game_type,
+        }
+        self.queue_messages[player.player_id] = message
+        self.cluster.send(message)
+        return None
+
+    def remove_player_from_queue(self, player: Player):
+        self.queue_messages.pop(player.player_id, None)
+        if self.player_queues.pop(player.player_id, None) is not None:
+            player.set_queue("")
+            self.cluster.send({"type": "leave_queue", "player_id": player.player_id})
+
+    def remove_matched_player(self, player: Player):
+        self.queue_messages.pop(player.player_id, None)
+        self.player_queues.pop(player.player_id, None)
+        player.set_queue("")
+
+    def requeue_players(self):
+        # After a reconnect, in the order they first queued.
+        for message in self.queue_messages.values():
+            self.cluster.send(message)
+
+    def get_queue_info(self):
+        return self.queue_info
@@ -0,0 +1,195 @@
+"""
+Matchmaking coordinator for running the server with several worker processes.
+
+Workers connect over a local socket (see app/cluster.py) and send newline delimited JSON messages.
+The coordinator keeps the matchmaking queues for all of them, tells the workers about matches, keeps
+each worker's part of the lobby for the others and passes messages between workers for rooms that
+have players on more than one worker.
+
+Run next to the workers:
+    python -m app.coordinator /tmp/holoduel_coordinator.sock
+"""
+
+import asyncio
+import json
+import os
+import sys
+import traceback
+from typing import Dict
+from app.matchmaking import Matchmaking
+from app.playermanager import Player
+from app.serialization import encode_json
+import logging
+logger = logging.getLogger(__name__)
+
+# Messages carry whole game event frames, the default 64 KiB line limit is too small.
+CLUSTER_MESSAGE_LIMIT = 64 * 1024 * 1024
+
+class QueuedPlayer(Player):
+    # What the coordinator knows about a player waiting in a queue on some worker.
+    def __init__(self, worker_id : str, player_info : dict):
+        super().__init__(player_info["player_id"], None)
+        self.worker_id = worker_id
+        self.username = player_info["username"]
+        self.game_event_batches = player_info["game_event_batches"]
+        self.save_deck_info(player_info["oshi_id"], player_info["deck"], player_info["cheer_deck"])
+
+    def get_match_info(self):
+        return {
+            **self.get_player_game_info(),
+            "worker_id": self.worker_id,
+            "game_event_batches": self.game_event_batches,
+        }
+
+class Coordinator:
+    def __init__(self, socket_path : str):
+        self.socket_path = socket_path
+        self.server = None
+        self.matchmaking = Matchmaking()
+        self.workers : Dict[str, asyncio.StreamWriter] = {}
+        self.queued_players : Dict[str, QueuedPlayer] = {}
+        # The players and rooms each worker shows in the lobby.
+        self.lobby_states : Dict[str, dict] = {}
+        # Rooms with players on more than one worker, until their owner forwards room_closed.
+        self.cluster_rooms : Dict[str, dict] = {}
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.socket_path, limit=CLUSTER_MESSAGE_LIMIT)
+        logger.info(f"Coordinator listening on {self.socket_path}")
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.workers.values()):
+            writer.close()
+        await self.server.wait_closed()
+
+    def send(self, worker_id : str, message : dict):
+        writer = self.workers.get(worker_id)
+        if writer is None:
+            logger.warning(f"Coordinator dropped {message['type']} for unknown worker {worker_id}")
+            return
+        writer.write(encode_json(message).encode("utf-8") + b"\n")
+
+    async def handle_worker(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        hello = json.loads(await reader.readline())
+        worker_id = hello["worker_id"]
+        self.workers[worker_id] = writer
+        logger.info(f"Worker {worker_id} connected, {len(self.workers)} workers")
+        self.send(worker_id, {"type": "queue_info", "queue_info": self.matchmaking.get_queue_info()})
+        self.send(worker_id, {"type": "lobby_states", "lobby_states": self.get_other_lobby_states(worker_id)})
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self.handle_message(worker_id, json.loads(line))
+                except Exception as e:
+                    error_details = traceback.format_exc()
+                    logger.error(f"Coordinator error handling message from worker {worker_id}: {e} Callstack: {error_details}")
+                await writer.drain()
+        finally:
+            self.remove_worker(worker_id)
+
+    def remove_worker(self, worker_id : str):
+        logger.info(f"Worker {worker_id} disconnected")
+        self.workers.pop(worker_id, None)
+        for player in [player for player in self.queued_players.values() if player.worker_id == worker_id]:
+            self.remove_queued_player(player)
+        self.close_worker_rooms(worker_id)
+        self.lobby_states.pop(worker_id, None)
+        self.send_queue_info()
+        self.send_lobby_states()
+
+    def close_worker_rooms(self, worker_id : str):
+        # The other workers close their side of the rooms the worker ran, and the rooms they run
+        # see its players as disconnected.
+        lobby_state = self.lobby_states.get(worker_id, {"rooms_info": {}})
+        room_ids = set(lobby_state["rooms_info"])
+        for room_id, room in list(self.cluster_rooms.items()):
+            if room["owner_worker_id"] == worker_id:
+                room_ids.add(room_id)
+                del self.cluster_rooms[room_id]
+                continue
+            for player_id, player_worker_id in room["player_workers"].items():
+                if player_worker_id == worker_id:
+                    self.send(room["owner_worker_id"], {"type": "room_disconnect", "room_id": room_id, "player_id": player_id, "from_worker_id": worker_id})
+        for room_id in room_ids:
+            for other_id in self.workers:
+                self.send(other_id, {"type": "room_closed", "room_id": room_id, "from_worker_id": worker_id, "worker_lost": True})
+
+    def handle_message(self, worker_id : str, message : dict):
+        match message["type"]:
+            case "queue":
+                player = QueuedPlayer(worker_id, message["player"])
+                self.queued_players[player.player_id] = player
+                room = self.matchmaking.add_player_to_queue(player, message["queue_name"], message["custom_game"], message["game_type"])
+                if room:
+                    self.send_match(room)
+                self.send_queue_info()
+            case "leave_queue":
+                player = self.queued_players.get(message["player_id"])
+                if player:
+                    self.remove_queued_player(player)
+                    self.send_queue_info()
+            case "lobby_state":
+                self.lobby_states[worker_id] = {
+                    "players_info": message["players_info"],
+                    "rooms_info": message["rooms_info"],
+                }
+                self.send_lobby_states()
+            case "forward":
+                if message["message"]["type"] == "room_closed":
+                    self.cluster_rooms.pop(message["message"]["room_id"], None)
+                self.send(message["worker_id"], {**message["message"], "from_worker_id": worker_id})
+            case _:
+                logger.warning(f"Coordinator got unknown message {message['type']} from worker {worker_id}")
+
+    def remove_queued_player(self, player : QueuedPlayer):
+        del self.queued_players[player.player_id]
+        self.matchmaking.remove_player_from_queue(player)
+
+    def send_match(self, room):
+        # The room runs on the worker of the player that was waiting first.
+        players = [player.get_match_info() for player in room.players]
+        message = {
+            "type": "match",
+            "room_id": room.room_id,
+            "room_name": room.room_name,
+            "game_type": room.game_type,
+            "queue_name": room.queue_name,
+            "owner_worker_id": room.players[0].worker_id,
+            "players": players,
+        }
+        for player in room.players:
+            self.queued_players.pop(player.player_id, None)
+        player_workers = {player["player_id"]: player["worker_id"] for player in players}
+        if len(set(player_workers.values())) > 1:
+            self.cluster_rooms[room.room_id] = {"owner_worker_id": message["owner_worker_id"], "player_workers": player_workers}
+        for worker_id in {player["worker_id"] for player in players}:
+            self.send(worker_id, message)
+        logger.info(f"Coordinator matched room {room.room_id} on worker {message['owner_worker_id']}")
+
+    def send_queue_info(self):
+        message = {"type": "queue_info", "queue_info": self.matchmaking.get_queue_info()}
+        for worker_id in self.workers:
+            self.send(worker_id, message)
+
+    def get_other_lobby_states(self, worker_id : str):
+        return {other_id: state for other_id, state in self.lobby_states.items() if other_id != worker_id}
+
+    def send_lobby_states(self):
+        for worker_id in self.workers:
+            self.send(worker_id, {"type": "lobby_states", "lobby_states": self.get_other_lobby_states(worker_id)})
+
+async def main():
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("CLUSTER_SOCKET", "/tmp/holoduel_coordinator.sock")
+    coordinator = Coordinator(socket_path)
+    await coordinator.start()
+    await coordinator.server.serve_forever()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
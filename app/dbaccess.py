@@ -1,3 +1,4 @@
+import asyncio
 import os
 import zipfile
 import json
@@ -7,6 +8,8 @@ import aiofiles
 import logging
 from datetime import datetime
 from pathlib import Path
+from app.matchindex import MatchIndex
+from app.matchlog import HISTORY_FIELDS, LEGACY_MATCH_LOG_EXTENSION
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +17,14 @@ logger = logging.getLogger(__name__)
 LOCAL_DATA_DIR = "data"
 MATCH_LOGS_DIR = os.path.join(LOCAL_DATA_DIR, "match_logs")
 GAME_PACKAGE_DIR = os.path.join(LOCAL_DATA_DIR, "game_package")
+# 저장된 매치 로그를 날짜, 플레이어, 오시로 찾기 위한 인덱스 (app/matchindex.py)
+MATCH_INDEX_PATH = os.path.join(LOCAL_DATA_DIR, "match_index.sqlite3")
+
+# 매치 로그 형식. compact는 게임 중에 이어서 쓰는 압축 로그(app/matchlog.py), json은 게임이 끝날 때 저장하는 기존 형식입니다.
+MATCH_LOG_FORMAT = os.getenv("MATCH_LOG_FORMAT", "compact")
+
+# 저장을 기다릴 수 있는 매치 로그 수. 가득 차면 게임이 끝난 방이 자리가 날 때까지 기다립니다.
+MATCH_LOG_QUEUE_SIZE = int(os.getenv("MATCH_LOG_QUEUE_SIZE", "16"))
 
 def ensure_directories():
     """필요한 디렉토리들을 생성합니다."""
@@ -24,26 +35,76 @@ def generate_short_alphanumeric_id(length=8):
     characters = string.ascii_letters + string.digits
     return ''.join(secrets.choice(characters) for _ in range(length))
 
+def get_match_log_path(player_info, extension):
+    """매치 로그를 저장할 고유한 파일 경로를 만듭니다."""
+    ensure_directories()
+    uuid = generate_short_alphanumeric_id()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"match_{timestamp}_{uuid}_{player_info[0]['username']}_VS_{player_info[1]['username']}{extension}"
+    return os.path.join(MATCH_LOGS_DIR, filename)
+
 def upload_match_to_local_storage(match_data):
     """매치 데이터를 로컬 파일 시스템에 저장합니다."""
     try:
-        ensure_directories()
-        
-        # 고유한 파일명 생성
-        uuid = generate_short_alphanumeric_id()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"match_{timestamp}_{uuid}_{match_data['player_info'][0]['username']}_VS_{match_data['player_info'][1]['username']}.json"
-        file_path = os.path.join(MATCH_LOGS_DIR, filename)
+        file_path = get_match_log_path(match_data['player_info'], LEGACY_MATCH_LOG_EXTENSION)
         
-        # 매치 데이터를 JSON 파일로 저장
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # 매치 데이터를 임시 파일에 쓴 뒤 이름을 바꿔서, 읽는 쪽에서 반쯤 쓰인 파일을 보지 않도록 합니다.
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
             json.dump(match_data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, file_path)
         
         logger.info(f"Match data saved to local storage: {file_path}")
+        index_match_log(file_path, match_data)
         
     except Exception as e:
         logger.error(f"Error saving match data to local storage: {e}")
 
+match_index = MatchIndex(MATCH_INDEX_PATH)
+
+def index_match_log(file_path, match_data):
+    """저장된 매치 로그를 인덱스에 추가합니다."""
+    try:
+        match_index.add_match(os.path.basename(file_path), {key: value for key, value in match_data.items() if key not in HISTORY_FIELDS})
+    except Exception as e:
+        logger.error(f"Error adding match log {file_path} to the index: {e}")
+
+class MatchLogWriter:
+    # Saves match logs and adds them to the index from a worker thread, so encoding and writing a
+    # whole game's events doesn't hold up the event loop. At most MATCH_LOG_QUEUE_SIZE wait at a time.
+    def __init__(self, queue_size : int = MATCH_LOG_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.worker = None
+
+    async def put(self, function, *args):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.write_queued())
+        await self.queue.put((function, args))
+
+    async def write(self, match_data):
+        await self.put(upload_match_to_blob_storage, match_data)
+
+    async def index(self, file_path, match_data):
+        # For logs that were already written, match_data doesn't need the events.
+        await self.put(index_match_log, file_path, match_data)
+
+    async def write_queued(self):
+        while True:
+            function, args = await self.queue.get()
+            try:
+                await asyncio.to_thread(function, *args)
+            finally:
+                self.queue.task_done()
+
+    async def flush(self):
+        # Waits for the queued logs to be saved, for shutdown.
+        await self.queue.join()
+        if self.worker:
+            self.worker.cancel()
+            self.worker = None
+
+match_log_writer = MatchLogWriter()
+
 def upload_game_package_local(game_zip_path):
     """게임 패키지를 로컬에 복사합니다."""
     try:
@@ -93,22 +154,18 @@ def download_match_logs_between_dates(start_date, end_date, download_path):
         if not os.path.exists(download_path):
             os.makedirs(download_path)
         
-        # 매치 로그 디렉토리의 모든 파일 검사
-        if not os.path.exists(MATCH_LOGS_DIR):
-            logger.warning(f"Match logs directory not found: {MATCH_LOGS_DIR}")
-            return
-        
-        for filename in os.listdir(MATCH_LOGS_DIR):
-            if filename.endswith('.json'):
-                file_path = os.path.join(MATCH_LOGS_DIR, filename)
-                file_modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                # 날짜 범위 확인
-                if start_date <= file_modified_time <= end_date:
-                    destination_path = os.path.join(download_path, filename)
-                    import shutil
-                    shutil.copy2(file_path, destination_path)
-                    logger.info(f"Downloaded match log: {filename}")
+        # 인덱스에서 날짜 범위의 매치 로그를 찾습니다. 인덱스에 없는 로그(인덱스 이전의 로그, 인덱스 추가에 실패한 로그)를 먼저 추가합니다.
+        import shutil
+        match_index.add_unindexed_logs(MATCH_LOGS_DIR)
+        for match in match_index.find_matches(start_date.timestamp(), end_date.timestamp()):
+            filename = match["match_id"]
+            file_path = os.path.join(MATCH_LOGS_DIR, filename)
+            if not os.path.exists(file_path):
+                logger.warning(f"Indexed match log not found: {file_path}")
+                continue
+            destination_path = os.path.join(download_path, filename)
+            shutil.copy2(file_path, destination_path)
+            logger.info(f"Downloaded match log: {filename}")
         
         logger.info("Match logs download complete.")
         
@@ -0,0 +1,302 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+from app.gameengine import GameEngine, EventType, PlayerEvent
+from app.serialization import encode_json
+from app.card_database import CardDatabase
+from app.aiplayer import AIPlayer, DefaultAIDeck
+from app.matchlog import HISTORY_FIELDS, MatchLogStream
+import logging
+logger = logging.getLogger(__name__)
+
+# Processes that run the room engines, 0 runs them in the server process.
+ENGINE_PROCESSES = int(os.getenv("ENGINE_PROCESSES", "0"))
+
+# How many catch up events an observer gets at a time.
+OBSERVER_CATCHUP_EVENTS = 50
+
+def serialize_game_event(event):
+    # Broadcast events share their encoded fields with the other recipients.
+    if isinstance(event, PlayerEvent):
+        return event.to_json()
+    return encode_json(event)
+
+class EngineStep:
+    # The encoded events from one engine step, for each player in the room and for the observers.
+    def __init__(self, player_event_jsons : Dict[str, List[str]], observer_event_jsons : List[str], game_over : bool):
+        self.player_event_jsons = player_event_jsons
+        self.observer_event_jsons = observer_event_jsons
+        self.game_over = game_over
+
+class RoomEngine:
+    # A room's engine and AI player. Runs in the server process or in an engine process, so
+    # everything that goes in or comes out is plain data and events are returned already encoded.
+    def __init__(self, card_db : CardDatabase, room_id : str, player_infos, game_type : str, seed = None, match_log_path : str = None):
+        self.room_id = room_id
+        self.player_ids = [player_info["player_id"] for player_info in player_infos]
+        self.ai_player = None
+        player_infos = list(player_infos)
+        if game_type == "ai":
+            logger.info(f"AI GAME: Creating AI player for game {room_id}")
+            self.ai_player = AIPlayer(player_id="aiplayer" + self.player_ids[0])
+            self.ai_player.set_deck(DefaultAIDeck)
+            player_infos.append(self.ai_player.get_player_game_info())
+            logger.info(f"AI GAME: AI player created with ID {self.ai_player.player_id}")
+
+        self.engine = GameEngine(
+            card_db=card_db,
+            player_infos=player_infos,
+            game_type=game_type
+        )
+        if seed is not None:
+            self.engine.seed = seed
+
+        # The match log is written as the game goes, up to the messages and events logged so far.
+        self.match_log = None
+        if match_log_path:
+            try:
+                self.match_log = MatchLogStream(match_log_path)
+            except Exception as e:
+                logger.error(f"Error creating match log {match_log_path}, it won't be saved: {e}")
+        self.logged_message_count = 0
+        self.logged_event_count = 0
+
+    def log_history(self):
+        if not self.match_log:
+            return
+        try:
+            self.match_log.append_game_messages(self.engine.all_game_messages[self.logged_message_count:])
+            self.match_log.append_events(self.engine.all_events[self.logged_event_count:])
+            self.logged_message_count = len(self.engine.all_game_messages)
+            self.logged_event_count = len(self.engine.all_events)
+        except Exception as e:
+            # The game goes on without a log.
+            logger.error(f"Error writing match log {self.match_log.file_path}, it won't be saved: {e}")
+            self.close()
+
+    def grab_step(self, with_observer_events : bool):
+        # Only the events for the players in the room are encoded, the AI gets them as they are.
+        self.log_history()
+        events = self.engine.grab_events()
+        player_event_jsons = {player_id: [] for player_id in self.player_ids}
+        for event in events:
+            event_jsons = player_event_jsons.get(event["event_player_id"])
+            if event_jsons is not None:
+                event_jsons.append(serialize_game_event(event))
+        observer_events = self.engine.grab_observer_events()
+        observer_event_jsons = [serialize_game_event(event) for event in observer_events] if with_observer_events else []
+        return events, EngineStep(player_event_jsons, observer_event_jsons, self.engine.is_game_over())
+
+    def begin_game(self, with_observer_events : bool, time_budget : float = None):
+        self.engine.begin_game()
+        if self.match_log:
+            try:
+                self.match_log.write_header(self.engine.get_match_log())
+            except Exception as e:
+                logger.error(f"Error writing match log {self.match_log.file_path}, it won't be saved: {e}")
+                self.close()
+        events, step = self.grab_step(with_observer_events)
+        steps = [step]
+        next_ai_action = None
+        if self.ai_player:
+            logger.info(f"AI GAME: Processing AI actions for game {self.room_id}")
+            # In case the AI has to mulligan first!
+            ai_performing_action, ai_action = self.ai_player.ai_process_events(events)
+            logger.info(f"AI GAME: AI action result - performing: {ai_performing_action}, action: {ai_action}")
+            if ai_performing_action:
+                ai_steps, next_ai_action = self.handle_game_message(self.ai_player.player_id, ai_action["action_type"], ai_action["action_data"], with_observer_events, time_budget)
+                steps += ai_steps
+        return steps, next_ai_action
+
+    def handle_game_message(self, player_id : str, action_type : str, action_data : dict, with_observer_events : bool, time_budget : float = None):
+        # Steps until the game waits on a person, the AI's actions are taken right away. With a time
+        # budget, stops once it is spent and also returns the AI's next action for the caller to
+        # send back in, otherwise that is None.
+        start = time.perf_counter()
+        steps = []
+        while not self.engine.is_game_over():
+            self.engine.handle_game_message(player_id, action_type, action_data)
+            events, step = self.grab_step(with_observer_events)
+            steps.append(step)
+            if not self.ai_player:
+                break
+            ai_performing_action, ai_action = self.ai_player.ai_process_events(events)
+            #logger.info("AI Action: %s %s" % (ai_performing_action, ai_action))
+            if not ai_performing_action or self.engine.is_game_over():
+                break
+            player_id = self.ai_player.player_id
+            action_type = ai_action["action_type"]
+            action_data = ai_action["action_data"]
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                return steps, {"player_id": player_id, "action_type": action_type, "action_data": action_data}
+        return steps, None
+
+    def handle_emote(self, player_id : str, emote_id : int, with_observer_events : bool):
+        # Everyone in the room gets all of the emote events.
+        self.engine.handle_emote(player_id, emote_id)
+        self.log_history()
+        event_jsons = [serialize_game_event(event) for event in self.engine.grab_events()]
+        observer_events = self.engine.grab_observer_events()
+        observer_event_jsons = [serialize_game_event(event) for event in observer_events] if with_observer_events else []
+        return EngineStep({player_id: event_jsons for player_id in self.player_ids}, observer_event_jsons, self.engine.is_game_over())
+
+    def get_observer_catchup_events(self, starting_event_index : int):
+        # Only encode the next batch of events.
+        next_events = [serialize_game_event(event) for event in self.engine.get_observer_catchup_events(starting_event_index, OBSERVER_CATCHUP_EVENTS)]
+
+        # If this is the end, send the catch up event.
+        if starting_event_index + OBSERVER_CATCHUP_EVENTS >= self.engine.get_observer_catchup_count():
+            next_events.append(encode_json({"event_type": EventType.EventType_ObserverCaughtUp}))
+        return next_events
+
+    def get_observer_snapshot_events(self):
+        # The start info and the latest snapshot, then catch up from the events after it. The snapshot
+        # has the next_event_index to ask for after that. Without a snapshot yet, catch up from the start.
+        snapshot = self.engine.observer_snapshot
+        if snapshot is None:
+            return self.get_observer_catchup_events(0)
+        snapshot_events = [encode_json(self.engine.get_observer_start_event()), encode_json(snapshot)]
+        return snapshot_events + self.get_observer_catchup_events(snapshot["next_event_index"])
+
+    def is_game_over(self):
+        return self.engine.is_game_over()
+
+    def get_match_log(self):
+        return self.engine.get_match_log()
+
+    def finish_match_log(self, match_fields : dict):
+        # Games that never got to a turn aren't kept. Returns the saved log's path and its fields
+        # without the events, messages and card map, for the index, or None.
+        self.log_history()
+        if not self.match_log:
+            return None
+        match_data = self.engine.get_match_log()
+        if match_data["turn_number"] < 0:
+            self.close()
+            return None
+        match_log = self.match_log
+        self.match_log = None
+        match_data = {**match_data, **match_fields}
+        try:
+            match_log.finish(match_data)
+            logger.info(f"Match log saved: {match_log.file_path}")
+        except Exception as e:
+            logger.error(f"Error saving match log {match_log.file_path}: {e}")
+            return None
+        return match_log.file_path, {key: value for key, value in match_data.items() if key not in HISTORY_FIELDS}
+
+    def close(self):
+        # Rooms that close before the game is over don't keep their log.
+        if self.match_log:
+            match_log = self.match_log
+            self.match_log = None
+            try:
+                match_log.discard()
+            except Exception as e:
+                logger.error(f"Error removing match log {match_log.file_path}: {e}")
+
+# The room engines of one engine process, by room id.
+process_card_db : CardDatabase = None
+process_room_engines : Dict[str, RoomEngine] = {}
+
+def init_engine_process():
+    global process_card_db
+    process_card_db = CardDatabase()
+
+def create_process_room_engine(room_id : str, player_infos, game_type : str, seed : int, match_log_path : str):
+    process_room_engines[room_id] = RoomEngine(process_card_db, room_id, player_infos, game_type, seed, match_log_path)
+
+def call_process_room_engine(room_id : str, method : str, args):
+    return getattr(process_room_engines[room_id], method)(*args)
+
+def remove_process_room_engine(room_id : str):
+    room_engine = process_room_engines.pop(room_id, None)
+    if room_engine:
+        room_engine.close()
+
+class EngineProcessLost(Exception):
+    # The engine process a room ran in died, its game is gone.
+    pass
+
+class EnginePool:
+    # Runs room engines in worker processes, so a long effect chain or AI turn only holds up its
+    # own room and not every connection on the server. Each process runs one call at a time and
+    # a room stays in the process it was created in, new rooms go to the one with the fewest.
+    def __init__(self, process_count : int = ENGINE_PROCESSES):
+        self.executors = [self.create_executor() for _ in range(process_count)]
+        self.room_counts = [0] * process_count
+        self.room_slots : Dict[str, int] = {}
+        self.room_match_log_paths : Dict[str, str] = {}
+
+    def create_executor(self):
+        # Spawned rather than forked, so they don't hold on to the server's sockets and they exit
+        # when the server does.
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=init_engine_process)
+
+    async def run(self, slot : int, function, *args):
+        executor = self.executors[slot]
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+        except BrokenProcessPool as e:
+            # The rooms in it are gone, new rooms get a new process.
+            if self.executors[slot] is executor:
+                logger.error(f"Engine process {slot} died, replacing it")
+                self.executors[slot] = self.create_executor()
+                self.drop_slot_rooms(slot)
+            raise EngineProcessLost(f"Engine process {slot} died") from e
+
+    def drop_slot_rooms(self, slot : int):
+        # Their calls fail from now on instead of reaching the new process, which doesn't have them.
+        room_ids = [room_id for room_id, room_slot in self.room_slots.items() if room_slot == slot]
+        for room_id in room_ids:
+            del self.room_slots[room_id]
+            # The process can't discard its unfinished match logs any more.
+            match_log_path = self.room_match_log_paths.pop(room_id, None)
+            if match_log_path and os.path.exists(match_log_path + ".tmp"):
+                try:
+                    os.remove(match_log_path + ".tmp")
+                except Exception as e:
+                    logger.error(f"Error removing match log {match_log_path}.tmp: {e}")
+        self.room_counts[slot] = 0
+        logger.error(f"Rooms lost with engine process {slot}: {room_ids}")
+
+    async def create_room_engine(self, room_id : str, player_infos, game_type : str, seed : int, match_log_path : str = None):
+        slot = self.room_counts.index(min(self.room_counts))
+        self.room_slots[room_id] = slot
+        self.room_counts[slot] += 1
+        if match_log_path:
+            self.room_match_log_paths[room_id] = match_log_path
+        await self.run(slot, create_process_room_engine, room_id, player_infos, game_type, seed, match_log_path)
+
+    async def call(self, room_id : str, method : str, *args):
+        slot = self.room_slots.get(room_id)
+        if slot is None:
+            raise EngineProcessLost(f"Room {room_id} has no engine process")
+        return await self.run(slot, call_process_room_engine, room_id, method, args)
+
+    def remove_room_engine(self, room_id : str):
+        self.room_match_log_paths.pop(room_id, None)
+        slot = self.room_slots.pop(room_id, None)
+        if slot is None:
+            return
+        self.room_counts[slot] -= 1
+        try:
+            self.executors[slot].submit(remove_process_room_engine, room_id)
+        except Exception as e:
+            logger.info(f"Could not remove room engine {room_id} from process {slot}: {e}")
+
+    def get_metrics(self):
+        return {
+            "processes": len(self.executors),
+            "rooms": sum(self.room_counts),
+            "rooms_per_process": list(self.room_counts),
+        }
+
+    def shutdown(self):
+        # Waits for the processes to exit, the server can be gone before exit handlers would run.
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,9 +1,12 @@
 from typing import List, Dict, Any
-from app.card_database import CardDatabase
+from app.card_database import CardDatabase, GameCard, ReadOnlyDict, ReadOnlyList, freeze_definition
+from app.serialization import encode_json, extend_json_object
 import random
+from collections import defaultdict
 from copy import deepcopy
 import traceback
 import time
+import os
 import logging
 logger = logging.getLogger(__name__)
 
@@ -11,6 +14,25 @@ UNKNOWN_CARD_ID = "HIDDEN"
 UNLIMITED_SIZE = 9999
 STARTING_HAND_SIZE = 7
 MAX_MEMBERS_ON_STAGE = 6
+# Events between the observer snapshots that late observers can start from.
+OBSERVER_SNAPSHOT_EVENTS = 200
+
+# Check the card zone index against the zone lists on every lookup (slow, for debugging).
+VERIFY_CARD_INDEX = os.getenv("VERIFY_CARD_INDEX", "false").lower() == "true"
+
+# Rebuild the main step actions from scratch and compare with the incremental result (slow, for debugging).
+VERIFY_MAINSTEP_ACTIONS = os.getenv("VERIFY_MAINSTEP_ACTIONS", "false").lower() == "true"
+
+# Zones searched by PlayerState.find_card, in search order.
+SEARCH_ZONES = ["hand", "archive", "backstage", "center", "collab", "deck", "cheer_deck", "holopower"]
+STAGE_ZONES = ["center", "collab", "backstage"]
+ATTACHMENT_ZONES = ["attached_support", "attached_cheer", "stacked_cards"]
+# Per-game card fields that track what happened to a card during the game.
+# Derived stats (hp, cheer counts) don't read them, so setting them keeps the card version.
+CARD_STATE_FIELDS = ["damage", "resting", "rest_extra_turn", "played_this_turn", "bloomed_this_turn", "used_art_this_turn",
+    "zone_when_downed", "zone_when_returned_to_hand"]
+# Fields broadcast_event adds for each recipient of an event.
+RECIPIENT_EVENT_FIELDS = ["event_player_id", "your_clock_used", "opponent_clock_used"]
 
 class GamePhase:
     Initializing = "Initializing"
@@ -209,6 +231,7 @@ class EventType:
     EventType_MulliganDecision = "mulligan_decision"
     EventType_MulliganReveal = "mulligan_reveal"
     EventType_ObserverCaughtUp = "observer_caught_up"
+    EventType_ObserverSnapshot = "observer_snapshot"
     EventType_OshiSkillActivation = "oshi_skill_activation"
     EventType_PerformanceStepStart = "performance_step_start"
     EventType_PerformArt = "perform_art"
@@ -390,17 +413,306 @@ class GameAction:
     ResignFields = {
     }
 
+class ZoneList(list):
+    # A list of cards that keeps a CardZoneIndex up to date as cards are added and removed.
+    # Attachment zones (attached_cheer, etc.) also know the card that holds them.
+    zone_index = None
+    zone_name = ""
+    holder = None
+
+    def __init__(self, cards=(), zone_index=None, zone_name="", holder=None):
+        super().__init__(cards)
+        self.zone_name = zone_name
+        self.holder = holder
+        self.zone_index = zone_index
+        if zone_index is not None:
+            zone_index.add_cards(self, self)
+
+    def append(self, card):
+        list.append(self, card)
+        if self.zone_index is not None:
+            self.zone_index.add(card, self)
+
+    def insert(self, index, card):
+        list.insert(self, index, card)
+        if self.zone_index is not None:
+            self.zone_index.add(card, self)
+
+    def extend(self, cards):
+        cards = list(cards)
+        list.extend(self, cards)
+        if self.zone_index is not None:
+            self.zone_index.add_cards(cards, self)
+
+    def __iadd__(self, cards):
+        self.extend(cards)
+        return self
+
+    def __imul__(self, count):
+        cards = list(self) * count
+        self.clear()
+        self.extend(cards)
+        return self
+
+    def remove(self, card):
+        # Look for the same object first, cards are unique so this is the usual case.
+        for index, zone_card in enumerate(self):
+            if zone_card is card:
+                break
+        else:
+            index = self.index(card)
+        self.pop(index)
+
+    def pop(self, index=-1):
+        card = list.pop(self, index)
+        if self.zone_index is not None:
+            self.zone_index.discard(card, self)
+        return card
+
+    def clear(self):
+        if self.zone_index is not None:
+            self.zone_index.discard_cards(self, self)
+        list.clear(self)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            value = list(value)
+            removed = list.__getitem__(self, key)
+            added = value
+        else:
+            removed = [list.__getitem__(self, key)]
+            added = [value]
+        list.__setitem__(self, key, value)
+        if self.zone_index is not None:
+            self.zone_index.discard_cards(removed, self)
+            self.zone_index.add_cards(added, self)
+
+    def __delitem__(self, key):
+        removed = list.__getitem__(self, key)
+        if not isinstance(key, slice):
+            removed = [removed]
+        list.__delitem__(self, key)
+        if self.zone_index is not None:
+            self.zone_index.discard_cards(removed, self)
+
+    def reorder(self, cards):
+        # Replace the order of the cards without touching the index (same cards, new order).
+        list.__setitem__(self, slice(None), cards)
+        if self.zone_index is not None:
+            self.zone_index.touch(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        copied = []
+        memo[id(self)] = copied
+        copied.extend(deepcopy(card, memo) for card in self)
+        return copied
+
+class CardZoneIndex:
+    # Maps game_card_id to every (card, zone) the card is currently in.
+    # The ZoneLists keep this up to date, so finding a card doesn't have to scan the zones.
+    def __init__(self):
+        self.locations : Dict[str, List[tuple]] = {}
+        # Change counters, used to tell what changed since an earlier look at the zones.
+        # A zone counts as changed when cards are added, removed or reordered,
+        # or when a field of one of its cards is set to a new value.
+        # Attachment zones of all holomems share a counter per zone name.
+        self.zone_versions : Dict[str, int] = defaultdict(int)
+        # Per card (by game_card_id), changes when the card moves, a field other than CARD_STATE_FIELDS
+        # is set to a new value, or something is attached to or removed from it.
+        self.card_versions : Dict[str, int] = defaultdict(int)
+
+    def touch(self, zone, card=None):
+        self.zone_versions[zone.zone_name] += 1
+        if card is not None:
+            self.card_versions[card["game_card_id"]] += 1
+        if zone.holder is not None:
+            self.card_versions[zone.holder["game_card_id"]] += 1
+
+    def add(self, card, zone):
+        self.locations.setdefault(card["game_card_id"], []).append((card, zone))
+        self.touch(zone, card)
+
+    def add_cards(self, cards, zone):
+        for card in cards:
+            self.add(card, zone)
+
+    def discard(self, card, zone):
+        card_id = card["game_card_id"]
+        entries = self.locations.get(card_id)
+        if not entries:
+            return
+        self.touch(zone, card)
+        for i, (indexed_card, indexed_zone) in enumerate(entries):
+            if indexed_card is card and indexed_zone is zone:
+                del entries[i]
+                break
+        if not entries:
+            del self.locations[card_id]
+
+    def discard_cards(self, cards, zone):
+        for card in list(cards):
+            self.discard(card, zone)
+
+    def replace_zone(self, previous, cards, zone_name, holder=None):
+        # Called when a zone is assigned a new list.
+        # Assigning the same list back (e.g. after +=) keeps it as is.
+        if cards is previous and isinstance(cards, ZoneList):
+            return cards
+        if isinstance(previous, ZoneList) and previous.zone_index is self:
+            self.discard_cards(previous, previous)
+            previous.zone_index = None
+        return ZoneList(cards, self, zone_name, holder)
+
+    def bind_card(self, card):
+        # Index the attachment zones of a card from now on, including when they are reassigned.
+        card.zone_index = self
+        for zone_name in ATTACHMENT_ZONES:
+            if dict.__contains__(card, zone_name):
+                dict.__setitem__(card, zone_name, ZoneList(dict.__getitem__(card, zone_name), self, zone_name, card))
+
+    def on_card_field_set(self, card, key, value):
+        # Hook for GameCard, attachment lists are zones on the holding card.
+        if key in ATTACHMENT_ZONES:
+            return self.replace_zone(dict.get(card, key), value, key, card)
+        if key not in card or card[key] != value:
+            if key not in CARD_STATE_FIELDS:
+                self.card_versions[card["game_card_id"]] += 1
+            for _, zone in self.locations.get(card["game_card_id"], []):
+                self.touch(zone)
+        return value
+
+    def find(self, card_id, zone_names):
+        # Returns (card, zone) for the first of zone_names that holds the card.
+        # Only zones of the player itself, not attachments.
+        best = None
+        best_rank = len(zone_names)
+        for card, zone in self.locations.get(card_id, []):
+            if zone.holder is None and zone.zone_name in zone_names:
+                rank = zone_names.index(zone.zone_name)
+                if rank < best_rank:
+                    best = (card, zone)
+                    best_rank = rank
+        return best
+
+    def find_attached(self, card_id, zone_names):
+        # Returns (card, zone) for an attachment of a holomem that is on stage.
+        for card, zone in self.locations.get(card_id, []):
+            if zone.holder is not None and zone.zone_name in zone_names and self.is_on_stage(zone.holder):
+                return card, zone
+        return None
+
+    def is_on_stage(self, card):
+        return self.find(card["game_card_id"], STAGE_ZONES) is not None
+
+    def verify(self, zones, holders):
+        # Debug check: compare the index with a full scan of the zones and the holders' attachments.
+        expected = {}
+        for zone in zones:
+            if not isinstance(zone, ZoneList) or zone.zone_index is not self:
+                raise Exception(f"Card index: zone {getattr(zone, 'zone_name', '?')} is not indexed.")
+            for card in zone:
+                expected.setdefault(card["game_card_id"], []).append((id(card), id(zone)))
+        for holder in holders:
+            for zone_name in ATTACHMENT_ZONES:
+                zone = dict.get(holder, zone_name)
+                if zone is None:
+                    continue
+                if not isinstance(zone, ZoneList) or zone.zone_index is not self:
+                    raise Exception(f"Card index: {zone_name} of {holder['game_card_id']} is not indexed.")
+                for card in zone:
+                    expected.setdefault(card["game_card_id"], []).append((id(card), id(zone)))
+        actual = {}
+        for card_id, entries in self.locations.items():
+            actual[card_id] = [(id(card), id(zone)) for card, zone in entries]
+        for card_id in set(expected) | set(actual):
+            if sorted(expected.get(card_id, [])) != sorted(actual.get(card_id, [])):
+                raise Exception(f"Card index out of sync for {card_id}")
+
+class CardZone:
+    # Descriptor for a zone attribute.
+    # Assigning a list stores it as a ZoneList on the owner's card_index.
+    # There is no __get__, so reading the zone is a plain instance attribute lookup.
+    def __init__(self, zone_name=""):
+        self.zone_name = zone_name
+
+    def __set_name__(self, owner, name):
+        self.attribute = name
+        if not self.zone_name:
+            self.zone_name = name
+
+    def __set__(self, obj, cards):
+        previous = obj.__dict__.get(self.attribute)
+        obj.__dict__[self.attribute] = obj.card_index.replace_zone(previous, cards, self.zone_name)
+
+class EffectTimingRegistry:
+    # The effects that can trigger for a player, grouped by timing.
+    # Each source is regrouped only when it changes: gift effects when the stage zones change,
+    # oshi effects when the oshi card is replaced and turn effects when they are added or cleared.
+    # The grouped effects are the originals, callers copy them before adding ids.
+    def __init__(self, player):
+        self.player = player
+        self.stage_versions = None
+        self.gift_effects : Dict[str, List[tuple]] = {}
+        self.oshi_card = None
+        self.oshi_effects : Dict[str, List[dict]] = {}
+        self.turn_effects_list = None
+        self.turn_effects_count = 0
+        self.turn_effects : Dict[str, List[dict]] = {}
+
+    def get_gift_effects(self, timing):
+        # Returns (holomem, effects) for each holomem on stage with gift effects at this timing, in stage order.
+        versions = self.player.card_index.zone_versions
+        stage_versions = (versions["center"], versions["collab"], versions["backstage"])
+        if stage_versions != self.stage_versions:
+            self.stage_versions = stage_versions
+            self.gift_effects = {}
+            for holomem in self.player.get_holomem_on_stage():
+                if "gift_effects" in holomem:
+                    for effect_timing, effects in group_effects_by_timing(holomem["gift_effects"]).items():
+                        self.gift_effects.setdefault(effect_timing, []).append((holomem, effects))
+        return self.gift_effects.get(timing, [])
+
+    def get_oshi_effects(self, timing):
+        if self.player.oshi_card is not self.oshi_card:
+            self.oshi_card = self.player.oshi_card
+            self.oshi_effects = group_effects_by_timing(self.oshi_card.get("effects", []))
+        return self.oshi_effects.get(timing, [])
+
+    def get_turn_effects(self, timing):
+        # Turn effects are only appended or cleared by assigning a new list.
+        turn_effects = self.player.turn_effects
+        if turn_effects is not self.turn_effects_list or len(turn_effects) != self.turn_effects_count:
+            self.turn_effects_list = turn_effects
+            self.turn_effects_count = len(turn_effects)
+            self.turn_effects = group_effects_by_timing(turn_effects)
+        return self.turn_effects.get(timing, [])
+
 class EffectResolutionState:
     def __init__(self, effects, continuation, cards_to_cleanup = [], simultaneous_choice = False):
-        self.effects_to_resolve = deepcopy(effects)
+        self.effects_to_resolve = copy_effects(effects)
         self.effect_resolution_continuation = continuation
         self.cards_to_cleanup = cards_to_cleanup
         self.simultaneous_choice = simultaneous_choice
 
         self.simultaneous_choice_index = -1
 class PlayerState:
+    life = CardZone()
+    hand = CardZone()
+    archive = CardZone()
+    backstage = CardZone()
+    center = CardZone()
+    collab = CardZone()
+    deck = CardZone()
+    cheer_deck = CardZone()
+    holopower = CardZone()
+
     def __init__(self, card_db:CardDatabase, player_info:Dict[str, Any], engine: 'GameEngine'):
         self.engine = engine
+        self.card_index = CardZoneIndex()
+        self.effect_registry = EffectTimingRegistry(self)
         self.player_id = player_info["player_id"]
         self.username = player_info["username"]
 
@@ -434,6 +746,10 @@ class PlayerState:
         self.performance_attacked_this_turn = False
         self.last_revealed_cards = []
         self.last_die_roll_results = []
+        # Main step actions from the last decision, per category, with what they were built from.
+        self.main_step_actions_cache = {}
+        # Derived card stats by (game_card_id, stat), with what they were computed from.
+        self.card_stats_cache = {}
 
         # Energy system for Slay the Spire style
         self.energy = 3
@@ -443,7 +759,7 @@ class PlayerState:
 
         # Set up Oshi.
         self.oshi_id = player_info["oshi_id"]
-        self.oshi_card = card_db.get_card_by_id(self.oshi_id)
+        self.oshi_card = card_db.copy_card_by_id(self.oshi_id)
         self.oshi_card["game_card_id"] = self.player_id + "_oshi"
 
         self.deck_list = player_info["deck"]
@@ -453,7 +769,7 @@ class PlayerState:
         for card_id, count in self.deck_list.items():
             card = card_db.get_card_by_id(card_id)
             for _ in range(int(count)):
-                generated_card = deepcopy(card)
+                generated_card = GameCard(card)
                 generated_card["owner_id"] = self.player_id
                 generated_card["game_card_id"] = self.player_id + "_" + str(card_number)
                 generated_card["played_this_turn"] = False
@@ -468,6 +784,7 @@ class PlayerState:
                 generated_card["resting"] = False
                 generated_card["rest_extra_turn"] = False
                 generated_card["used_art_this_turn"] = False
+                self.card_index.bind_card(generated_card)
                 card_number += 1
                 self.deck.append(generated_card)
 
@@ -478,7 +795,7 @@ class PlayerState:
         for card_id, count in player_info["cheer_deck"].items():
             card = card_db.get_card_by_id(card_id)
             for _ in range(int(count)):
-                generated_card = deepcopy(card)
+                generated_card = GameCard(card)
                 generated_card["owner_id"] = self.player_id
                 generated_card["game_card_id"] = self.player_id + "_" + str(card_number)
                 card_number += 1
@@ -593,7 +910,35 @@ class PlayerState:
                     return True
         return False
 
-    def is_art_requirement_met(self, card, art):
+    def get_card_stats_key(self, card, timing):
+        # What a derived stat of the card is computed from: the card itself (moves, field changes, attachments)
+        # and this player's effects at the timing. None if the card isn't tracked by a card index.
+        zone_index = card.zone_index if isinstance(card, GameCard) else None
+        if zone_index is None:
+            return None
+        registry = self.effect_registry
+        return (zone_index.card_versions[card["game_card_id"]], registry.get_gift_effects(timing),
+            registry.get_oshi_effects(timing), registry.get_turn_effects(timing))
+
+    def get_cached_card_stat(self, card, stat_name, stats_key):
+        if stats_key is None:
+            return None
+        cached = self.card_stats_cache.get((card["game_card_id"], stat_name))
+        if cached is not None and cached[0] == stats_key:
+            return cached[1]
+        return None
+
+    def cache_card_stat(self, card, stat_name, stats_key, value):
+        if stats_key is not None:
+            self.card_stats_cache[(card["game_card_id"], stat_name)] = (stats_key, value)
+
+    def get_cheer_color_counts(self, card):
+        # Returns the (white, green, blue, red, purple, yellow) cheer counts of the card, including bonus cheer.
+        stats_key = self.get_card_stats_key(card, "check_cheer")
+        cheer_counts = self.get_cached_card_stat(card, "cheer_counts", stats_key)
+        if cheer_counts is not None:
+            return cheer_counts
+
         attached_cheer_cards = [attached_card for attached_card in card["attached_cheer"] if is_card_cheer(attached_card)]
 
         white_cheer = 0
@@ -603,8 +948,12 @@ class PlayerState:
         purple_cheer = 0
         yellow_cheer = 0
 
+        # Bonus cheer with conditions can change with anything in the game, so the result isn't cached.
+        cacheable = True
         check_cheer_effects = self.get_effects_at_timing("check_cheer", card, "")
         for effect in check_cheer_effects:
+            if effect.get("conditions"):
+                cacheable = False
             if check_cheer_effects and self.engine.are_conditions_met(self, effect["source_card_id"], effect.get("conditions", [])):
                 match effect["effect_type"]:
                     case "bonus_cheer":
@@ -637,6 +986,14 @@ class PlayerState:
             elif "yellow" in attached_cheer_card["colors"]:
                 yellow_cheer += 1
 
+        cheer_counts = (white_cheer, green_cheer, blue_cheer, red_cheer, purple_cheer, yellow_cheer)
+        if cacheable:
+            self.cache_card_stat(card, "cheer_counts", stats_key, cheer_counts)
+        return cheer_counts
+
+    def is_art_requirement_met(self, card, art):
+        white_cheer, green_cheer, blue_cheer, red_cheer, purple_cheer, yellow_cheer = self.get_cheer_color_counts(card)
+
         cheer_costs = art["costs"]
         any_cost = 0
         # First go through all the costs and subtract any from the color counts.
@@ -757,15 +1114,27 @@ class PlayerState:
         return len(accepted_bloom_levels) > 0
 
     def get_card_hp(self, card):
+        stats_key = self.get_card_stats_key(card, "check_hp")
+        hp = self.get_cached_card_stat(card, "hp", stats_key)
+        if hp is not None:
+            return hp
+
         base_hp = card["hp"]
         effects = self.get_effects_at_timing("check_hp", card, "")
         bonus_hp = 0
+        # Same as cheer counts, conditional bonuses are not cached.
+        cacheable = True
         for effect in effects:
+            if effect.get("conditions"):
+                cacheable = False
             if self.engine.are_conditions_met(self, effect["source_card_id"], effect.get("conditions", [])):
                 match effect["effect_type"]:
                     case EffectType.EffectType_BonusHp:
                         bonus_hp += effect["amount"]
-        return base_hp + bonus_hp
+        hp = base_hp + bonus_hp
+        if cacheable:
+            self.cache_card_stat(card, "hp", stats_key, hp)
+        return hp
 
     def get_holomem_zone(self, card):
         if card in self.archive:
@@ -811,22 +1180,22 @@ class PlayerState:
         # For now, prioritize Gift effects before oshi effects
         # due to zeta's reduce damage gift that can fail which wants to go first.
         # If needed, on_take_damage will have to become a simultaneous decision resolution.
-        for holomem in self.get_holomem_on_stage():
-            if "gift_effects" in holomem:
-                gift_effects = filter_effects_at_timing(holomem["gift_effects"], timing)
-                add_ids_to_effects(gift_effects, self.player_id, holomem["game_card_id"])
-                effects.extend(gift_effects)
-
-        for oshi_effect in self.oshi_card.get("effects", []):
-            if oshi_effect["timing"] == timing:
-                if "timing_source_requirement" in oshi_effect and oshi_effect["timing_source_requirement"] != timing_source_requirement:
-                    continue
-                add_ids_to_effects([oshi_effect], self.player_id, self.oshi_card["game_card_id"])
-                effects.append(oshi_effect)
+        for holomem, gift_effects in self.effect_registry.get_gift_effects(timing):
+            gift_effects = copy_effects(gift_effects)
+            add_ids_to_effects(gift_effects, self.player_id, holomem["game_card_id"])
+            effects.extend(gift_effects)
+
+        for oshi_effect in self.effect_registry.get_oshi_effects(timing):
+            if "timing_source_requirement" in oshi_effect and oshi_effect["timing_source_requirement"] != timing_source_requirement:
+                continue
+            add_ids_to_effects([oshi_effect], self.player_id, self.oshi_card["game_card_id"])
+            effects.append(oshi_effect)
 
-        turn_effects = filter_effects_at_timing(self.turn_effects, timing)
-        add_ids_to_effects(turn_effects, self.player_id, "")
-        effects.extend(turn_effects)
+        turn_effects = self.effect_registry.get_turn_effects(timing)
+        if turn_effects:
+            turn_effects = copy_effects(turn_effects)
+            add_ids_to_effects(turn_effects, self.player_id, "")
+            effects.extend(turn_effects)
 
         if card and card["card_type"] not in ["support", "oshi"]:
             attachments_to_check = card["attached_support"]
@@ -838,6 +1207,7 @@ class PlayerState:
                     if attached_effect["timing"] == timing:
                         if "timing_source_requirement" in attached_effect and attached_effect["timing_source_requirement"] != timing_source_requirement:
                             continue
+                        attached_effect = copy_effect(attached_effect)
                         add_ids_to_effects([attached_effect], self.player_id, attached_card["game_card_id"])
                         effects.append(attached_effect)
         return effects
@@ -950,15 +1320,16 @@ class PlayerState:
             case _: return "unknown"
 
     def find_card(self, card_id, include_stacked_cards = False):
-        zones = [self.hand, self.archive, self.backstage, self.center, self.collab, self.deck, self.cheer_deck, self.holopower]
-        for zone in zones:
-            for card in zone:
-                if card["game_card_id"] == card_id:
-                    zone_name = self.get_zone_name(zone)
-                    return card, zone, zone_name
-        for card in self.engine.floating_cards:
-            if card["game_card_id"] == card_id:
-                return card, self.engine.floating_cards, "floating"
+        if VERIFY_CARD_INDEX:
+            self.verify_card_index()
+        location = self.card_index.find(card_id, SEARCH_ZONES)
+        if location:
+            card, zone = location
+            return card, zone, zone.zone_name
+        location = self.engine.card_index.find(card_id, ["floating"])
+        if location:
+            card, zone = location
+            return card, zone, "floating"
         if self.oshi_card["game_card_id"] == card_id:
             return self.oshi_card, None, "oshi"
 
@@ -971,12 +1342,33 @@ class PlayerState:
 
     def find_attachment(self, attachment_id):
         # Assume this is an attachment, find it on the holomem.
-        for holomem in self.get_holomem_on_stage():
-            for attachment in holomem["attached_support"]:
-                if attachment["game_card_id"] == attachment_id:
-                    return attachment
+        location = self.card_index.find_attached(attachment_id, ["attached_support"])
+        if location:
+            return location[0]
         return None
 
+    def find_attached(self, attached_id, zone_names = ATTACHMENT_ZONES):
+        # Returns (card, zone) for a card attached to or stacked on a holomem on stage.
+        if VERIFY_CARD_INDEX:
+            self.verify_card_index()
+        location = self.card_index.find_attached(attached_id, zone_names)
+        if location:
+            return location
+        return None, None
+
+    def verify_card_index(self):
+        zones = [self.life, self.hand, self.archive, self.backstage, self.center, self.collab, self.deck, self.cheer_deck, self.holopower]
+        holders = {}
+        for card_id, entries in self.card_index.locations.items():
+            for _, zone in entries:
+                if zone.holder is not None:
+                    holders[id(zone.holder)] = zone.holder
+        for zone in zones:
+            for card in zone:
+                if isinstance(card, GameCard) and card.zone_index is self.card_index:
+                    holders[id(card)] = card
+        self.card_index.verify(zones, holders.values())
+
     def find_and_remove_card(self, card_id):
         card, zone, zone_name = self.find_card(card_id)
         if card and zone:
@@ -1139,9 +1531,12 @@ class PlayerState:
 
         # For any ongoing turn effects, make sure to point them at the new card.
         for effect in self.turn_effects:
-            for condition in effect.get("conditions", []):
-                if condition.get("required_id", "") == target_card_id:
-                    condition["required_id"] = bloom_card_id
+            conditions = effect.get("conditions", [])
+            if any(condition.get("required_id", "") == target_card_id for condition in conditions):
+                effect["conditions"] = [
+                    compile_condition({**condition, "required_id": bloom_card_id}) if condition.get("required_id", "") == target_card_id else condition
+                    for condition in conditions
+                ]
 
         bloom_event = {
             "event_type": EventType.EventType_Bloom,
@@ -1171,7 +1566,7 @@ class PlayerState:
         all_bloom_effects.extend(on_bloom_extra_effects)
         all_bloom_effects.extend(on_bloom_level_up_effects)
         if "bloom_effects" in bloom_card:
-            effects = deepcopy(bloom_card["bloom_effects"])
+            effects = copy_effects(bloom_card["bloom_effects"])
             add_ids_to_effects(effects, self.player_id, bloom_card_id)
             all_bloom_effects.extend(effects)
         if len(all_bloom_effects) > 0:
@@ -1213,7 +1608,7 @@ class PlayerState:
         on_collab_extra_effects = self.get_effects_at_timing("on_collab", collab_card, "")
 
         # Handle collab effects.
-        collab_effects = deepcopy(collab_card["collab_effects"]) if "collab_effects" in collab_card else []
+        collab_effects = copy_effects(collab_card["collab_effects"]) if "collab_effects" in collab_card else []
         add_ids_to_effects(collab_effects, self.player_id, collab_card_id)
 
         # Handle all collab effects
@@ -1247,61 +1642,35 @@ class PlayerState:
 
     def get_oshi_action_effects(self, skill_id):
         action = next(action for action in self.oshi_card["actions"] if action["skill_id"] == skill_id)
-        return deepcopy(action["effects"])
+        return copy_effects(action["effects"])
 
     def get_special_action_effects(self, card_id: str, effect_id: str):
         card, _, _ = self.find_card(card_id, include_stacked_cards=True)
         action = next(action for action in card["special_actions"] if action["effect_id"] == effect_id)
-        return deepcopy(action["effects"])
+        return copy_effects(action["effects"])
     def find_and_remove_attached(self, attached_id):
         previous_holder_id = None
-        found_card = None
-        for card in self.get_holomem_on_stage():
-            if attached_id in ids_from_cards(card["attached_cheer"]):
-                # Remove the cheer.
-                found_card = next(card for card in card["attached_cheer"] if card["game_card_id"] == attached_id)
-                previous_holder_id = card["game_card_id"]
-                card["attached_cheer"].remove(found_card)
-                break
-            if attached_id in ids_from_cards(card["attached_support"]):
-                # Remove the support.
-                found_card = next(card for card in card["attached_support"] if card["game_card_id"] == attached_id)
-                previous_holder_id = card["game_card_id"]
-                card["attached_support"].remove(found_card)
-                break
-            if attached_id in ids_from_cards(card["stacked_cards"]):
-                # Remove the stacked card.
-                found_card = next(card for card in card["stacked_cards"] if card["game_card_id"] == attached_id)
-                previous_holder_id = card["game_card_id"]
-                card["stacked_cards"].remove(found_card)
-                break
-        if not previous_holder_id:
-            # Check the life deck.
-            if attached_id in ids_from_cards(self.life):
-                found_card = next(card for card in self.life if card["game_card_id"] == attached_id)
-                self.life.remove(found_card)
-                previous_holder_id = "life"
-            # And the archive.
-            elif attached_id in ids_from_cards(self.archive):
-                found_card = next(card for card in self.archive if card["game_card_id"] == attached_id)
-                self.archive.remove(found_card)
-                previous_holder_id = "archive"
-            # And the cheer deck.
-            elif attached_id in ids_from_cards(self.cheer_deck):
-                found_card = next(card for card in self.cheer_deck if card["game_card_id"] == attached_id)
-                self.cheer_deck.remove(found_card)
-                previous_holder_id = "cheer_deck"
+        found_card, zone = self.find_attached(attached_id)
+        if found_card:
+            # Remove the cheer, support or stacked card.
+            previous_holder_id = zone.holder["game_card_id"]
+            zone.remove(found_card)
+        else:
+            # Check the life deck, the archive and the cheer deck.
+            location = self.card_index.find(attached_id, ["life", "archive", "cheer_deck"])
+            if location:
+                found_card, zone = location
+                zone.remove(found_card)
+                previous_holder_id = zone.zone_name
         return found_card, previous_holder_id
 
     def find_and_remove_support(self, support_id):
         previous_holder_id = None
-        for card in self.get_holomem_on_stage():
-            if support_id in ids_from_cards(card["attached_support"]):
-                # Remove the support card.
-                support_card = next(card for card in card["attached_support"] if card["game_card_id"] == support_id)
-                previous_holder_id = card["game_card_id"]
-                card["attached_support"].remove(support_card)
-                break
+        support_card, zone = self.find_attached(support_id, ["attached_support"])
+        if support_card:
+            # Remove the support card.
+            previous_holder_id = zone.holder["game_card_id"]
+            zone.remove(support_card)
         return support_card, previous_holder_id
 
     def move_cheer_between_holomems(self, placements):
@@ -1442,14 +1811,36 @@ def ids_from_cards(cards):
 
 def replace_field_in_conditions(effect, field_id, replacement_value):
     if "conditions" in effect:
-        conditions = effect["conditions"]
-        for condition in conditions:
-            if field_id in condition:
-                condition[field_id] = replacement_value
+        # The conditions list and compiled conditions may be shared with the definition, so build new ones.
+        effect["conditions"] = [
+            compile_condition({**condition, field_id: replacement_value}) if field_id in condition else condition
+            for condition in effect["conditions"]
+        ]
 
 def is_card_resting(card):
     return "resting" in card and card["resting"]
 
+def copy_effect(effect):
+    # Resolving an effect writes ids and amounts into it, so it works on a copy.
+    # Card definitions are read-only and shared, only the top level of those is copied.
+    if isinstance(effect, ReadOnlyDict):
+        return dict(effect)
+    return copy_effect_value(effect)
+
+def copy_effect_value(value):
+    # Dicts and lists built at runtime are copied all the way down, read-only definition data is kept as is.
+    value_type = type(value)
+    if value_type is dict:
+        return {key: copy_effect_value(item) for key, item in value.items()}
+    if value_type is list:
+        return [copy_effect_value(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, ReadOnlyDict, ReadOnlyList)):
+        return value
+    return deepcopy(value)
+
+def copy_effects(effects):
+    return [copy_effect(effect) for effect in effects]
+
 def add_ids_to_effects(effects, player_id, card_id):
     for effect in effects:
         effect["player_id"] = player_id
@@ -1499,9 +1890,661 @@ def is_card_holomem(card):
     return card["card_type"] in ["holomem_debut", "holomem_bloom", "holomem_spot"]
 
 def filter_effects_at_timing(effects, timing):
-    return deepcopy([effect for effect in effects if effect["timing"] == timing])
+    return copy_effects([effect for effect in effects if effect["timing"] == timing])
+
+def group_effects_by_timing(effects):
+    effects_by_timing = {}
+    for effect in effects:
+        effects_by_timing.setdefault(effect["timing"], []).append(effect)
+    return effects_by_timing
+
+class CompiledCondition(ReadOnlyDict):
+    # A condition with its evaluator built once by compile_condition.
+    # It is read-only, so copies of an effect can share it instead of copying it.
+    __slots__ = ("evaluate",)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (compile_condition, (dict(self),))
+
+# Condition name -> function that takes the condition and returns its evaluator.
+# Evaluators are called as evaluate(engine, effect_player, source_card_id).
+CONDITION_COMPILERS = {}
+
+def condition_compiler(condition_name):
+    def register(compile_function):
+        CONDITION_COMPILERS[condition_name] = compile_function
+        return compile_function
+    return register
+
+def compile_condition(condition):
+    if isinstance(condition, CompiledCondition):
+        return condition
+    condition_name = condition["condition"]
+    if condition_name not in CONDITION_COMPILERS:
+        raise NotImplementedError(f"Unimplemented condition: {condition_name}")
+    compiled = CompiledCondition((key, freeze_definition(value)) for key, value in condition.items())
+    compiled.evaluate = CONDITION_COMPILERS[condition_name](compiled)
+    return compiled
+
+@condition_compiler(Condition.Condition_AnyTagHolomemHasCheer)
+def compile_any_tag_holomem_has_cheer(condition):
+    valid_tags = set(condition["condition_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        for card in effect_player.get_holomem_on_stage():
+            if len(card["attached_cheer"]) > 0 and any(tag in valid_tags for tag in card["tags"]):
+                return True
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_AttachedTo)
+def compile_attached_to(condition):
+    required_member_name = condition["required_member_name"]
+    required_bloom_levels = condition.get("required_bloom_levels", [])
+    def evaluate(engine, effect_player, source_card_id):
+        # Determine if source_card_id is attached to a holomem with the required name.
+        source_card = engine.find_card(source_card_id)
+        owner_player = engine.get_player(source_card["owner_id"])
+        holomems = owner_player.get_holomem_on_stage()
+        for holomem in holomems:
+            if source_card_id in ids_from_cards(holomem["attached_support"]):
+                if required_member_name in holomem["card_names"]:
+                    if not required_bloom_levels or holomem.get("bloom_level", -1) in required_bloom_levels:
+                        return True
+        # Check if there is an after damage state and if this the target card had this attached.
+        after_damage_state = engine.after_damage_state
+        if after_damage_state and source_card_id in ids_from_cards(after_damage_state.target_card["attached_when_downed"]):
+            if required_member_name in after_damage_state.target_card["card_names"]:
+                if not required_bloom_levels or after_damage_state.target_card.get("bloom_level", -1) in required_bloom_levels:
+                    return True
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_AttachedToHasTags)
+def compile_attached_to_has_tags(condition):
+    inverse = condition.get("inverse", False) # XOR the result to get the inverse
+    required_tags = set(condition["required_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        source_card = engine.find_card(source_card_id)
+        owner_player = engine.get_player(source_card["owner_id"])
+        holomems = owner_player.get_holomem_on_stage()
+        for holomem in holomems:
+            if source_card_id in ids_from_cards(holomem["attached_support"]):
+                return (len(set(holomem["tags"]) & required_tags) > 0) ^ inverse
+        return False ^ inverse
+    return evaluate
+
+@condition_compiler(Condition.Condition_AttachedOwnerIsLocation)
+def compile_attached_owner_is_location(condition):
+    required_location = condition["condition_location"]
+    def evaluate(engine, effect_player, source_card_id):
+        holomems = effect_player.get_holomems_with_attachment(source_card_id)
+        if holomems:
+            match required_location:
+                case "backstage":
+                    return holomems[0] in effect_player.backstage
+                case "center":
+                    return holomems[0] in effect_player.center
+                case "collab":
+                    return holomems[0] in effect_player.collab
+                case "center_or_collab":
+                    if holomems[0] in effect_player.center + effect_player.collab:
+                        return True
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_AttachedOwnerIsPerforming)
+def compile_attached_owner_is_performing(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        holomems = effect_player.get_holomems_with_attachment(source_card_id)
+        return engine.performance_performer_card and engine.performance_performer_card["game_card_id"] in ids_from_cards(holomems)
+    return evaluate
+
+@condition_compiler(Condition.Condition_BloomTargetIsDebut)
+def compile_bloom_target_is_debut(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        bloom_card, _, _ = effect_player.find_card(source_card_id)
+        # Bloom target is always in the 0 slot.
+        target_card = bloom_card["stacked_cards"][0]
+        return target_card["card_type"] == "holomem_debut"
+    return evaluate
+
+@condition_compiler(Condition.Condition_CanArchiveFromHand)
+def compile_can_archive_from_hand(condition):
+    amount_min = condition.get("amount_min", 1)
+    requirement = condition.get("requirement", None)
+    condition_source = condition["condition_source"]
+    def evaluate(engine, effect_player, source_card_id):
+        return effect_player.can_archive_from_hand(amount_min, condition_source, requirement)
+    return evaluate
+
+@condition_compiler(Condition.Condition_CanMoveFrontStage)
+def compile_can_move_front_stage(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return effect_player.can_move_front_stage()
+    return evaluate
+
+@condition_compiler(Condition.Condition_CardsInHand)
+def compile_cards_in_hand(condition):
+    amount_min = condition.get("amount_min", -1)
+    amount_max = condition.get("amount_max", -1)
+    if amount_max == -1:
+        amount_max = UNLIMITED_SIZE
+    def evaluate(engine, effect_player, source_card_id):
+        return amount_min <= len(effect_player.hand) <= amount_max
+    return evaluate
+
+@condition_compiler(Condition.Condition_CardTypeInHand)
+def compile_card_type_in_hand(condition):
+    card_types = set(condition["condition_card_types"])
+    def evaluate(engine, effect_player, source_card_id):
+        return any(card["card_type"] in card_types for card in effect_player.hand)
+    return evaluate
+
+@condition_compiler(Condition.Condition_CenterIsColor)
+def compile_center_is_color(condition):
+    condition_colors = condition["condition_colors"]
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.center) == 0:
+            return False
+        center_colors = effect_player.center[0]["colors"]
+        return any(color in center_colors for color in condition_colors)
+    return evaluate
+
+@condition_compiler(Condition.Condition_CenterHasAnyTag)
+def compile_center_has_any_tag(condition):
+    valid_tags = set(condition["condition_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.center) == 0:
+            return False
+        return any(tag in valid_tags for tag in effect_player.center[0]["tags"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_CheerInPlay)
+def compile_cheer_in_play(condition):
+    amount_min = condition["amount_min"]
+    amount_max = condition["amount_max"]
+    if amount_max == -1:
+        amount_max = UNLIMITED_SIZE
+    def evaluate(engine, effect_player, source_card_id):
+        return amount_min <= len(effect_player.get_cheer_ids_on_holomems()) <= amount_max
+    return evaluate
+
+@condition_compiler(Condition.Condition_ChosenCardHasTag)
+def compile_chosen_card_has_tag(condition):
+    valid_tags = condition["condition_tags"]
+    def evaluate(engine, effect_player, source_card_id):
+        if len(engine.last_chosen_cards) == 0:
+            return False
+        chosen_card = engine.find_card(engine.last_chosen_cards[0])
+        return any(tag in chosen_card["tags"] for tag in valid_tags)
+    return evaluate
+
+@condition_compiler(Condition.Condition_CollabWith)
+def compile_collab_with(condition):
+    required_member_name = condition["required_member_name"]
+    def evaluate(engine, effect_player, source_card_id):
+        holomems = effect_player.get_holomem_on_stage(only_performers=True)
+        return any(required_member_name in holomem["card_names"] for holomem in holomems)
+    return evaluate
+
+@condition_compiler(Condition.Condition_DamageAbilityIsColor)
+def compile_damage_ability_is_color(condition):
+    condition_color = condition["condition_color"]
+    include_oshi_ability = condition.get("include_oshi_ability", False)
+    def evaluate(engine, effect_player, source_card_id):
+        damage_source = engine.after_damage_state.source_card
+        if damage_source["card_type"] == "oshi":
+            return include_oshi_ability
+        return condition_color in damage_source["colors"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_DamagedHolomemIsBackstage)
+def compile_damaged_holomem_is_backstage(condition):
+    still_on_stage_required = condition.get("still_on_stage", False)
+    def evaluate(engine, effect_player, source_card_id):
+        if still_on_stage_required and not engine.after_damage_state.target_still_on_stage:
+            return False
+        return engine.after_damage_state.target_card_zone == "backstage"
+    return evaluate
+
+@condition_compiler(Condition.Condition_DamagedHolomemIsCenterOrCollab)
+def compile_damaged_holomem_is_center_or_collab(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.after_damage_state.target_card_zone in ["center", "collab"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_DamageSourceIsOpponent)
+def compile_damage_source_is_opponent(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.take_damage_state.source_player.player_id != effect_player.player_id
+    return evaluate
+
+@condition_compiler(Condition.Condition_DownedCardBelongsToOpponent)
+def compile_downed_card_belongs_to_opponent(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        source_card = engine.find_card(source_card_id)
+        owner_player = engine.get_player(source_card["owner_id"])
+        return owner_player.player_id != engine.down_holomem_state.holomem_card["owner_id"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_DownedCardIsColor)
+def compile_downed_card_is_color(condition):
+    condition_color = condition["condition_color"]
+    def evaluate(engine, effect_player, source_card_id):
+        return condition_color in engine.down_holomem_state.holomem_card["colors"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_EffectCardIdNotUsedThisTurn)
+def compile_effect_card_id_not_used_this_turn(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return not effect_player.has_used_card_effect_this_turn(source_card_id)
+    return evaluate
+
+@condition_compiler(Condition.Condition_HasAttachedCard)
+def compile_has_attached_card(condition):
+    required_card_name = condition["required_card_name"]
+    def evaluate(engine, effect_player, source_card_id):
+        source_card = engine.find_card(source_card_id)
+        # Check if the source card is attached with the mentioned card name
+        # Can be expanded to include other attachment zones
+        return any(required_card_name in support["card_names"] for support in source_card["attached_support"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_HasAttachmentOfType)
+def compile_has_attachment_of_type(condition):
+    attachment_type = condition["condition_type"]
+    def evaluate(engine, effect_player, source_card_id):
+        card, _, _ = effect_player.find_card(source_card_id)
+        return any(attachment.get("sub_type") == attachment_type for attachment in card["attached_support"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_HasAttachmentOfTypesAny)
+def compile_has_attachment_of_types_any(condition):
+    attachment_types = condition["condition_types"]
+    def evaluate(engine, effect_player, source_card_id):
+        card, _, _ = effect_player.find_card(source_card_id)
+        return any(attachment.get("sub_type") in attachment_types for attachment in card["attached_support"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_HasStackedHolomem)
+def compile_has_stacked_holomem(condition):
+    amount_min = condition.get("amount_min", 1)
+    def evaluate(engine, effect_player, source_card_id):
+        card, _, _ = effect_player.find_card(source_card_id)
+        stacked_holomems = [card for card in card["stacked_cards"] if is_card_holomem(card)]
+        return amount_min <= len(stacked_holomems)
+    return evaluate
+
+@condition_compiler(Condition.Condition_HolomemInArchive)
+def compile_holomem_in_archive(condition):
+    has_tags = "tag_in" in condition
+    tags = condition.get("tag_in")
+    amount_min = condition.get("amount_min", 1)
+    has_amount_max = "amount_max" in condition
+    amount_max = condition.get("amount_max")
+    def evaluate(engine, effect_player, source_card_id):
+        holomems = [holomem for holomem in effect_player.archive if is_card_holomem(holomem)]
+        if has_tags:
+            holomems = [holomem for holomem in holomems if any(tag in holomem["tags"] for tag in tags)]
+        return amount_min <= len(holomems) <= (amount_max if has_amount_max else len(holomems))
+    return evaluate
+
+@condition_compiler(Condition.Condition_HolomemOnStage)
+def compile_holomem_on_stage(condition):
+    location = condition.get("location")
+    has_required_names = "required_member_name_in" in condition
+    required_names_in = condition.get("required_member_name_in")
+    has_exclude_names = "exclude_member_name_in" in condition
+    exclude_names_in = condition.get("exclude_member_name_in")
+    has_tags = "tag_in" in condition
+    tags = condition.get("tag_in")
+    def evaluate(engine, effect_player, source_card_id):
+        match location:
+            case "center":
+                holomems = effect_player.center
+            case "collab":
+                holomems = effect_player.collab
+            case _:
+                holomems = effect_player.get_holomem_on_stage()
+
+        if has_required_names:
+            return any(member_name in holomem["card_names"] for member_name in required_names_in for holomem in holomems)
+        elif has_exclude_names:
+            if has_tags:
+                for holomem in holomems:
+                    if any(exclude_name in holomem["card_names"] for exclude_name in exclude_names_in):
+                        continue
+                    if any(tag in holomem["tags"] for tag in tags):
+                        return True
+        else:
+            # No specific member needed, but still check tags.
+            if has_tags:
+                for holomem in holomems:
+                    if any(tag in holomem["tags"] for tag in tags):
+                        return True
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_LastDieRolls)
+def compile_last_die_rolls(condition):
+    roll_results = condition.get("roll_results")
+    def evaluate(engine, effect_player, source_card_id):
+        match roll_results:
+            case "any_odd":
+                return any([value % 2 == 1 for value in effect_player.last_die_roll_results])
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_HolopowerAtLeast)
+def compile_holopower_at_least(condition):
+    amount = condition["amount"]
+    def evaluate(engine, effect_player, source_card_id):
+        return len(effect_player.holopower) >= amount
+    return evaluate
+
+@condition_compiler(Condition.Condition_NotUsedOncePerGameEffect)
+def compile_not_used_once_per_game_effect(condition):
+    condition_effect_id = condition["condition_effect_id"]
+    def evaluate(engine, effect_player, source_card_id):
+        return not effect_player.has_used_once_per_game_effect(condition_effect_id)
+    return evaluate
+
+@condition_compiler(Condition.Condition_NotUsedOncePerTurnEffect)
+def compile_not_used_once_per_turn_effect(condition):
+    condition_effect_id = condition["condition_effect_id"]
+    def evaluate(engine, effect_player, source_card_id):
+        return not effect_player.has_used_once_per_turn_effect(condition_effect_id)
+    return evaluate
+
+@condition_compiler(Condition.Condition_OpponentTurn)
+def compile_opponent_turn(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.active_player_id != effect_player.player_id
+    return evaluate
+
+@condition_compiler(Condition.Condition_OshiIs)
+def compile_oshi_is(condition):
+    required_member_name = condition["required_member_name"]
+    def evaluate(engine, effect_player, source_card_id):
+        return required_member_name in effect_player.oshi_card["card_names"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_OshiIsColor)
+def compile_oshi_is_color(condition):
+    condition_colors = condition["condition_colors"]
+    def evaluate(engine, effect_player, source_card_id):
+        return any(color in effect_player.oshi_card["colors"] for color in condition_colors)
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformanceTargetHasDamageOverHp)
+def compile_performance_target_has_damage_over_hp(condition):
+    amount = condition["amount"]
+    def evaluate(engine, effect_player, source_card_id):
+        target_card = engine.performance_target_card
+        return target_card["damage"] >= engine.performance_target_player.get_card_hp(target_card) + amount
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerIsCenter)
+def compile_performer_is_center(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        if len(engine.performance_performing_player.center) == 0:
+            return False
+        return engine.performance_performing_player.center[0]["game_card_id"] == engine.performance_performer_card["game_card_id"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerIsCollab)
+def compile_performer_is_collab(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        if len(engine.performance_performing_player.collab) == 0:
+            return False
+        return engine.performance_performing_player.collab[0]["game_card_id"] == engine.performance_performer_card["game_card_id"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerIsColor)
+def compile_performer_is_color(condition):
+    condition_colors = set(condition["condition_colors"])
+    def evaluate(engine, effect_player, source_card_id):
+        return any(color in condition_colors for color in engine.performance_performer_card["colors"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerIsSpecificId)
+def compile_performer_is_specific_id(condition):
+    required_id = condition["required_id"]
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.performance_performer_card["game_card_id"] == required_id
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerHasAnyTag)
+def compile_performer_has_any_tag(condition):
+    valid_tags = set(condition["condition_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        return any(tag in valid_tags for tag in engine.performance_performer_card["tags"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_PerformerHasAttachmentOfType)
+def compile_performer_has_attachment_of_type(condition):
+    attachment_type = condition["condition_type"]
+    def evaluate(engine, effect_player, source_card_id):
+        if not engine.performance_performer_card:
+            return False
+        return any(attachment.get("sub_type") == attachment_type for attachment in engine.performance_performer_card["attached_support"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_PlayedSupportThisTurn)
+def compile_played_support_this_turn(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return effect_player.played_support_this_turn
+    return evaluate
+
+@condition_compiler(Condition.Condition_RevealedCardsCount)
+def compile_revealed_cards_count(condition):
+    amount_min = condition["amount_min"]
+    def evaluate(engine, effect_player, source_card_id):
+        return len(effect_player.last_revealed_cards) >= amount_min
+    return evaluate
+
+@condition_compiler(Condition.Condition_RevealedCardsHaveSameType)
+def compile_revealed_cards_have_same_type(condition):
+    same_type = condition.get("condition_same_type")
+    def evaluate(engine, effect_player, source_card_id):
+        revealed_cards = effect_player.last_revealed_cards
+        if len(revealed_cards) == 0:
+            return False
+        match same_type:
+            case "holomem_same_bloom":
+                # Cards should be holomem and of the same bloom level (Debut is level 0)
+                base_card = revealed_cards[0] # the card that the rest of the cards will be compared to
+                if not is_card_holomem(base_card):
+                    return False
+                card_type = base_card["card_type"]
+                bloom_level = base_card.get("bloom_level", 0)
+                return all([card["card_type"] == card_type and card.get("bloom_level", 0) == bloom_level for card in revealed_cards[1:]])
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_SelfStageHasCheerColorTypes)
+def compile_self_stage_has_cheer_color_types(condition):
+    amount_min = condition["amount_min"]
+    def evaluate(engine, effect_player, source_card_id):
+        source_card, _, _ = effect_player.find_card(source_card_id)
+        if source_card:
+            return amount_min <= len(effect_player.get_cheer_color_types_on_holomems())
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_SelfHasCheerColor)
+def compile_self_has_cheer_color(condition):
+    condition_colors = condition["condition_colors"]
+    amount_min = condition["amount_min"]
+    any_color = "any" in condition_colors
+    def evaluate(engine, effect_player, source_card_id):
+        source_card, _, _ = effect_player.find_card(source_card_id)
+        if source_card:
+            cheer_of_matched_colors = 0
+            for cheer in source_card["attached_cheer"]:
+                if any_color or any(color in cheer["colors"] for color in condition_colors):
+                    cheer_of_matched_colors += 1
+            return amount_min <= cheer_of_matched_colors
+        return False
+    return evaluate
+
+@condition_compiler(Condition.Condition_StageHasSpace)
+def compile_stage_has_space(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return len(effect_player.get_holomem_on_stage()) < MAX_MEMBERS_ON_STAGE
+    return evaluate
+
+@condition_compiler(Condition.Condition_TargetColor)
+def compile_target_color(condition):
+    color_requirement = condition["color_requirement"]
+    def evaluate(engine, effect_player, source_card_id):
+        return color_requirement in engine.performance_target_card["colors"]
+    return evaluate
+
+@condition_compiler(Condition.Condition_TargetHasAnyTag)
+def compile_target_has_any_tag(condition):
+    valid_tags = set(condition["condition_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        return any(tag in valid_tags for tag in engine.take_damage_state.target_card["tags"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_TargetIsBackstage)
+def compile_target_is_backstage(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.performance_target_card in engine.performance_target_player.backstage
+    return evaluate
+
+@condition_compiler(Condition.Condition_TargetIsNotBackstage)
+def compile_target_is_not_backstage(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.performance_target_card not in engine.performance_target_player.backstage
+    return evaluate
+
+@condition_compiler(Condition.Condition_ThisCardIsCenter)
+def compile_this_card_is_center(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.center) == 0:
+            return False
+        return effect_player.center[0]["game_card_id"] == source_card_id
+    return evaluate
+
+@condition_compiler(Condition.Condition_ThisCardIsCollab)
+def compile_this_card_is_collab(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.collab) == 0:
+            return False
+        return effect_player.collab[0]["game_card_id"] == source_card_id
+    return evaluate
+
+@condition_compiler(Condition.Condition_ThisCardIsPerforming)
+def compile_this_card_is_performing(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        return engine.performance_performer_card and (engine.performance_performer_card["game_card_id"] == source_card_id)
+    return evaluate
+
+@condition_compiler(Condition.Condition_TopDeckCardHasAnyCardType)
+def compile_top_deck_card_has_any_card_type(condition):
+    amount = condition.get("amount", 1)
+    valid_card_types = condition["condition_card_types"]
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.deck) == 0:
+            return False
+        top_card_types = [card["card_type"] for card in effect_player.deck[:amount]]
+        return any(valid_card_type in top_card_types for valid_card_type in valid_card_types)
+    return evaluate
+
+@condition_compiler(Condition.Condition_TopDeckCardHasAnyTag)
+def compile_top_deck_card_has_any_tag(condition):
+    valid_tags = set(condition["condition_tags"])
+    def evaluate(engine, effect_player, source_card_id):
+        if len(effect_player.deck) == 0:
+            return False
+        top_card = effect_player.deck[0]
+        return "tags" in top_card and any(tag in valid_tags for tag in top_card["tags"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_ColorOnStage)
+def compile_color_on_stage(condition):
+    condition_colors = condition["condition_colors"]
+    def evaluate(engine, effect_player, source_card_id):
+        holomems = effect_player.get_holomem_on_stage()
+        return any(True for color in condition_colors for holomem in holomems if color in holomem["colors"])
+    return evaluate
+
+@condition_compiler(Condition.Condition_LifeAtMost)
+def compile_life_at_most(condition):
+    amount = condition["amount"]
+    def evaluate(engine, effect_player, source_card_id):
+        return len(effect_player.life) <= amount
+    return evaluate
+
+@condition_compiler(Condition.Condition_MonocolorDifferentColorsOnStage)
+def compile_monocolor_different_colors_on_stage(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        # Check if stage has at least one monocolor holomem and at least 2 different colors
+        holomems = effect_player.get_holomem_on_stage()
+        if len(holomems) < 2:
+            return False
+
+        # Check if there's at least one monocolor holomem
+        if not any(len(holomem["colors"]) == 1 for holomem in holomems):
+            return False
+
+        # Check if there are at least 2 different colors among all holomems
+        all_colors = set()
+        for holomem in holomems:
+            all_colors.update(holomem["colors"])
+        return len(all_colors) >= 2
+    return evaluate
+
+@condition_compiler(Condition.Condition_OpponentBackstageHpReducedCount)
+def compile_opponent_backstage_hp_reduced_count(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        # 상대방 백스테이지에서 HP가 감소된 홀로멤이 있는지 확인 (boolean 반환)
+        opponent_player = engine.other_player(effect_player.player_id)
+        return any(holomem.get("damage", 0) > 0 for holomem in opponent_player.backstage)
+    return evaluate
+
+@condition_compiler(Condition.Condition_BloomFromOshiSkill)
+def compile_bloom_from_oshi_skill(condition):
+    def evaluate(engine, effect_player, source_card_id):
+        # SP 오시 스킬로 블룸했는지 확인
+        return engine.last_bloom_from_oshi_skill
+    return evaluate
+
+class EventAudience:
+    # The recipients of a broadcast event that see the same version of it (after sanitizing).
+    # The event fields are encoded once for all of them.
+    __slots__ = ("encoded_event",)
+
+    def __init__(self):
+        self.encoded_event = None
+
+class PlayerEvent(dict):
+    # A broadcast event as one recipient (player or observer) gets it.
+    __slots__ = ("audience",)
+
+    def __init__(self, audience, fields):
+        super().__init__(fields)
+        self.audience = audience
+
+    def to_json(self):
+        # Same result as encode_json, only the recipient fields are encoded for each recipient.
+        # Encoded the first time it is sent, like send_json would.
+        audience = self.audience
+        if audience.encoded_event is None:
+            audience.encoded_event = encode_json({key: value for key, value in self.items() if key not in RECIPIENT_EVENT_FIELDS})
+        return extend_json_object(audience.encoded_event, {field: self[field] for field in RECIPIENT_EVENT_FIELDS})
 
 class GameEngine:
+    floating_cards = CardZone("floating")
+
     def __init__(self,
         card_db:CardDatabase,
         game_type : str,
@@ -1514,11 +2557,16 @@ class GameEngine:
         self.latest_observer_events = []
         self.all_game_messages = []
         self.all_events = []
+        # Every event as observers get it, for catching up, and the latest snapshot they can start from.
+        self.all_observer_events = []
+        self.observer_snapshot = None
         self.game_over_event = {}
         self.current_decision = None
         self.effect_resolution_state = None
         self.test_random_override = None
         self.turn_number = 0
+        # Only floating cards are tracked at the engine level, the rest of the zones belong to players.
+        self.card_index = CardZoneIndex()
         self.floating_cards = []
         self.down_holomem_state : DownHolomemState = None
         self.last_die_value = 0
@@ -1603,7 +2651,13 @@ class GameEngine:
         return self.player_states[1 - self.player_ids.index(player_id)]
 
     def shuffle_list(self, lst):
-        self.random_gen.shuffle(lst)
+        if isinstance(lst, ZoneList):
+            # Shuffling doesn't change which cards are in the zone, skip the index updates.
+            cards = list(lst)
+            self.random_gen.shuffle(cards)
+            lst.reorder(cards)
+        else:
+            self.random_gen.shuffle(lst)
 
     def random_pick_list(self, lst):
         return self.random_gen.choice(lst)
@@ -1618,19 +2672,9 @@ class GameEngine:
         for player_state in self.player_states:
             card, _, _ = player_state.find_card(game_card_id)
             if not card:
-                for holomem in player_state.get_holomem_on_stage():
-                    for attachment in holomem["attached_support"]:
-                        if attachment["game_card_id"] == game_card_id:
-                            card = attachment
-                            return card
-                    for cheer in holomem["attached_cheer"]:
-                        if cheer["game_card_id"] == game_card_id:
-                            card = cheer
-                            return card
-                    for stacked in holomem["stacked_cards"]:
-                        if stacked["game_card_id"] == game_card_id:
-                            card = stacked
-                            return card
+                card, _ = player_state.find_attached(game_card_id)
+                if card:
+                    return card
             else:
                 return card
         if not card:
@@ -1667,6 +2711,7 @@ class GameEngine:
 
         self.active_player_id = self.starting_player_id
         self.send_first_turn_choice()
+        self.update_observer_snapshot()
 
     def send_first_turn_choice(self):
         choices = [
@@ -1703,8 +2748,8 @@ class GameEngine:
         self.phase = GamePhase.PlayerTurn
         self.begin_player_turn(False)
 
-    def get_observer_catchup_events(self):
-        observer_events = [{
+    def get_observer_start_event(self):
+        return {
             "event_player_id": "observer",
             "event_type": EventType.EventType_GameStartInfo,
             "event_number": -1,
@@ -1714,31 +2759,82 @@ class GameEngine:
             "your_username": self.player_states[0].username,
             "opponent_username": self.player_states[1].username,
             "game_card_map": self.all_game_cards_map,
-        }]
-        for i in range(len(self.all_events)):
-            event = self.all_events[i]
-            observer_events.append(self.create_observer_event(event))
+        }
+
+    def get_observer_catchup_count(self):
+        # The start info, then every event.
+        return len(self.all_observer_events) + 1
+
+    def get_observer_catchup_events(self, starting_event_index = 0, count = None):
+        # Observer events are kept as they are broadcast, so a page doesn't rebuild the history.
+        ending_event_index = self.get_observer_catchup_count() if count is None else starting_event_index + count
+        observer_events = []
+        if starting_event_index == 0:
+            observer_events.append(self.get_observer_start_event())
+        observer_events += self.all_observer_events[max(starting_event_index - 1, 0):max(ending_event_index - 1, 0)]
         return observer_events
 
-    def create_observer_event(self, event):
-        event_copy = event.copy()
-        event_copy["event_player_id"] = "observer"
-        event_copy["your_clock_used"] = self.player_states[0].clock_time_used
-        event_copy["opponent_clock_used"] = self.player_states[1].clock_time_used
-        # Always sanitize.
+    def get_observer_card_state(self, card):
+        return {
+            "game_card_id": card["game_card_id"],
+            "card_id": card["card_id"],
+            "damage": card.get("damage", 0),
+            "resting": card.get("resting", False),
+            "attached_cheer": ids_from_cards(card.get("attached_cheer", [])),
+            "attached_support": ids_from_cards(card.get("attached_support", [])),
+            "stacked_cards": ids_from_cards(card.get("stacked_cards", [])),
+        }
+
+    def create_observer_snapshot(self):
+        # What observers can see of the game, with only the counts of hidden zones.
+        return {
+            "event_player_id": "observer",
+            "event_type": EventType.EventType_ObserverSnapshot,
+            "event_number": len(self.all_observer_events) - 1,
+            # Catch up continues from here, after the start info and the events in the snapshot.
+            "next_event_index": len(self.all_observer_events) + 1,
+            "phase": self.phase,
+            "turn_number": self.turn_number,
+            "active_player": self.active_player_id,
+            "player_states": [{
+                "player_id": player_state.player_id,
+                "oshi_id": player_state.oshi_id,
+                "life_count": len(player_state.life),
+                "hand_count": len(player_state.hand),
+                "deck_count": len(player_state.deck),
+                "cheer_deck_count": len(player_state.cheer_deck),
+                "holopower_count": len(player_state.holopower),
+                "archive": ids_from_cards(player_state.archive),
+                "center": [self.get_observer_card_state(card) for card in player_state.center],
+                "collab": [self.get_observer_card_state(card) for card in player_state.collab],
+                "backstage": [self.get_observer_card_state(card) for card in player_state.backstage],
+                "energy": player_state.energy,
+                "clock_used": player_state.clock_time_used,
+            } for player_state in self.player_states],
+        }
+
+    def update_observer_snapshot(self):
+        # Taken between game messages, where the state matches the events sent so far.
+        snapshot_event_count = self.observer_snapshot["next_event_index"] - 1 if self.observer_snapshot else 0
+        if len(self.all_observer_events) - snapshot_event_count >= OBSERVER_SNAPSHOT_EVENTS:
+            self.observer_snapshot = self.create_observer_snapshot()
+
+    def get_sanitized_fields(self, event):
+        # The hidden fields of the event, as seen by anyone but the hidden_info_player.
+        sanitized_fields = {}
         hidden_fields = event.get("hidden_info_fields", [])
         hidden_erase = event.get("hidden_info_erase", [])
         for field in hidden_fields:
             if field in hidden_erase:
-                event_copy[field] = None
+                sanitized_fields[field] = None
             else:
                 # If the field is a single id, replace it.
                 # If it is a list, replace them all.
-                if isinstance(event_copy[field], str):
-                    event_copy[field] = UNKNOWN_CARD_ID
-                elif isinstance(event_copy[field], list):
-                    event_copy[field] = [UNKNOWN_CARD_ID] * len(event_copy[field])
-        return event_copy
+                if isinstance(event[field], str):
+                    sanitized_fields[field] = UNKNOWN_CARD_ID
+                elif isinstance(event[field], list):
+                    sanitized_fields[field] = [UNKNOWN_CARD_ID] * len(event[field])
+        return sanitized_fields
 
     def handle_mulligan_phase(self):
         # Are both players done mulliganing?
@@ -1768,30 +2864,31 @@ class GameEngine:
     def broadcast_event(self, event):
         event["event_number"] = len(self.all_events)
         event["last_game_message_number"] = len(self.all_game_messages) - 1
-        self.latest_observer_events.append(self.create_observer_event(event))
         self.all_events.append(event)
-        hidden_fields = event.get("hidden_info_fields", [])
-        hidden_erase = event.get("hidden_info_erase", [])
+
+        # Sanitize once, everyone but the hidden_info_player gets the same version.
+        sanitized_fields = self.get_sanitized_fields(event)
+        sanitized_audience = EventAudience()
+        owner_audience = EventAudience() if sanitized_fields else sanitized_audience
+        observer_event = PlayerEvent(sanitized_audience, {
+            **event,
+            **sanitized_fields,
+            "event_player_id": "observer",
+            "your_clock_used": self.player_states[0].clock_time_used,
+            "opponent_clock_used": self.player_states[1].clock_time_used,
+        })
+        self.latest_observer_events.append(observer_event)
+        self.all_observer_events.append(observer_event)
         for player_state in self.player_states:
             should_sanitize = not (player_state.player_id == event.get("hidden_info_player"))
-            new_event = {
+            audience = sanitized_audience if should_sanitize else owner_audience
+            self.latest_events.append(PlayerEvent(audience, {
                 "event_player_id": player_state.player_id,
                 **event,
+                **(sanitized_fields if should_sanitize else {}),
                 "your_clock_used": player_state.clock_time_used,
                 "opponent_clock_used": self.other_player(player_state.player_id).clock_time_used,
-            }
-            if should_sanitize:
-                for field in hidden_fields:
-                    if field in hidden_erase:
-                        new_event[field] = None
-                    else:
-                        # If the field is a single id, replace it.
-                        # If it is a list, replace them all.
-                        if isinstance(new_event[field], str):
-                            new_event[field] = UNKNOWN_CARD_ID
-                        elif isinstance(new_event[field], list):
-                            new_event[field] = [UNKNOWN_CARD_ID] * len(new_event[field])
-            self.latest_events.append(new_event)
+            }))
 
     def set_decision(self, new_decision):
         if self.current_decision:
@@ -1946,57 +3043,59 @@ class GameEngine:
     def get_available_mainstep_actions(self):
         active_player = self.get_player(self.active_player_id)
 
+        available_actions = self.build_mainstep_actions(active_player, active_player.main_step_actions_cache)
+        if VERIFY_MAINSTEP_ACTIONS:
+            # Without a cache every category is rebuilt.
+            if available_actions != self.build_mainstep_actions(active_player, {}):
+                raise Exception("Main step actions differ from a full rebuild.")
+        return available_actions
+
+    def get_cached_mainstep_actions(self, cache, category, dependencies, build):
+        # Reuse what a category built last time if nothing it depends on has changed since.
+        cached = cache.get(category)
+        if cached is not None and cached[0] == dependencies:
+            return cached[1]
+        actions = build()
+        cache[category] = (dependencies, actions)
+        return actions
+
+    def build_mainstep_actions(self, active_player : PlayerState, cache):
+        # Categories that only depend on the zones and turn flags are kept in the cache
+        # and rebuilt when one of those changes.
+        # Anything that checks conditions or effects is checked again every time,
+        # since those can depend on any part of the game state.
+        versions = active_player.card_index.zone_versions
+        stage_versions = (versions["center"], versions["collab"], versions["backstage"])
+        first_turn_of_game = self.first_turn_player_id == active_player.player_id and active_player.first_turn
+
         # Determine available actions.
         available_actions = []
 
         # A. Place debut/spot cards.
-        on_stage_mems = active_player.get_holomem_on_stage()
-        if len(on_stage_mems) < MAX_MEMBERS_ON_STAGE:
-            for card in active_player.hand:
-                if card["card_type"] in ["holomem_debut", "holomem_spot"]:
-                    available_actions.append({
-                        "action_type": GameAction.MainStepPlaceHolomem,
-                        "card_id": card["game_card_id"]
-                    })
+        available_actions += self.get_cached_mainstep_actions(cache, "place_holomem",
+            (versions["hand"], stage_versions),
+            lambda: self.get_mainstep_place_holomem_actions(active_player))
 
         # B. Bloom
-        if not active_player.first_turn:
-            for mem_card in on_stage_mems:
-                if mem_card["played_this_turn"]:
-                    # Can't bloom if played this turn.
-                    continue
-                if mem_card["bloomed_this_turn"]:
-                    # Can't bloom if already bloomed this turn.
-                    continue
-
-                accepted_bloom_levels = active_player.get_accepted_bloom_for_card(mem_card)
-                if accepted_bloom_levels:
-                    for card in active_player.hand:
-                        if "bloom_blocked" in card and card["bloom_blocked"]:
-                            continue
-                        if card["card_type"] == "holomem_bloom" and card["bloom_level"] in accepted_bloom_levels:
-                            # Check the names of the bloom card, at last one must match a name from the base card.
-                            if any(name in card["card_names"] for name in mem_card["card_names"]):
-                                # Check the damage, if the bloom version would die, you can't.
-                                if mem_card["damage"] < active_player.get_card_hp(card):
-                                    available_actions.append({
-                                        "action_type": GameAction.MainStepBloom,
-                                        "card_id": card["game_card_id"],
-                                        "target_id": mem_card["game_card_id"],
-                                    })
+        bloom_candidates = self.get_cached_mainstep_actions(cache, "bloom",
+            (versions["hand"], stage_versions, versions["life"], active_player.first_turn),
+            lambda: self.get_mainstep_bloom_candidates(active_player))
+        bloom_hp = {}
+        for card, mem_card in bloom_candidates:
+            # Check the damage, if the bloom version would die, you can't.
+            if card["game_card_id"] not in bloom_hp:
+                bloom_hp[card["game_card_id"]] = active_player.get_card_hp(card)
+            if mem_card["damage"] < bloom_hp[card["game_card_id"]]:
+                available_actions.append({
+                    "action_type": GameAction.MainStepBloom,
+                    "card_id": card["game_card_id"],
+                    "target_id": mem_card["game_card_id"],
+                })
 
         # C. Collab
-        # Can't have collabed this turn.
-        # Must have a card in deck to move to holopower.
-        # Collab spot must be empty!
-        # Must have a non-resting backstage card.
-        if not active_player.collabed_this_turn and len(active_player.deck) > 0 and len(active_player.collab) == 0:
-            for card in active_player.backstage:
-                if not is_card_resting(card):
-                    available_actions.append({
-                        "action_type": GameAction.MainStepCollab,
-                        "card_id": card["game_card_id"],
-                    })
+        available_actions += self.get_cached_mainstep_actions(cache, "collab",
+            (versions["deck"], stage_versions, active_player.collabed_this_turn),
+            lambda: self.get_mainstep_collab_actions(active_player))
 
         # D. Use Oshi skills.
         for action in active_player.oshi_card["actions"]:
@@ -2037,29 +3136,118 @@ class GameEngine:
                     })
 
         # F. Play Cards (Slay the Spire style)
+        available_actions += self.get_cached_mainstep_actions(cache, "play_card",
+            (versions["hand"], active_player.energy),
+            lambda: self.get_mainstep_play_card_actions(active_player))
+
+        # G. Use Support Cards (original hololive style)
+        support_candidates = self.get_cached_mainstep_actions(cache, "play_support",
+            (versions["hand"], stage_versions, versions["attached_support"], versions["attached_cheer"],
+                active_player.used_limited_this_turn, active_player.event_card_whit_magic_tag, first_turn_of_game),
+            lambda: self.get_mainstep_support_candidates(active_player, first_turn_of_game))
+        for card, action in support_candidates:
+            if "play_conditions" in card:
+                if not self.are_conditions_met(active_player, card["game_card_id"], card["play_conditions"]):
+                    continue
+            available_actions.append(action)
+
+        # G. Pass the baton
+        available_actions += self.get_cached_mainstep_actions(cache, "baton_pass",
+            (stage_versions, versions["attached_cheer"], active_player.block_movement_for_turn, active_player.baton_pass_this_turn),
+            lambda: self.get_mainstep_baton_pass_actions(active_player))
+
+        # H. Begin Performance
+        if not first_turn_of_game:
+            available_actions.append({
+                "action_type": GameAction.MainStepBeginPerformance,
+            })
+
+        # I. End Turn
+        available_actions.append({
+            "action_type": GameAction.MainStepEndTurn,
+        })
+
+        return available_actions
+
+    def get_mainstep_place_holomem_actions(self, active_player : PlayerState):
+        actions = []
+        if len(active_player.get_holomem_on_stage()) < MAX_MEMBERS_ON_STAGE:
+            for card in active_player.hand:
+                if card["card_type"] in ["holomem_debut", "holomem_spot"]:
+                    actions.append({
+                        "action_type": GameAction.MainStepPlaceHolomem,
+                        "card_id": card["game_card_id"]
+                    })
+        return actions
+
+    def get_mainstep_bloom_candidates(self, active_player : PlayerState):
+        # Returns (bloom card, target) pairs, the hp check is done by the caller.
+        candidates = []
+        if not active_player.first_turn:
+            bloom_cards = [card for card in active_player.hand if card["card_type"] == "holomem_bloom" and not card.get("bloom_blocked")]
+            if not bloom_cards:
+                return candidates
+            for mem_card in active_player.get_holomem_on_stage():
+                if mem_card["played_this_turn"]:
+                    # Can't bloom if played this turn.
+                    continue
+                if mem_card["bloomed_this_turn"]:
+                    # Can't bloom if already bloomed this turn.
+                    continue
+
+                accepted_bloom_levels = active_player.get_accepted_bloom_for_card(mem_card)
+                if accepted_bloom_levels:
+                    for card in bloom_cards:
+                        if card["bloom_level"] in accepted_bloom_levels:
+                            # Check the names of the bloom card, at last one must match a name from the base card.
+                            if any(name in card["card_names"] for name in mem_card["card_names"]):
+                                candidates.append((card, mem_card))
+        return candidates
+
+    def get_mainstep_collab_actions(self, active_player : PlayerState):
+        # Can't have collabed this turn.
+        # Must have a card in deck to move to holopower.
+        # Collab spot must be empty!
+        # Must have a non-resting backstage card.
+        actions = []
+        if not active_player.collabed_this_turn and len(active_player.deck) > 0 and len(active_player.collab) == 0:
+            for card in active_player.backstage:
+                if not is_card_resting(card):
+                    actions.append({
+                        "action_type": GameAction.MainStepCollab,
+                        "card_id": card["game_card_id"],
+                    })
+        return actions
+
+    def get_mainstep_play_card_actions(self, active_player : PlayerState):
+        actions = []
         for card in active_player.hand:
             # Check if player can play this card (has enough energy)
             if not active_player.can_play_card(card):
                 continue
-                
+
             # Check if card has energy_cost
             if "energy_cost" not in card:
                 continue
-                
+
             # Add playable cards to available actions
-            available_actions.append({
+            actions.append({
                 "action_type": GameAction.MainStepPlayCard,
                 "card_id": card["game_card_id"],
                 "energy_cost": card.get("energy_cost", 0),
             })
+        return actions
 
-        # G. Use Support Cards (original hololive style)
+    def get_mainstep_support_candidates(self, active_player : PlayerState, first_turn_of_game):
+        # Returns (card, action) pairs, play_conditions are checked by the caller.
+        candidates = []
+        cheer_on_each_mem = None
         for card in active_player.hand:
             if card["card_type"] == "support":
                 if is_card_limited(card):
                     if active_player.used_limited_this_turn:
                         continue
-                    if self.first_turn_player_id == active_player.player_id and active_player.first_turn:
+                    if first_turn_of_game:
                         continue
 
                 # event card whit magic tag limited can only be used once per turn
@@ -2067,10 +3255,6 @@ class GameEngine:
                     if active_player.event_card_whit_magic_tag:
                         continue
 
-                if "play_conditions" in card:
-                    if not self.are_conditions_met(active_player, card["game_card_id"], card["play_conditions"]):
-                        continue
-
                 # Restrictions for mascots and tools with regards to attaching to holomem.
                 if not self.card_has_available_target_to_attach_to(active_player, card):
                     continue
@@ -2079,17 +3263,21 @@ class GameEngine:
                 if "play_requirements" in card:
                     play_requirements = card["play_requirements"]
 
-                cheer_on_each_mem = active_player.get_cheer_on_each_holomem(exclude_empty_members=True)
-                available_actions.append({
+                # The same for every card in hand, only build it once.
+                if cheer_on_each_mem is None:
+                    cheer_on_each_mem = active_player.get_cheer_on_each_holomem(exclude_empty_members=True)
+                candidates.append((card, {
                     "action_type": GameAction.MainStepPlaySupport,
                     "card_id": card["game_card_id"],
                     "play_requirements": play_requirements,
                     "cheer_on_each_mem": cheer_on_each_mem,
-                })
+                }))
+        return candidates
 
-        # G. Pass the baton
+    def get_mainstep_baton_pass_actions(self, active_player : PlayerState):
         # If center holomem is not resting, can swap with a back who is not resting by archiving Cheer.
         # Must be able to archive that much cheer from the center.
+        actions = []
         if len(active_player.center) > 0:
             center_mem = active_player.center[0]
             cheer_on_mem = center_mem["attached_cheer"]
@@ -2101,26 +3289,14 @@ class GameEngine:
                     if not is_card_resting(card):
                         backstage_options.append(card["game_card_id"])
                 if backstage_options:
-                    available_actions.append({
+                    actions.append({
                         "action_type": GameAction.MainStepBatonPass,
                         "center_id": center_mem["game_card_id"],
                         "backstage_options": backstage_options,
                         "cost": baton_cost,
                         "available_cheer": ids_from_cards(cheer_on_mem),
                     })
-
-        # H. Begin Performance
-        if not (self.first_turn_player_id == active_player.player_id and active_player.first_turn):
-            available_actions.append({
-                "action_type": GameAction.MainStepBeginPerformance,
-            })
-
-        # I. End Turn
-        available_actions.append({
-            "action_type": GameAction.MainStepEndTurn,
-        })
-
-        return available_actions
+        return actions
 
     def send_main_step_actions(self):
         # Determine available actions.
@@ -2353,7 +3529,7 @@ class GameEngine:
         # Deal damage.
         art_after_deal_damage_effects = filter_effects_at_timing(self.performance_art.get("art_effects", []), "after_deal_damage")
         add_ids_to_effects(art_after_deal_damage_effects, self.active_player_id, self.performance_performer_card["game_card_id"])
-        art_kill_effects = self.performance_art.get("on_kill_effects", [])
+        art_kill_effects = copy_effects(self.performance_art.get("on_kill_effects", []))
         add_ids_to_effects(art_kill_effects, self.active_player_id, self.performance_performer_card["game_card_id"])
         art_info = {
             "after_deal_damage_effects": art_after_deal_damage_effects,
@@ -2677,7 +3853,9 @@ class GameEngine:
             if "conditions" not in effect or self.are_conditions_met(effect_player, effect["source_card_id"], effect["conditions"]):
                 # Add any "and" effects to the front of the queue.
                 if "and" in effect:
-                    and_effects = effect["and"]
+                    # Sub effects are shared with the definition, keep the resolving copies on the effect.
+                    and_effects = copy_effects(effect["and"])
+                    effect["and"] = and_effects
                     add_ids_to_effects(and_effects, effect_player_id, effect.get("source_card_id", None))
                     self.effect_resolution_state.effects_to_resolve = and_effects + self.effect_resolution_state.effects_to_resolve
                 passed_on_continuation = self.do_effect(effect_player, effect)
@@ -2686,7 +3864,8 @@ class GameEngine:
             else:
                 # Failed conditions, add any negative condition effects to the front of the queue.
                 if "negative_condition_effects" in effect:
-                    negative_effects = effect["negative_condition_effects"]
+                    negative_effects = copy_effects(effect["negative_condition_effects"])
+                    effect["negative_condition_effects"] = negative_effects
                     add_ids_to_effects(negative_effects, effect_player_id, effect.get("source_card_id", None))
                     self.effect_resolution_state.effects_to_resolve = negative_effects + self.effect_resolution_state.effects_to_resolve
 
@@ -2699,381 +3878,10 @@ class GameEngine:
                return False
         return True
     def is_condition_met(self, effect_player: PlayerState, source_card_id, condition):
-        match condition["condition"]:
-            case Condition.Condition_AnyTagHolomemHasCheer:
-                valid_tags = condition["condition_tags"]
-                for card in effect_player.get_holomem_on_stage():
-                    for tag in card["tags"]:
-                        if tag in valid_tags and len(card["attached_cheer"]) > 0:
-                            return True
-                return False
-            case Condition.Condition_AttachedTo:
-                required_member_name = condition["required_member_name"]
-                required_bloom_levels = condition.get("required_bloom_levels", [])
-                # Determine if source_card_id is attached to a holomem with the required name.
-                source_card = self.find_card(source_card_id)
-                owner_player = self.get_player(source_card["owner_id"])
-                holomems = owner_player.get_holomem_on_stage()
-                for holomem in holomems:
-                    if source_card_id in ids_from_cards(holomem["attached_support"]):
-                        if required_member_name in holomem["card_names"]:
-                            if not required_bloom_levels or holomem.get("bloom_level", -1) in required_bloom_levels:
-                                return True
-                # Check if there is an after damage state and if this the target card had this attached.
-                if self.after_damage_state and source_card_id in ids_from_cards(self.after_damage_state.target_card["attached_when_downed"]):
-                    if required_member_name in self.after_damage_state.target_card["card_names"]:
-                        if not required_bloom_levels or self.after_damage_state.target_card.get("bloom_level", -1) in required_bloom_levels:
-                            return True
-                return False
-            case Condition.Condition_AttachedToHasTags:
-                inverse = condition.get("inverse", False) # XOR the result to get the inverse
-                source_card = self.find_card(source_card_id)
-                owner_player = self.get_player(source_card["owner_id"])
-                holomems = owner_player.get_holomem_on_stage()
-                for holomem in holomems:
-                    if source_card_id in ids_from_cards(holomem["attached_support"]):
-                        return (len(set(holomem["tags"]) & set(condition["required_tags"])) > 0) ^ inverse
-                return False ^ inverse
-            case Condition.Condition_AttachedOwnerIsLocation:
-                required_location = condition["condition_location"]
-                holomems = effect_player.get_holomems_with_attachment(source_card_id)
-                if holomems:
-                    match required_location:
-                        case "backstage":
-                            return holomems[0] in effect_player.backstage
-                        case "center":
-                            return holomems[0] in effect_player.center
-                        case "collab":
-                            return holomems[0] in effect_player.collab
-                        case "center_or_collab":
-                            if holomems[0] in effect_player.center + effect_player.collab:
-                                return True
-                return False
-            case Condition.Condition_AttachedOwnerIsPerforming:
-                holomems = effect_player.get_holomems_with_attachment(source_card_id)
-                return self.performance_performer_card and self.performance_performer_card["game_card_id"] in ids_from_cards(holomems)
-            case Condition.Condition_BloomTargetIsDebut:
-                bloom_card, _, _ = effect_player.find_card(source_card_id)
-                # Bloom target is always in the 0 slot.
-                target_card = bloom_card["stacked_cards"][0]
-                return target_card["card_type"] == "holomem_debut"
-            case Condition.Condition_CanArchiveFromHand:
-                amount_min = condition.get("amount_min", 1)
-                requirement = condition.get("requirement", None)
-                condition_source = condition["condition_source"]
-                return effect_player.can_archive_from_hand(amount_min, condition_source, requirement)
-            case Condition.Condition_CanMoveFrontStage:
-                return effect_player.can_move_front_stage()
-            case Condition.Condition_CardsInHand:
-                amount_min = condition.get("amount_min", -1)
-                amount_max = condition.get("amount_max", -1)
-                if amount_max == -1:
-                    amount_max = UNLIMITED_SIZE
-                return amount_min <= len(effect_player.hand) <= amount_max
-            case Condition.Condition_CardTypeInHand:
-                card_types = condition["condition_card_types"]
-                return any(card["card_type"] in card_types for card in effect_player.hand)
-            case Condition.Condition_CenterIsColor:
-                if len(effect_player.center) == 0:
-                    return False
-                condition_colors = condition["condition_colors"]
-                center_colors = effect_player.center[0]["colors"]
-                if any(color in center_colors for color in condition_colors):
-                    return True
-            case Condition.Condition_CenterHasAnyTag:
-                valid_tags = condition["condition_tags"]
-                if len(effect_player.center) == 0:
-                    return False
-                center_card = effect_player.center[0]
-                for tag in center_card["tags"]:
-                    if tag in valid_tags:
-                        return True
-                return False
-            case Condition.Condition_CheerInPlay:
-                amount_min = condition["amount_min"]
-                amount_max = condition["amount_max"]
-                if amount_max == -1:
-                    amount_max = UNLIMITED_SIZE
-                return amount_min <= len(effect_player.get_cheer_ids_on_holomems()) <= amount_max
-            case Condition.Condition_ChosenCardHasTag:
-                if len(self.last_chosen_cards) == 0:
-                    return False
-                chosen_card_id = self.last_chosen_cards[0]
-                chosen_card = self.find_card(chosen_card_id)
-                valid_tags = condition["condition_tags"]
-                return any(tag in chosen_card["tags"] for tag in valid_tags)
-            case Condition.Condition_CollabWith:
-                required_member_name = condition["required_member_name"]
-                holomems = effect_player.get_holomem_on_stage(only_performers=True)
-                return any(required_member_name in holomem["card_names"] for holomem in holomems)
-            case Condition.Condition_DamageAbilityIsColor:
-                condition_color = condition["condition_color"]
-                include_oshi_ability = condition.get("include_oshi_ability", False)
-                damage_source = self.after_damage_state.source_card
-                if damage_source["card_type"] == "oshi":
-                    return include_oshi_ability
-                return condition_color in damage_source["colors"]
-            case Condition.Condition_DamagedHolomemIsBackstage:
-                still_on_stage_required = condition.get("still_on_stage", False)
-                if still_on_stage_required and not self.after_damage_state.target_still_on_stage:
-                    return False
-                return self.after_damage_state.target_card_zone == "backstage"
-            case Condition.Condition_DamagedHolomemIsCenterOrCollab:
-                return self.after_damage_state.target_card_zone in ["center", "collab"]
-            case Condition.Condition_DamageSourceIsOpponent:
-                return self.take_damage_state.source_player.player_id != effect_player.player_id
-            case Condition.Condition_DownedCardBelongsToOpponent:
-                source_card = self.find_card(source_card_id)
-                owner_player = self.get_player(source_card["owner_id"])
-                return owner_player.player_id != self.down_holomem_state.holomem_card["owner_id"]
-            case Condition.Condition_DownedCardIsColor:
-                downed_card = self.down_holomem_state.holomem_card
-                condition_color = condition["condition_color"]
-                return condition_color in downed_card["colors"]
-            case Condition.Condition_EffectCardIdNotUsedThisTurn:
-                return not effect_player.has_used_card_effect_this_turn(source_card_id)
-            case Condition.Condition_HasAttachedCard:
-                required_card_name = condition["required_card_name"]
-                source_card = self.find_card(source_card_id)
-                # Check if the source card is attached with the mentioned card name
-                for support in source_card["attached_support"]:
-                    if required_card_name in support["card_names"]:
-                        return True
-                # Can be expanded to include other attachment zones
-                return False
-            case Condition.Condition_HasAttachmentOfType:
-                attachment_type = condition["condition_type"]
-                card, _, _ = effect_player.find_card(source_card_id)
-                for attachment in card["attached_support"]:
-                    if "sub_type" in attachment and attachment["sub_type"] == attachment_type:
-                        return True
-                return False
-            case Condition.Condition_HasAttachmentOfTypesAny:
-                attachment_types: list = condition["condition_types"]
-                card, _, _ = effect_player.find_card(source_card_id)
-                for attachment in card["attached_support"]:
-                    if attachment.get("sub_type") in attachment_types:
-                        return True
-                return False
-            case Condition.Condition_HasStackedHolomem:
-                amount_min = condition.get("amount_min", 1)
-                card, _, _ = effect_player.find_card(source_card_id)
-                stacked_holomems = [card for card in card["stacked_cards"] if is_card_holomem(card)]
-                return amount_min <= len(stacked_holomems)
-            case Condition.Condition_HolomemInArchive:
-                holomems = [holomem for holomem in effect_player.archive if is_card_holomem(holomem)]
-                if "tag_in" in condition:
-                    tags = condition["tag_in"]
-                    holomems = [holomem for holomem in holomems if any(tag in holomem["tags"] for tag in tags)]
-
-                amount_min = condition.get("amount_min", 1)
-                amount_max = condition.get("amount_max", len(holomems))
-                return amount_min <= len(holomems) <= amount_max
-            case Condition.Condition_HolomemOnStage:
-                holomems = []
-                match condition.get("location"):
-                    case "center":
-                        holomems = effect_player.center
-                    case "collab":
-                        holomems = effect_player.collab
-                    case _:
-                        holomems = effect_player.get_holomem_on_stage()
+        # Conditions from card definitions are compiled when the cards are loaded.
+        # Conditions built at runtime are compiled here.
+        return compile_condition(condition).evaluate(self, effect_player, source_card_id)
 
-                if "required_member_name_in" in condition:
-                    required_names_in = condition["required_member_name_in"]
-                    return any(member_name in holomem["card_names"] for member_name in required_names_in for holomem in holomems)
-                elif "exclude_member_name_in" in condition:
-                    exclude_names_in = condition["exclude_member_name_in"]
-                    if "tag_in" in condition:
-                        tags = condition["tag_in"]
-                        for holomem in holomems:
-                            if any(exclude_name in holomem["card_names"] for exclude_name in exclude_names_in):
-                                continue
-                            if any(tag in holomem["tags"] for tag in tags):
-                                return True
-                else:
-                    # No specific member needed, but still check tags.
-                    if "tag_in" in condition:
-                        tags = condition["tag_in"]
-                        for holomem in holomems:
-                            if any(tag in holomem["tags"] for tag in tags):
-                                return True
-                return False
-            case Condition.Condition_LastDieRolls:
-                match condition.get("roll_results"):
-                    case "any_odd":
-                        return any([value % 2 == 1 for value in effect_player.last_die_roll_results])
-                return False
-            case Condition.Condition_HolopowerAtLeast:
-                amount = condition["amount"]
-                return len(effect_player.holopower) >= amount
-            case Condition.Condition_NotUsedOncePerGameEffect:
-                condition_effect_id = condition["condition_effect_id"]
-                return not effect_player.has_used_once_per_game_effect(condition_effect_id)
-            case Condition.Condition_NotUsedOncePerTurnEffect:
-                condition_effect_id = condition["condition_effect_id"]
-                return not effect_player.has_used_once_per_turn_effect(condition_effect_id)
-            case Condition.Condition_OpponentTurn:
-                return self.active_player_id != effect_player.player_id
-            case Condition.Condition_OshiIs:
-                required_member_name = condition["required_member_name"]
-                return required_member_name in effect_player.oshi_card["card_names"]
-            case Condition.Condition_OshiIsColor:
-                condition_colors = condition["condition_colors"]
-                for color in condition_colors:
-                    if color in effect_player.oshi_card["colors"]:
-                        return True
-                return False
-            case Condition.Condition_PerformanceTargetHasDamageOverHp:
-                amount = condition["amount"]
-                return self.performance_target_card["damage"] >= self.performance_target_player.get_card_hp(self.performance_target_card) + amount
-            case Condition.Condition_PerformerIsCenter:
-                if len(self.performance_performing_player.center) == 0:
-                    return False
-                return self.performance_performing_player.center[0]["game_card_id"] == self.performance_performer_card["game_card_id"]
-            case Condition.Condition_PerformerIsCollab:
-                if len(self.performance_performing_player.collab) == 0:
-                    return False
-                return self.performance_performing_player.collab[0]["game_card_id"] == self.performance_performer_card["game_card_id"]
-            case Condition.Condition_PerformerIsColor:
-                condition_colors = condition["condition_colors"]
-                for color in self.performance_performer_card["colors"]:
-                    if color in condition_colors:
-                        return True
-                return False
-            case Condition.Condition_PerformerIsSpecificId:
-                required_id = condition["required_id"]
-                return self.performance_performer_card["game_card_id"] == required_id
-            case Condition.Condition_PerformerHasAnyTag:
-                valid_tags = condition["condition_tags"]
-                for tag in self.performance_performer_card["tags"]:
-                    if tag in valid_tags:
-                        return True
-                return False
-            case Condition.Condition_PerformerHasAttachmentOfType:
-                if not self.performance_performer_card:
-                    return False
-                attachment_type = condition["condition_type"]
-                for attachment in self.performance_performer_card["attached_support"]:
-                    if attachment.get("sub_type") == attachment_type:
-                        return True
-                return False
-            case Condition.Condition_PlayedSupportThisTurn:
-                return effect_player.played_support_this_turn
-            case Condition.Condition_RevealedCardsCount:
-                amount_min = condition["amount_min"]
-                return len(effect_player.last_revealed_cards) >= amount_min
-            case Condition.Condition_RevealedCardsHaveSameType:
-                revealed_cards = effect_player.last_revealed_cards
-                if len(revealed_cards) == 0:
-                    return False
-                match condition.get("condition_same_type"):
-                    case "holomem_same_bloom":
-                        # Cards should be holomem and of the same bloom level (Debut is level 0)
-                        base_card = revealed_cards[0] # the card that the rest of the cards will be compared to
-                        if not is_card_holomem(base_card):
-                            return False
-                        card_type = base_card["card_type"]
-                        bloom_level = base_card.get("bloom_level", 0)
-                        return all([card["card_type"] == card_type and card.get("bloom_level", 0) == bloom_level for card in revealed_cards[1:]])
-                return False
-            case Condition.Condition_SelfStageHasCheerColorTypes:
-                amount_min = condition["amount_min"]
-                source_card, _, _ = effect_player.find_card(source_card_id)
-                if source_card:
-                    return amount_min <= len(effect_player.get_cheer_color_types_on_holomems())
-                return False
-            case Condition.Condition_SelfHasCheerColor:
-                condition_colors = condition["condition_colors"]
-                amount_min = condition["amount_min"]
-                source_card, _, _ = effect_player.find_card(source_card_id)
-                if source_card:
-                    cheer_of_matched_colors = 0
-                    for cheer in source_card["attached_cheer"]:
-                        if "any" in condition_colors or any(color in cheer["colors"] for color in condition_colors):
-                            cheer_of_matched_colors += 1
-                    return amount_min <= cheer_of_matched_colors
-                return False
-            case Condition.Condition_StageHasSpace:
-                return len(effect_player.get_holomem_on_stage()) < MAX_MEMBERS_ON_STAGE
-            case Condition.Condition_TargetColor:
-                color_requirement = condition["color_requirement"]
-                return color_requirement in self.performance_target_card["colors"]
-            case Condition.Condition_TargetHasAnyTag:
-                valid_tags = condition["condition_tags"]
-                for tag in self.take_damage_state.target_card["tags"]:
-                    if tag in valid_tags:
-                        return True
-                return False
-            case Condition.Condition_TargetIsBackstage:
-                return self.performance_target_card in self.performance_target_player.backstage
-            case Condition.Condition_TargetIsNotBackstage:
-                return self.performance_target_card not in self.performance_target_player.backstage
-            case Condition.Condition_ThisCardIsCenter:
-                if len(effect_player.center) == 0:
-                    return False
-                return effect_player.center[0]["game_card_id"] == source_card_id
-            case Condition.Condition_ThisCardIsCollab:
-                if len(effect_player.collab) == 0:
-                    return False
-                return effect_player.collab[0]["game_card_id"] == source_card_id
-            case Condition.Condition_ThisCardIsPerforming:
-                return self.performance_performer_card and (self.performance_performer_card["game_card_id"] == source_card_id)
-            case Condition.Condition_TopDeckCardHasAnyCardType:
-                if len(effect_player.deck) == 0:
-                    return False
-                amount = condition.get("amount", 1)
-                valid_card_types = condition["condition_card_types"]
-                top_card_types = [card["card_type"] for card in effect_player.deck[:amount]]
-                return any(valid_card_type in top_card_types for valid_card_type in valid_card_types)
-            case Condition.Condition_TopDeckCardHasAnyTag:
-                valid_tags = condition["condition_tags"]
-                if len(effect_player.deck) == 0:
-                    return False
-                top_card = effect_player.deck[0]
-                if "tags" in top_card:
-                    for tag in top_card["tags"]:
-                        if tag in valid_tags:
-                            return True
-                return False
-            case Condition.Condition_ColorOnStage:
-                holomems = effect_player.get_holomem_on_stage()
-                condition_colors = condition["condition_colors"]
-                return any(True for color in condition_colors for holomem in holomems if color in holomem["colors"])
-            case Condition.Condition_LifeAtMost:
-                amount = condition["amount"]
-                return len(effect_player.life) <= amount
-            case Condition.Condition_MonocolorDifferentColorsOnStage:
-                # Check if stage has at least one monocolor holomem and at least 2 different colors
-                holomems = effect_player.get_holomem_on_stage()
-                if len(holomems) < 2:
-                    return False
-                
-                # Check if there's at least one monocolor holomem
-                has_monocolor = any(len(holomem["colors"]) == 1 for holomem in holomems)
-                if not has_monocolor:
-                    return False
-                
-                # Check if there are at least 2 different colors among all holomems
-                all_colors = set()
-                for holomem in holomems:
-                    all_colors.update(holomem["colors"])
-                
-                return len(all_colors) >= 2
-            case Condition.Condition_OpponentBackstageHpReducedCount:
-                # 상대방 백스테이지에서 HP가 감소된 홀로멤이 있는지 확인 (boolean 반환)
-                opponent_player = self.other_player(effect_player.player_id)
-                for holomem in opponent_player.backstage:
-                    damage = holomem.get("damage", 0)
-                    if damage > 0:
-                        return True
-                return False
-            case Condition.Condition_BloomFromOshiSkill:
-                # SP 오시 스킬로 블룸했는지 확인
-                return self.last_bloom_from_oshi_skill
-            case _:
-                raise NotImplementedError(f"Unimplemented condition: {condition['condition']}")
-        return False
     def get_condition_count(self, effect_player: PlayerState, source_card_id, condition_type):
         """조건에 따른 카운트를 반환하는 함수 (power_boost_per_condition용)"""
         match condition_type:
@@ -3099,7 +3907,8 @@ class GameEngine:
         effect_player_id = effect_player.player_id
         if "pre_effects" in effect:
             # Do any do pre_effects right away (Assumption: no decisions/sub effects).
-            do_before_effects = effect["pre_effects"]
+            do_before_effects = copy_effects(effect["pre_effects"])
+            effect["pre_effects"] = do_before_effects
             add_ids_to_effects(do_before_effects, effect_player_id, effect.get("source_card_id", None))
             for do_before in do_before_effects:
                 self.do_effect(effect_player, do_before)
@@ -3112,12 +3921,13 @@ class GameEngine:
                 for_art = self.take_damage_state.art_info
                 self.send_boost_event(self.take_damage_state.target_card["game_card_id"], effect["source_card_id"], "damage_added", amount, for_art)
             case EffectType.EffectType_AddTurnEffect:
-                effect["turn_effect"]["source_card_id"] = effect["source_card_id"]
-                effect_player.add_turn_effect(effect["turn_effect"])
+                turn_effect = copy_effect(effect["turn_effect"])
+                turn_effect["source_card_id"] = effect["source_card_id"]
+                effect_player.add_turn_effect(turn_effect)
                 event = {
                     "event_type": EventType.EventType_AddTurnEffect,
                     "effect_player_id": effect_player_id,
-                    "turn_effect": effect["turn_effect"],
+                    "turn_effect": turn_effect,
                 }
                 self.broadcast_event(event)
             case EffectType.EffectType_AddTurnEffectForHolomem:
@@ -3133,7 +3943,7 @@ class GameEngine:
                         case "name_in":
                             limitation_names = effect["limitation_names"]
                             holomem_targets = [holomem for holomem in holomem_targets if any(name in holomem["card_names"] for name in limitation_names)]
-                turn_effect_copy = deepcopy(effect["turn_effect"])
+                turn_effect_copy = copy_effect(effect["turn_effect"])
                 turn_effect_copy["source_card_id"] = effect["source_card_id"]
                 holomem_targets = ids_from_cards(holomem_targets)
                 if len(holomem_targets) == 0:
@@ -3477,7 +4287,7 @@ class GameEngine:
                 other_player = self.other_player(effect_player_id)
                 other_player.block_movement_for_turn = True
             case EffectType.EffectType_Choice:
-                choice = deepcopy(effect["choice"])
+                choice = copy_effects(effect["choice"])
                 if self.take_damage_state:
                     for choice_effect in choice:
                         choice_effect["incoming_damage_info"] = {
@@ -3840,7 +4650,7 @@ class GameEngine:
                     case "all":
                         holomems = effect_player.get_holomem_on_stage()
                 num_of_stacked_cards = len([card for holomem in holomems for card in holomem["stacked_cards"] if is_card_holomem(card)])
-                effect_copy = deepcopy(effect)
+                effect_copy = copy_effect(effect)
                 effect_copy["amount"] *= num_of_stacked_cards
                 effect_copy["effect_type"] = EffectType.EffectType_DealDamage
                 self.add_effects_to_front([effect_copy])
@@ -3959,7 +4769,7 @@ class GameEngine:
                 choices = []
                 for i in range(starts_at, max_count + 1):
                     # Populate the "amount": "X"/"multiX" fields.
-                    new_choice = deepcopy(template_choice)
+                    new_choice = copy_effect(template_choice)
                     if "amount" in new_choice:
                         match new_choice["amount"]:
                             case "multiX":
@@ -3971,6 +4781,7 @@ class GameEngine:
                             case "X":
                                 new_choice["cost"] = i
                     if "pre_effects" in new_choice:
+                        new_choice["pre_effects"] = copy_effects(new_choice["pre_effects"])
                         for pre_effect in new_choice["pre_effects"]:
                             if "amount" in pre_effect:
                                 match pre_effect["amount"]:
@@ -3979,6 +4790,7 @@ class GameEngine:
                                     case "X":
                                         pre_effect["amount"] = i
                     if "and" in new_choice:
+                        new_choice["and"] = copy_effects(new_choice["and"])
                         for and_effect in new_choice["and"]:
                             if "amount" in and_effect:
                                 match and_effect["amount"]:
@@ -4064,7 +4876,7 @@ class GameEngine:
                 die_effects = effect["die_effects"]
                 roll_effects = []
                 for _ in range(amount):
-                    roll_effects.extend(deepcopy(die_effects))
+                    roll_effects.extend(copy_effects(die_effects))
 
                 add_ids_to_effects(roll_effects, effect_player_id, effect["source_card_id"])
                 self.add_effects_to_front(roll_effects)
@@ -4377,7 +5189,7 @@ class GameEngine:
             case EffectType.EffectType_RollDie:
                 # Put the actual roll in front on the queue, but
                 # check afterwards to see if we should add any more effects up front.
-                rolldie_internal_effect = deepcopy(effect)
+                rolldie_internal_effect = copy_effect(effect)
                 rolldie_internal_effect["effect_type"] = EffectType.EffectType_RollDie_Internal
                 rolldie_internal_effect["internal_skip_simultaneous_choice"] =  True
                 # Remove the and effects because they were already processed.
@@ -4434,7 +5246,7 @@ class GameEngine:
                 # Add the resolution to the front of the queue.
                 # This will check last_die_value to see what happens.
                 # However process any after die roll effects first.
-                rolldie_resolution_effect = deepcopy(effect)
+                rolldie_resolution_effect = copy_effect(effect)
                 rolldie_resolution_effect["effect_type"] = EffectType.EffectType_RollDie_Internal_Resolution
                 rolldie_resolution_effect["internal_skip_simultaneous_choice"] =  True
                 self.add_effects_to_front([rolldie_resolution_effect])
@@ -4450,7 +5262,7 @@ class GameEngine:
                 for die_effects_option in die_effects:
                     activate_on_values = die_effects_option["activate_on_values"]
                     if self.last_die_value in activate_on_values:
-                        effects_to_resolve = die_effects_option["effects"]
+                        effects_to_resolve = copy_effects(die_effects_option["effects"])
                         break
                 if effects_to_resolve:
                     # Push these effects onto the front of the effect list.
@@ -5077,6 +5889,7 @@ class GameEngine:
             for player in self.player_states:
                 player_info_str += f"{player.username}({player.player_id}),"
             logger.error(f"Player info: {player_info_str}")
+        self.update_observer_snapshot()
 
     def validate_mulligan(self, player_id:str, action_data: dict):
         if self.phase != GamePhase.Mulligan:
@@ -5529,7 +6342,7 @@ class GameEngine:
         if is_event_card_whit_magic_tag_limited(card):
             player.event_card_whit_magic_tag = True
 
-        card_effects = card["effects"]
+        card_effects = copy_effects(card["effects"])
         add_ids_to_effects(card_effects, player.player_id, card_id)
         self.floating_cards.append(card)
         
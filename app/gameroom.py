@@ -1,13 +1,17 @@
+import asyncio
 import traceback
 import json
 import os
+import random
 import time
 from typing import List
-from app.playermanager import Player
-from app.gameengine import GameEngine, GameAction, EventType
+from app.playermanager import Player, GameEventFrames
+from app.gameengine import GameEngine, GameAction
+from app.enginepool import EnginePool, EngineProcessLost, EngineStep, RoomEngine
+from app.message_types import ErrorMessage
 from app.card_database import CardDatabase
-from app.aiplayer import AIPlayer, DefaultAIDeck
-from app.dbaccess import upload_match_to_blob_storage
+from app.dbaccess import MATCH_LOG_FORMAT, get_match_log_path, match_log_writer
+from app.matchlog import MATCH_LOG_EXTENSION
 import logging
 logger = logging.getLogger(__name__)
 
@@ -15,13 +19,32 @@ logger = logging.getLogger(__name__)
 EMOTE_COOLDOWN_MS = 2000  # 2초 쿨다운
 VALID_EMOTE_IDS = [0, 1, 2, 3, 4]  # 허용된 감정표현 ID
 
+# How long the AI can act before its room gives the event loop to everyone else, 0 gives it up
+# after every action.
+AI_TIME_BUDGET_SECONDS = float(os.getenv("AI_TIME_BUDGET_MS", "5")) / 1000
+
+def send_observer_dropped(player : Player):
+    message = ErrorMessage(
+        message_type="error",
+        error_id="observer_dropped",
+        error_message="ERROR: Stopped observing, the connection could not keep up with the game.",
+    )
+    player.outbound.put(message.to_json())
+
+def send_room_closed(player : Player):
+    message = ErrorMessage(
+        message_type="error",
+        error_id="room_closed",
+        error_message="ERROR: The match ended, its game server stopped.",
+    )
+    player.outbound.put(message.to_json())
+
 class GameRoom:
     def __init__(self, room_id : str, room_name : str, players : List[Player], game_type : str, queue_name : str):
         self.room_id = room_id
         self.room_name = room_name
         self.players = players
         self.observers : List[Player] = []
-        self.ai_player = None
         self.game_type = game_type
         self.queue_name = queue_name
         self.cleanup_room = False
@@ -30,9 +53,29 @@ class GameRoom:
         for player in self.players:
             player.current_game_room = self
 
+        # Everything that touches the engine runs as an action, one at a time in arrival order.
+        # Events are queued on each recipient's connection, so actions never wait on sends.
+        self.actions = asyncio.Queue()
+        self.action_worker = None
+        self.closed = False
+
+        # The engine runs here, or in an engine process when the room was started with a pool.
+        self.room_engine : RoomEngine = None
+        self.engine : GameEngine = None
+        self.engine_pool : EnginePool = None
+        self.game_over = False
+
+        # How long engine calls held up the event loop, engine processes don't.
+        self.engine_calls = 0
+        self.loop_blocking_seconds = 0
+        self.max_loop_blocking_seconds = 0
+
     def is_ai_game(self):
         return self.game_type == "ai"
 
+    def saves_match_log(self):
+        return not self.is_ai_game() and not os.getenv("DONT_UPLOAD_MATCHES")
+
     def get_room_name(self):
         return self.room_name
 
@@ -45,61 +88,137 @@ class GameRoom:
             "players": [player.get_public_player_info() for player in self.players],
         }
 
-    async def start(self, card_db: CardDatabase):
+    def start_workers(self):
+        if self.action_worker is None:
+            self.action_worker = asyncio.create_task(self.process_actions())
+
+    def shutdown(self):
+        # Queued actions finish first, then the worker stops.
+        if not self.closed:
+            self.closed = True
+            self.actions.put_nowait(None)
+
+    async def run_action(self, action, *args):
+        if self.closed:
+            logger.info(f"Room {self.room_id} is closed, ignoring {action.__name__}")
+            return None
+        self.start_workers()
+        future = asyncio.get_running_loop().create_future()
+        self.actions.put_nowait((action, args, future))
+        return await future
+
+    async def process_actions(self):
+        while True:
+            queued_action = await self.actions.get()
+            if queued_action is None:
+                if self.engine_pool:
+                    self.engine_pool.remove_room_engine(self.room_id)
+                elif self.room_engine:
+                    self.room_engine.close()
+                return
+            action, args, future = queued_action
+            try:
+                result = await action(*args)
+                if not future.cancelled():
+                    future.set_result(result)
+            except EngineProcessLost as e:
+                self.end_lost_game(e)
+                if not future.cancelled():
+                    future.set_result(None)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+
+    def end_lost_game(self, error : EngineProcessLost):
+        # Nothing is left to play or save, the room is cleaned up after the action that found out.
+        if self.cleanup_room:
+            return
+        logger.error(f"Room {self.room_id} lost its engine, ending the match: {error}")
+        self.game_over = True
+        self.cleanup_room = True
+        for player in self.players + self.observers:
+            send_room_closed(player)
+
+    async def call_engine(self, method : str, *args):
+        if self.engine_pool:
+            return await self.engine_pool.call(self.room_id, method, *args)
+        start = time.perf_counter()
+        result = getattr(self.room_engine, method)(*args)
+        elapsed = time.perf_counter() - start
+        self.engine_calls += 1
+        self.loop_blocking_seconds += elapsed
+        self.max_loop_blocking_seconds = max(self.max_loop_blocking_seconds, elapsed)
+        return result
+
+    async def run_engine_steps(self, method : str, *args):
+        # The AI acts until its time budget is spent, then other rooms and connections get the
+        # event loop before it goes on. Actions for this room still wait for the AI to finish.
+        steps, ai_action = await self.call_engine(method, *args, bool(self.observers), AI_TIME_BUDGET_SECONDS)
+        self.send_engine_steps(steps)
+        while ai_action and not self.game_over:
+            await asyncio.sleep(0)
+            steps, ai_action = await self.call_engine("handle_game_message", ai_action["player_id"], ai_action["action_type"], ai_action["action_data"], bool(self.observers), AI_TIME_BUDGET_SECONDS)
+            self.send_engine_steps(steps)
+
+    def get_engine_metrics(self):
+        return {
+            "room_id": self.room_id,
+            "game_type": self.game_type,
+            "engine_process": self.engine_pool is not None,
+            "engine_calls": self.engine_calls,
+            "loop_blocking_seconds": self.loop_blocking_seconds,
+            "max_loop_blocking_seconds": self.max_loop_blocking_seconds,
+        }
+
+    def send_engine_steps(self, steps : List[EngineStep]):
+        for step in steps:
+            self.send_events(step)
+            self.send_observer_events(step.observer_event_jsons)
+        if steps:
+            self.game_over = steps[-1].game_over
+
+    def is_game_over(self):
+        return self.game_over
+
+    async def start(self, card_db: CardDatabase, engine_pool : EnginePool = None):
+        await self.run_action(self.apply_start, card_db, engine_pool)
+
+    async def apply_start(self, card_db: CardDatabase, engine_pool : EnginePool = None):
         logger.info(f"GAME: Starting game ({self.room_id}) Players ({[player.get_username() for player in self.players]}) Ids ({[player.player_id for player in self.players]})")
         player_info = [player.get_player_game_info() for player in self.players]
-        if self.is_ai_game():
-            logger.info(f"AI GAME: Creating AI player for game {self.room_id}")
-            self.ai_player = AIPlayer(player_id="aiplayer" + self.players[0].player_id)
-            self.ai_player.set_deck(DefaultAIDeck)
-            player_info.append(self.ai_player.get_player_game_info())
-            logger.info(f"AI GAME: AI player created with ID {self.ai_player.player_id}")
-
-        self.engine = GameEngine(
-            card_db=card_db,
-            player_infos=player_info,
-            game_type=self.game_type
-        )
-
-        self.engine.begin_game()
-        events = self.engine.grab_events()
-        await self.send_events(events)
-        observer_events = self.engine.grab_observer_events()
-        await self.send_observer_events(observer_events)
-
-        if self.is_ai_game():
-            logger.info(f"AI GAME: Processing AI actions for game {self.room_id}")
-            # In case the AI has to mulligan first!
-            ai_performing_action, ai_action = self.ai_player.ai_process_events(events)
-            logger.info(f"AI GAME: AI action result - performing: {ai_performing_action}, action: {ai_action}")
-            #logger.info("AI Action: %s %s" % (ai_performing_action, ai_action))
-            if ai_performing_action:
-                player_id = self.ai_player.player_id
-                action_type = ai_action["action_type"]
-                action_data = ai_action["action_data"]
-
-                await self.handle_game_message(player_id, action_type, action_data)
-
-    async def send_events(self, events):
-        for event in events:
-            for player in self.players:
-                if player.connected and player.player_id == event["event_player_id"]:
-                    await player.send_game_event(event)
-
-    async def send_observer_events(self, events):
-        for event in events:
-            for player in self.observers:
-                if player.connected:
-                    await player.send_game_event(event)
-
-    async def send_emote_events(self, events):
-        """감정표현 이벤트를 모든 플레이어에게 전송"""
-        for event in events:
-            for player in self.players:
-                if player.connected:
-                    await player.send_game_event(event)
+        match_log_path = None
+        if self.saves_match_log() and MATCH_LOG_FORMAT == "compact":
+            match_log_path = get_match_log_path(player_info, MATCH_LOG_EXTENSION)
+        if engine_pool:
+            # The engine lives in an engine process, the seed still comes from this one.
+            self.engine_pool = engine_pool
+            seed = random.randint(0, 2**32 - 1)
+            await engine_pool.create_room_engine(self.room_id, player_info, self.game_type, seed, match_log_path)
+        else:
+            self.room_engine = RoomEngine(card_db, self.room_id, player_info, self.game_type, match_log_path=match_log_path)
+            self.engine = self.room_engine.engine
+
+        await self.run_engine_steps("begin_game")
+
+    def send_events(self, step : EngineStep):
+        # Each player gets their events from this step together.
+        for player in self.players:
+            if player.connected:
+                player.queue_game_events(GameEventFrames(step.player_event_jsons[player.player_id]))
+
+    def send_observer_events(self, event_jsons : List[str]):
+        frames = None
+        # Slow observers get dropped while queueing.
+        for player in list(self.observers):
+            if player.connected:
+                if frames is None:
+                    frames = GameEventFrames(event_jsons)
+                player.queue_game_events(frames)
 
     async def handle_game_message(self, player_id: str, action_type:str, action_data: dict):
+        await self.run_action(self.apply_game_message, player_id, action_type, action_data)
+
+    async def apply_game_message(self, player_id: str, action_type:str, action_data: dict):
         for observer in self.observers:
             if player_id == observer.player_id:
                 # Assume any message from an observer is them leaving.
@@ -107,7 +226,7 @@ class GameRoom:
                 self.observers.remove(observer)
                 return
 
-        if self.engine.is_game_over():
+        if self.game_over:
             logger.info(f"Room {self.room_id} already game over, ignoring message player {player_id} action {action_type} data {action_data}")
             return
 
@@ -115,35 +234,28 @@ class GameRoom:
         for player in self.observers + self.players:
             player.last_seen = time.time()
 
-        done_processing = False
-        while not done_processing and not self.engine.is_game_over():
-            self.engine.handle_game_message(player_id, action_type, action_data)
-            events = self.engine.grab_events()
-            await self.send_events(events)
-            observer_events = self.engine.grab_observer_events()
-            await self.send_observer_events(observer_events)
-            if self.is_ai_game():
-                ai_performing_action, ai_action = self.ai_player.ai_process_events(events)
-                #logger.info("AI Action: %s %s" % (ai_performing_action, ai_action))
-                if ai_performing_action:
-                    player_id = self.ai_player.player_id
-                    action_type = ai_action["action_type"]
-                    action_data = ai_action["action_data"]
-                else:
-                    done_processing = True
-            else:
-                done_processing = True
-
-        if self.engine.is_game_over():
+        await self.run_engine_steps("handle_game_message", player_id, action_type, action_data)
+
+        if self.game_over:
             logger.info("ROOM: %s Game over!" % self.room_id)
-            if not self.is_ai_game() and not os.getenv("DONT_UPLOAD_MATCHES"):
-                match_data = self.engine.get_match_log()
+            if self.saves_match_log() and MATCH_LOG_FORMAT == "compact":
+                saved_log = await self.call_engine("finish_match_log", {"queue_name": self.queue_name})
+                if saved_log:
+                    await match_log_writer.index(*saved_log)
+            elif self.saves_match_log():
+                match_data = await self.call_engine("get_match_log")
                 if match_data["turn_number"] >= 0:
+                    # Copies of the histories, emotes can still be added while it is saved.
+                    match_data["all_events"] = list(match_data["all_events"])
+                    match_data["all_game_messages"] = list(match_data["all_game_messages"])
                     match_data["queue_name"] = self.queue_name
-                    upload_match_to_blob_storage(match_data)
+                    await match_log_writer.write(match_data)
             self.cleanup_room = True
 
     async def handle_emote_message(self, player_id: str, emote_id: int):
+        await self.run_action(self.apply_emote_message, player_id, emote_id)
+
+    async def apply_emote_message(self, player_id: str, emote_id: int):
         """감정표현 메시지 처리"""
         current_time = time.time() * 1000  # 밀리초 단위
         
@@ -162,37 +274,42 @@ class GameRoom:
         # 쿨다운 업데이트
         self.player_emote_cooldowns[player_id] = current_time
         
-        # 게임 엔진을 통해 감정표현 이벤트 생성
-        self.engine.handle_emote(player_id, emote_id)
-        
-        # 게임 엔진에서 생성된 이벤트들을 가져와서 브로드캐스트
-        events = self.engine.grab_events()
-        await self.send_emote_events(events)  # 감정표현 전용 전송 메서드 사용
-        observer_events = self.engine.grab_observer_events()
-        await self.send_observer_events(observer_events)
+        # 게임 엔진을 통해 감정표현 이벤트 생성, 모든 플레이어에게 브로드캐스트
+        step = await self.call_engine("handle_emote", player_id, emote_id, bool(self.observers))
+        self.send_engine_steps([step])
         
         logger.info(f"Emote sent: player {player_id} sent emote {emote_id}")
 
     def is_ready_for_cleanup(self):
         return self.cleanup_room
 
-    async def join_as_observer(self, player: Player):
+    async def join_as_observer(self, player: Player, from_snapshot : bool = False):
+        await self.run_action(self.apply_join_as_observer, player, from_snapshot)
+
+    async def apply_join_as_observer(self, player: Player, from_snapshot : bool):
         self.observers.append(player)
         player.current_game_room = self
 
-        await self.observer_request_next_events(player, 0)
+        if from_snapshot:
+            event_jsons = await self.call_engine("get_observer_snapshot_events")
+            player.queue_game_events(GameEventFrames(event_jsons))
+        else:
+            await self.apply_observer_request_next_events(player, 0)
 
     async def observer_request_next_events(self, player: Player, starting_event_index):
-        events = self.engine.get_observer_catchup_events()
+        await self.run_action(self.apply_observer_request_next_events, player, starting_event_index)
 
-        # Only send the next 50 events.
-        ending_event_index = starting_event_index + 50
-        for event in events[starting_event_index:ending_event_index]:
-            await player.send_game_event(event)
+    async def apply_observer_request_next_events(self, player: Player, starting_event_index):
+        event_jsons = await self.call_engine("get_observer_catchup_events", starting_event_index)
+        player.queue_game_events(GameEventFrames(event_jsons))
 
-        # If this is the end, send the catch up event.
-        if ending_event_index >= len(events):
-            await player.send_game_event({"event_type": EventType.EventType_ObserverCaughtUp})
+    def drop_observer(self, player: Player):
+        # For observers that can't keep up, they can start watching again from a catch up.
+        logger.info(f"Dropping slow observer {player.get_username()} - {player.player_id} from Room {self.room_id}")
+        if player in self.observers:
+            self.observers.remove(player)
+        player.current_game_room = None
+        send_observer_dropped(player)
 
 
     async def handle_player_quit(self, player: Player):
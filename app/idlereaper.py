@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import time
+import traceback
+from typing import Dict
+from app.playermanager import Player
+import logging
+logger = logging.getLogger(__name__)
+
+class IdleReaper:
+    # Background task that removes players that haven't sent anything for `timeout` seconds.
+    # Players are kept in a heap ordered by when they would time out. Sending a message only updates
+    # player.last_seen, entries are moved to the new deadline when they come up, so each run only
+    # touches the players whose deadline has passed.
+    def __init__(self, timeout, on_idle, max_sleep):
+        self.timeout = timeout
+        # Awaited with each idle player, after it stopped being tracked.
+        self.on_idle = on_idle
+        self.max_sleep = max_sleep
+
+        self.players : Dict[str, Player] = {}
+        self.deadlines = []
+
+        self.runs = 0
+        self.players_reaped = 0
+        self.deadlines_moved = 0
+        self.last_run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    def track(self, player : Player):
+        if player.player_id in self.players:
+            return
+        self.players[player.player_id] = player
+        heapq.heappush(self.deadlines, (player.last_seen + self.timeout, player.player_id))
+
+    def untrack(self, player : Player):
+        # The heap entry is dropped when it comes up.
+        self.players.pop(player.player_id, None)
+
+    def get_sleep_time(self):
+        if not self.deadlines:
+            return self.max_sleep
+        return min(self.max_sleep, max(0, self.deadlines[0][0] - time.time()))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.get_sleep_time())
+            try:
+                await self.reap()
+            except Exception as e:
+                error_details = traceback.format_exc()
+                logger.error(f"Error reaping idle players: {e} Callstack: {error_details}")
+
+    async def reap(self):
+        start = time.perf_counter()
+        now = time.time()
+        idle_players = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, player_id = heapq.heappop(self.deadlines)
+            player = self.players.get(player_id)
+            if player is None:
+                continue
+            deadline = player.last_seen + self.timeout
+            if deadline > now:
+                heapq.heappush(self.deadlines, (deadline, player_id))
+                self.deadlines_moved += 1
+            else:
+                idle_players.append(player)
+
+        # Their heap entries are already gone, so one failing doesn't keep the rest from being removed.
+        for player in idle_players:
+            try:
+                self.untrack(player)
+                await self.on_idle(player)
+            except Exception as e:
+                error_details = traceback.format_exc()
+                logger.error(f"Error removing idle player {player.player_id}: {e} Callstack: {error_details}")
+
+        self.runs += 1
+        self.players_reaped += len(idle_players)
+        self.last_run_seconds = time.perf_counter() - start
+        self.max_run_seconds = max(self.max_run_seconds, self.last_run_seconds)
+        if idle_players:
+            logger.info(f"Idle reaper removed {len(idle_players)} players in {self.last_run_seconds:.3f}s, {len(self.players)} players tracked")
+        return idle_players
+
+    def get_metrics(self):
+        return {
+            "tracked_players": len(self.players),
+            "heap_size": len(self.deadlines),
+            "runs": self.runs,
+            "players_reaped": self.players_reaped,
+            "deadlines_moved": self.deadlines_moved,
+            "last_run_seconds": self.last_run_seconds,
+            "max_run_seconds": self.max_run_seconds,
+        }
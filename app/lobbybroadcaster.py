@@ -0,0 +1,138 @@
+import asyncio
+import os
+import traceback
+from app.playermanager import Player, PlayerManager
+from app.matchmaking import Matchmaking
+from app.message_types import ServerInfoDeltaMessage
+import logging
+logger = logging.getLogger(__name__)
+
+# Lobby changes within this window (seconds) are sent together.
+LOBBY_BROADCAST_DELAY = float(os.getenv("LOBBY_BROADCAST_DELAY", "0.25"))
+
+class LobbyBroadcaster:
+    # Sends the lobby state (players, rooms, queues) to connected players.
+    # Changes are coalesced over a short window, then sent once as a versioned delta to clients
+    # that support it and as a full server_info to the others.
+    # Delta clients get a full snapshot when they join or ask for a resync.
+    # With a cluster, this worker's players and rooms are published for the other workers and
+    # theirs are shown too.
+    def __init__(self, player_manager : PlayerManager, matchmaking : Matchmaking, game_rooms, delay = LOBBY_BROADCAST_DELAY, cluster = None):
+        self.player_manager = player_manager
+        self.matchmaking = matchmaking
+        self.game_rooms = game_rooms
+        self.delay = delay
+        self.cluster = cluster
+
+        self.version = 0
+        # The state as of self.version.
+        self.players_info = {}
+        self.rooms_info = {}
+        self.queue_info = []
+
+        self.snapshot_players = []
+        self.flush_task = None
+        self.flush_lock = asyncio.Lock()
+
+    def request_update(self):
+        # Call after anything the lobby shows has changed.
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    def request_snapshot(self, player : Player):
+        # Sent with the next flush, so the snapshot and the deltas after it line up.
+        if player not in self.snapshot_players:
+            self.snapshot_players.append(player)
+        self.request_update()
+
+    async def flush_later(self):
+        await asyncio.sleep(self.delay)
+        # Anything that changes while this flush is sending goes in the next one.
+        self.flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            error_details = traceback.format_exc()
+            logger.error(f"Error broadcasting lobby update: {e} Callstack: {error_details}")
+
+    def get_lobby_state(self):
+        players_info = {player_id: player.get_public_player_info() for player_id, player in self.player_manager.active_players.items()}
+        rooms_info = {room.room_id: room.get_room_info() for room in self.game_rooms if not room.is_ai_game()}
+        if self.cluster:
+            self.cluster.publish_lobby_state(players_info, rooms_info)
+            remote_players_info, remote_rooms_info = self.cluster.get_remote_lobby_state()
+            players_info = {**remote_players_info, **players_info}
+            rooms_info = {**remote_rooms_info, **rooms_info}
+        return players_info, rooms_info, self.matchmaking.get_queue_info()
+
+    async def flush(self):
+        async with self.flush_lock:
+            players_info, rooms_info, queue_info = self.get_lobby_state()
+            delta = self.update_state(players_info, rooms_info, queue_info)
+            snapshot_players, self.snapshot_players = self.snapshot_players, []
+            if not delta and not snapshot_players:
+                return
+
+            full_players = []
+            delta_players = []
+            for player in self.player_manager.active_players.values():
+                if player in snapshot_players:
+                    continue
+                if not player.lobby_deltas:
+                    full_players.append(player)
+                elif player.lobby_version is not None:
+                    delta_players.append(player)
+
+            if delta and delta_players:
+                self.player_manager.send_to_players(delta_players, delta.to_json())
+            for player in delta_players:
+                player.lobby_version = self.version
+
+            # Players without delta support always get everything.
+            if not delta:
+                full_players = []
+            full_players += snapshot_players
+            if full_players:
+                room_info = list(self.rooms_info.values())
+                players_info = list(self.players_info.values())
+                self.player_manager.send_server_info(full_players, self.queue_info, room_info, players_info, self.version)
+                for player in full_players:
+                    player.lobby_version = self.version
+
+    def update_state(self, players_info, rooms_info, queue_info):
+        # Returns the delta from the last version to this state, None if nothing changed.
+        players_added, players_changed = get_added_and_changed(self.players_info, players_info)
+        players_removed = [player_id for player_id in self.players_info if player_id not in players_info]
+        rooms_opened, rooms_changed = get_added_and_changed(self.rooms_info, rooms_info)
+        rooms_closed = [room_id for room_id in self.rooms_info if room_id not in rooms_info]
+        queue_changed = queue_info != self.queue_info
+        if not (players_added or players_changed or players_removed or rooms_opened or rooms_changed or rooms_closed or queue_changed):
+            return None
+
+        self.version += 1
+        self.players_info = players_info
+        self.rooms_info = rooms_info
+        self.queue_info = queue_info
+        return ServerInfoDeltaMessage(
+            message_type="server_info_delta",
+            base_version=self.version - 1,
+            version=self.version,
+            players_added=players_added,
+            players_changed=players_changed,
+            players_removed=players_removed,
+            rooms_opened=rooms_opened,
+            rooms_changed=rooms_changed,
+            rooms_closed=rooms_closed,
+            queue_info=queue_info if queue_changed else None,
+        )
+
+def get_added_and_changed(old_infos, new_infos):
+    added = []
+    changed = []
+    for info_id, info in new_infos.items():
+        old_info = old_infos.get(info_id)
+        if old_info is None:
+            added.append(info)
+        elif old_info != info:
+            changed.append(info)
+    return added, changed
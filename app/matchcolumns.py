@@ -0,0 +1,226 @@
+"""
+Columnar export of the match logs, for analysis over whole columns instead of dicts.
+
+One row per player in each match. Each column is a file of fixed size values in export_dir and
+manifest.json says how many there are, what they hold and their numpy dtype, so they can be opened
+with numpy.memmap(path, dtype, mode="r", shape=(count,)) as well as with MatchColumns here, which
+memory maps them with the standard library.
+
+The cards in each row's deck and cheer deck are stored as sparse card count vectors, CSR style:
+the row's entries in card_index and card_count run from the previous row's card_end to its own.
+Card indexes are positions in the manifest's card_ids, which start as the CardDatabase's cards in
+order and only grow, so exports stay comparable when cards are added.
+
+Exports are incremental: the manifest keeps the match ids already exported and new rows are
+appended. Run it as new logs come in with:
+    python -m app.matchcolumns [match_logs_dir] [export_dir]
+"""
+
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections import Counter
+from app.card_database import CardDatabase
+from app.matchlog import is_match_log_file, read_match_summary
+import logging
+logger = logging.getLogger(__name__)
+
+MATCH_COLUMNS_DIR = os.getenv("MATCH_COLUMNS_DIR", os.path.join("data", "match_columns"))
+
+MANIFEST_FILE = "manifest.json"
+
+BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+# Name, array typecode and numpy dtype of the columns with a value per row.
+ROW_COLUMNS = [
+    ("match", "I", BYTE_ORDER + "u4"),          # position in the manifest's match_ids
+    ("player_index", "B", "u1"),
+    ("won", "B", "u1"),
+    ("went_first", "B", "u1"),
+    ("oshi", "H", BYTE_ORDER + "u2"),           # card index
+    ("turn_number", "H", BYTE_ORDER + "u2"),
+    ("clock", "f", BYTE_ORDER + "f4"),
+    ("card_end", "Q", BYTE_ORDER + "u8"),       # end of the row's card entries
+]
+
+# Columns with a value per card entry.
+CARD_COLUMNS = [
+    ("card_index", "H", BYTE_ORDER + "u2"),
+    ("card_count", "B", "u1"),
+]
+
+def get_column_path(export_dir : str, name : str):
+    return os.path.join(export_dir, name + ".bin")
+
+def load_manifest(export_dir : str, card_db : CardDatabase = None):
+    # A new export's manifest when there isn't one yet.
+    manifest_path = os.path.join(export_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {
+        "columns": {name: dtype for name, _, dtype in ROW_COLUMNS + CARD_COLUMNS},
+        "row_count": 0,
+        "card_entry_count": 0,
+        "card_ids": list(card_db.cards_by_id) if card_db else [],
+        "match_ids": [],
+    }
+
+def save_manifest(export_dir : str, manifest):
+    # Written after the columns, so values past its counts were never exported and are cut off.
+    temp_path = os.path.join(export_dir, MANIFEST_FILE + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, os.path.join(export_dir, MANIFEST_FILE))
+
+def append_columns(export_dir : str, columns, specs, count : int):
+    for name, typecode, _ in specs:
+        with open(get_column_path(export_dir, name), "ab") as f:
+            f.truncate(count * array(typecode).itemsize)
+            f.write(columns[name].tobytes())
+
+def export_matches(matches, export_dir : str, card_db : CardDatabase):
+    # Appends the matches that aren't exported yet, matches are summaries with a match_id.
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir, card_db)
+    card_indexes = {card_id: card_index for card_index, card_id in enumerate(manifest["card_ids"])}
+    exported_match_ids = set(manifest["match_ids"])
+    columns = {name: array(typecode) for name, typecode, _ in ROW_COLUMNS + CARD_COLUMNS}
+    card_end = manifest["card_entry_count"]
+
+    def get_card_index(card_id):
+        # Cards that aren't in the card database are added at the end.
+        if card_id not in card_indexes:
+            card_indexes[card_id] = len(manifest["card_ids"])
+            manifest["card_ids"].append(card_id)
+        return card_indexes[card_id]
+
+    added = 0
+    for match_data in matches:
+        match_id = match_data["match_id"]
+        if match_id in exported_match_ids:
+            continue
+        exported_match_ids.add(match_id)
+        winner = match_data["winner"]
+        first_turn_player = match_data.get("first_turn_player", match_data["starting_player"])
+        player_clocks = match_data["player_clocks"]
+        for player_index, player in enumerate(match_data["player_info"]):
+            card_counts = Counter()
+            for card_id, card_count in [*player["deck"].items(), *player["cheer_deck"].items()]:
+                card_counts[get_card_index(card_id)] += card_count
+            columns["card_index"].extend(card_counts.keys())
+            columns["card_count"].extend(card_counts.values())
+            card_end += len(card_counts)
+            columns["match"].append(len(manifest["match_ids"]))
+            columns["player_index"].append(player_index)
+            columns["won"].append(player["username"] == winner)
+            columns["went_first"].append(player["username"] == first_turn_player)
+            columns["oshi"].append(get_card_index(player["oshi_id"]))
+            columns["turn_number"].append(match_data["turn_number"])
+            columns["clock"].append(player_clocks[player_index] if player_index < len(player_clocks) else 0)
+            columns["card_end"].append(card_end)
+        manifest["match_ids"].append(match_id)
+        added += 1
+
+    append_columns(export_dir, columns, ROW_COLUMNS, manifest["row_count"])
+    append_columns(export_dir, columns, CARD_COLUMNS, manifest["card_entry_count"])
+    manifest["row_count"] += len(columns["match"])
+    manifest["card_entry_count"] = card_end
+    save_manifest(export_dir, manifest)
+    return added
+
+def export_match_logs(match_logs_dir : str, export_dir : str, card_db : CardDatabase):
+    # Reads only the summaries of the logs that aren't exported yet.
+    exported_match_ids = set(load_manifest(export_dir)["match_ids"])
+
+    def read_new_matches():
+        for file_name in sorted(os.listdir(match_logs_dir)):
+            if not is_match_log_file(file_name) or file_name in exported_match_ids:
+                continue
+            file_path = os.path.join(match_logs_dir, file_name)
+            try:
+                match_data = read_match_summary(file_path)
+            except Exception as e:
+                logger.error(f"Could not read match log {file_path}: {e}")
+                continue
+            yield {**match_data, "match_id": file_name}
+
+    return export_matches(read_new_matches(), export_dir, card_db)
+
+class MatchColumns:
+    # An export's columns as read only memoryviews over memory mapped files.
+    def __init__(self, export_dir : str):
+        manifest = load_manifest(export_dir)
+        self.card_ids = manifest["card_ids"]
+        self.match_ids = manifest["match_ids"]
+        self.row_count = manifest["row_count"]
+        self.maps = []
+        self.views = []
+        for specs, count in [(ROW_COLUMNS, self.row_count), (CARD_COLUMNS, manifest["card_entry_count"])]:
+            for name, typecode, _ in specs:
+                setattr(self, name, self.map_column(get_column_path(export_dir, name), typecode, count))
+
+    def map_column(self, path : str, typecode : str, count : int):
+        if not count:
+            return memoryview(array(typecode))
+        with open(path, "rb") as f:
+            column_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(column_map)
+        # Every view of the map is released before it is closed.
+        self.views.append(memoryview(column_map))
+        self.views.append(self.views[-1].cast(typecode))
+        self.views.append(self.views[-1][:count])
+        return self.views[-1]
+
+    def get_row_cards(self, row : int):
+        # The card indexes in the row's deck and cheer deck.
+        return self.card_index[self.card_end[row - 1] if row else 0:self.card_end[row]]
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        for column_map in self.maps:
+            column_map.close()
+        self.views = []
+        self.maps = []
+
+def card_win_rate_deltas(columns : MatchColumns, min_games : int = 0):
+    # Each card's win percentage in the decks that have it, and how far that is from the decks that
+    # don't, None when every deck has it. Sorted by the difference, highest first.
+    card_games = Counter()
+    card_wins = Counter()
+    for row, won in enumerate(columns.won):
+        cards = columns.get_row_cards(row)
+        card_games.update(cards)
+        if won:
+            card_wins.update(cards)
+    total_wins = sum(columns.won)
+    rows = []
+    for card_index, games in card_games.items():
+        if games < min_games:
+            continue
+        wins = card_wins[card_index]
+        other_games = columns.row_count - games
+        win_percentage = wins / games * 100
+        delta = win_percentage - (total_wins - wins) / other_games * 100 if other_games else None
+        rows.append((columns.card_ids[card_index], games, win_percentage, delta))
+    rows.sort(key=lambda row: row[3] if row[3] is not None else float("-inf"), reverse=True)
+    return rows
+
+def card_cooccurrence(columns : MatchColumns):
+    # How many decks have both cards, by pairs of card indexes with the lower index first.
+    pairs = Counter()
+    for row in range(columns.row_count):
+        cards = sorted(columns.get_row_cards(row))
+        for i, card in enumerate(cards):
+            pairs.update((card, other_card) for other_card in cards[i + 1:])
+    return pairs
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    match_logs_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "tests", "match_logs")
+    export_dir = sys.argv[2] if len(sys.argv) > 2 else MATCH_COLUMNS_DIR
+    added = export_match_logs(match_logs_dir, export_dir, CardDatabase())
+    print(f"Exported {added} match logs from {match_logs_dir} to {export_dir}")
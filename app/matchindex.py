@@ -0,0 +1,176 @@
+"""
+SQLite index of the saved match logs.
+
+One row per match with what the download and analysis scripts look up (when it was saved, queue,
+winner, reason, turns) and one per player in it (username, oshi, decks, clock, final life), so
+finding matches by date, player or oshi doesn't open every log. Rows are added as logs are saved.
+
+Logs saved before there was an index, or whose row couldn't be written, are added before the
+download and analysis scripts query it. They can also be added with:
+    python -m app.matchindex
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from app.matchlog import is_match_log_file, read_match_summary
+import logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    saved_at REAL NOT NULL,
+    queue_name TEXT,
+    game_type TEXT,
+    winner TEXT,
+    game_over_reason TEXT,
+    turn_number INTEGER,
+    starting_player TEXT,
+    first_turn_player TEXT,
+    seed INTEGER
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id TEXT NOT NULL,
+    player_index INTEGER NOT NULL,
+    username TEXT,
+    oshi_id TEXT,
+    deck TEXT,
+    cheer_deck TEXT,
+    clock REAL,
+    final_life INTEGER,
+    PRIMARY KEY (match_id, player_index)
+);
+CREATE INDEX IF NOT EXISTS matches_saved_at ON matches (saved_at);
+CREATE INDEX IF NOT EXISTS match_players_username ON match_players (username);
+CREATE INDEX IF NOT EXISTS match_players_oshi_id ON match_players (oshi_id);
+"""
+
+MATCH_COLUMNS = ["match_id", "saved_at", "queue_name", "game_type", "winner", "game_over_reason", "turn_number", "starting_player", "first_turn_player", "seed"]
+
+class MatchIndex:
+    # Each call has its own connection, so the index can be used from any thread or process.
+    def __init__(self, db_path : str):
+        self.db_path = db_path
+        self.created = False
+
+    def connect(self):
+        if not self.created:
+            self.create()
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self):
+        # Once, on first use. WAL is kept in the database file, the schema only adds what's missing.
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        self.created = True
+
+    def add_match(self, match_id : str, match_data : dict, saved_at : float = None):
+        # match_id is the log's file name in the match logs directory.
+        saved_at = time.time() if saved_at is None else saved_at
+        player_clocks = match_data.get("player_clocks", [])
+        player_final_life = match_data.get("player_final_life", [])
+        seed = match_data.get("seed")
+        with closing(self.connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                match_id,
+                saved_at,
+                match_data.get("queue_name"),
+                match_data.get("game_type"),
+                match_data.get("winner"),
+                match_data.get("game_over_reason"),
+                match_data.get("turn_number"),
+                match_data.get("starting_player"),
+                match_data.get("first_turn_player"),
+                int(seed) if seed is not None else None,
+            ))
+            connection.execute("DELETE FROM match_players WHERE match_id = ?", (match_id,))
+            connection.executemany("INSERT INTO match_players VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(
+                match_id,
+                player_index,
+                player.get("username"),
+                player.get("oshi_id"),
+                json.dumps(player.get("deck", {})),
+                json.dumps(player.get("cheer_deck", {})),
+                player_clocks[player_index] if player_index < len(player_clocks) else None,
+                int(player_final_life[player_index]) if player_index < len(player_final_life) else None,
+            ) for player_index, player in enumerate(match_data["player_info"])])
+
+    def find_matches(self, start_time : float = None, end_time : float = None, username : str = None, oshi_id : str = None):
+        # Oldest first. Each match looks like a match log without its events, messages and card map.
+        conditions = []
+        params = []
+        if start_time is not None:
+            conditions.append("matches.saved_at >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("matches.saved_at <= ?")
+            params.append(end_time)
+        for column, value in [("username", username), ("oshi_id", oshi_id)]:
+            if value is not None:
+                conditions.append(f"matches.match_id IN (SELECT match_id FROM match_players WHERE {column} = ?)")
+                params.append(value)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        query = f"""
+            SELECT {", ".join("matches." + column for column in MATCH_COLUMNS)},
+                match_players.username, match_players.oshi_id, match_players.deck, match_players.cheer_deck,
+                match_players.clock, match_players.final_life
+            FROM matches JOIN match_players ON match_players.match_id = matches.match_id
+            {where}
+            ORDER BY matches.saved_at, matches.match_id, match_players.player_index
+        """
+        matches = []
+        with closing(self.connect()) as connection:
+            for row in connection.execute(query, params):
+                if not matches or matches[-1]["match_id"] != row[0]:
+                    matches.append({
+                        **dict(zip(MATCH_COLUMNS, row)),
+                        "player_info": [],
+                        "player_clocks": [],
+                        "player_final_life": [],
+                    })
+                username, oshi_id, deck, cheer_deck, clock, final_life = row[len(MATCH_COLUMNS):]
+                match = matches[-1]
+                match["player_info"].append({
+                    "username": username,
+                    "oshi_id": oshi_id,
+                    "deck": json.loads(deck),
+                    "cheer_deck": json.loads(cheer_deck),
+                })
+                match["player_clocks"].append(clock)
+                match["player_final_life"].append(str(final_life) if final_life is not None else None)
+        return matches
+
+    def get_match_ids(self):
+        with closing(self.connect()) as connection:
+            return {row[0] for row in connection.execute("SELECT match_id FROM matches")}
+
+    def add_unindexed_logs(self, match_logs_dir : str):
+        # Reads only the summaries of the logs that aren't in the index yet, dated by when the file
+        # was written.
+        match_ids = self.get_match_ids()
+        added = 0
+        for file_name in sorted(os.listdir(match_logs_dir)):
+            if not is_match_log_file(file_name) or file_name in match_ids:
+                continue
+            file_path = os.path.join(match_logs_dir, file_name)
+            try:
+                match_data = read_match_summary(file_path)
+            except Exception as e:
+                logger.error(f"Could not read match log {file_path}: {e}")
+                continue
+            self.add_match(file_name, match_data, os.path.getmtime(file_path))
+            added += 1
+        return added
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from app.dbaccess import MATCH_INDEX_PATH, MATCH_LOGS_DIR
+    match_logs_dir = sys.argv[1] if len(sys.argv) > 1 else MATCH_LOGS_DIR
+    added = MatchIndex(MATCH_INDEX_PATH).add_unindexed_logs(match_logs_dir)
+    print(f"Indexed {added} match logs from {match_logs_dir}")
@@ -0,0 +1,175 @@
+"""
+Compact match log format.
+
+A gzip compressed file of newline delimited JSON records, each a list that starts with its kind:
+    ["s", text]                 adds text to the string table, its index is the number of earlier "s" records
+    ["h", fields]               match fields known when the game starts
+    ["c", {card_id: [game_card_id, ...]}]   all_game_cards_map, grouped by card
+    ["m", flat_message]         a game message, in order
+    ["e", flat_event]           an event, in order
+    ["f", fields]               match fields known when the game ends, written last
+
+Flat messages and events are [key, value, key, value, ...] with each key a string table index. The
+values of INTERNED_FIELDS are string table indexes too, anything that isn't a string there is
+wrapped in a list. Logs are written as the game goes to a temp file and renamed when it ends.
+
+read_match_log reads these and the older pretty printed .json logs into the same dict.
+read_match_summary reads only the fields outside of HISTORY_FIELDS, without parsing the history.
+"""
+
+import gzip
+import json
+import os
+from app.serialization import encode_json
+
+MATCH_LOG_EXTENSION = ".jsonl.gz"
+LEGACY_MATCH_LOG_EXTENSION = ".json"
+
+# Top level event and message fields whose values repeat through a game.
+INTERNED_FIELDS = {
+    "event_type",
+    "event_player_id",
+    "active_player",
+    "player_id",
+    "effect_player_id",
+    "hidden_info_player",
+    "action_type",
+    "card_id",
+    "game_card_id",
+    "target_id",
+}
+
+# gzip's default, logs are written from the engine as the game goes.
+COMPRESS_LEVEL = 6
+
+# What the match log dicts keep outside of the header and footer.
+HISTORY_FIELDS = ["all_events", "all_game_messages", "all_game_cards_map"]
+
+def is_match_log_file(file_name : str):
+    return file_name.endswith(MATCH_LOG_EXTENSION) or file_name.endswith(LEGACY_MATCH_LOG_EXTENSION)
+
+class MatchLogStream:
+    # Writes one game's log as it is played, see the module docstring.
+    def __init__(self, file_path : str):
+        self.file_path = file_path
+        self.temp_path = file_path + ".tmp"
+        self.file = gzip.open(self.temp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+        self.string_indexes = {}
+
+    def intern(self, text : str):
+        index = self.string_indexes.get(text)
+        if index is None:
+            index = len(self.string_indexes)
+            self.string_indexes[text] = index
+            self.write_record("s", text)
+        return index
+
+    def flatten(self, fields : dict):
+        flat = []
+        for key, value in fields.items():
+            flat.append(self.intern(key))
+            if key in INTERNED_FIELDS:
+                value = self.intern(value) if isinstance(value, str) else [value]
+            flat.append(value)
+        return flat
+
+    def write_record(self, kind : str, value):
+        self.file.write(encode_json([kind, value]))
+        self.file.write("\n")
+
+    def write_header(self, match_data : dict):
+        self.write_record("h", {key: value for key, value in match_data.items() if key not in HISTORY_FIELDS})
+        cards_by_card_id = {}
+        for game_card_id, card_id in match_data["all_game_cards_map"].items():
+            cards_by_card_id.setdefault(card_id, []).append(game_card_id)
+        self.write_record("c", cards_by_card_id)
+
+    def append_game_messages(self, game_messages):
+        for game_message in game_messages:
+            self.write_record("m", self.flatten(game_message))
+
+    def append_events(self, events):
+        for event in events:
+            self.write_record("e", self.flatten(event))
+
+    def finish(self, match_data : dict):
+        self.write_record("f", {key: value for key, value in match_data.items() if key not in HISTORY_FIELDS})
+        self.file.close()
+        os.replace(self.temp_path, self.file_path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+def unflatten(flat, strings):
+    fields = dict(zip([strings[key] for key in flat[0::2]], flat[1::2]))
+    for key in INTERNED_FIELDS.intersection(fields):
+        value = fields[key]
+        fields[key] = strings[value] if isinstance(value, int) else value[0]
+    return fields
+
+def read_compact_match_log(text : str):
+    # Encoded JSON has no raw newlines, so the records parse as one list.
+    records = json.loads("[" + text.rstrip("\n").replace("\n", ",") + "]")
+    strings = []
+    match_data = {"all_events": [], "all_game_messages": [], "all_game_cards_map": {}}
+    for kind, value in records:
+        match kind:
+            case "s":
+                strings.append(value)
+            case "e":
+                match_data["all_events"].append(unflatten(value, strings))
+            case "m":
+                match_data["all_game_messages"].append(unflatten(value, strings))
+            case "c":
+                for card_id, game_card_ids in value.items():
+                    for game_card_id in game_card_ids:
+                        match_data["all_game_cards_map"][game_card_id] = card_id
+            case "h" | "f":
+                match_data.update(value)
+    return match_data
+
+def read_match_log(file_path : str):
+    if file_path.endswith(MATCH_LOG_EXTENSION):
+        with open(file_path, "rb") as f:
+            return read_compact_match_log(gzip.decompress(f.read()).decode("utf-8"))
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def find_record_value(text : str, kind : str, last : bool = False):
+    prefix = f'["{kind}",'
+    if text.startswith(prefix) and not last:
+        start = 0
+    else:
+        start = text.rfind("\n" + prefix) if last else text.find("\n" + prefix)
+        if start == -1:
+            return {}
+        start += 1
+    end = text.find("\n", start)
+    return json.loads(text[start:] if end == -1 else text[start:end])[1]
+
+def read_compact_match_summary(text : str):
+    # Only the header and footer records are parsed.
+    return {**find_record_value(text, "h"), **find_record_value(text, "f", last=True)}
+
+def read_legacy_match_summary(text : str):
+    # json.dump with indent=2 starts each top level field on a line indented by exactly two spaces,
+    # and strings can't hold raw newlines, so the fields can be split apart and the history skipped.
+    if not text.startswith('{\n  "'):
+        return {key: value for key, value in json.loads(text).items() if key not in HISTORY_FIELDS}
+    match_data = {}
+    decoder = json.JSONDecoder()
+    for field in text.rstrip()[1:-1].split('\n  "')[1:]:
+        key, end = decoder.raw_decode('"' + field)
+        if key in HISTORY_FIELDS:
+            continue
+        value = field[end - 1:].strip().removeprefix(":").removesuffix(",")
+        match_data[key] = json.loads(value)
+    return match_data
+
+def read_match_summary(file_path : str):
+    if file_path.endswith(MATCH_LOG_EXTENSION):
+        with open(file_path, "rb") as f:
+            return read_compact_match_summary(gzip.decompress(f.read()).decode("utf-8"))
+    with open(file_path, "r", encoding="utf-8") as f:
+        return read_legacy_match_summary(f.read())
@@ -0,0 +1,201 @@
+"""
+Match statistics for analyze_match_data.py.
+
+MatchStats counts games and wins by oshi, card and deck, and two of them merge by adding their
+counts, so match logs are read in chunks across a process pool and the results merged. Only the
+summary fields are read from each log (read_match_summary), never the events.
+
+The counts and the match ids they cover can be saved to a state file, so a later run only reads
+the logs added since. Win rates are reported with a Wilson score interval.
+"""
+
+import json
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from app.matchlog import is_match_log_file, read_match_summary
+import logging
+logger = logging.getLogger(__name__)
+
+# Processes that read match logs, 0 uses one per CPU.
+ANALYZE_PROCESSES = int(os.getenv("ANALYZE_PROCESSES", "0"))
+
+# Match logs read by a process at a time.
+ANALYZE_CHUNK_SIZE = 500
+
+# 95% confidence.
+CONFIDENCE_Z = 1.96
+
+COUNTER_FIELDS = ["oshi_games", "oshi_wins", "card_games", "card_wins", "deck_games", "deck_wins"]
+TOTAL_FIELDS = ["total_games", "first_player_wins", "total_turns", "total_time_used", "total_clocks"]
+
+def get_deck_key(player):
+    # A unique identifier for the deck: the oshi, then the deck and cheer deck card counts.
+    cards = [f"{card_id}:{card_count}" for card_id, card_count in [*player["deck"].items(), *player["cheer_deck"].items()]]
+    return ",".join([player["oshi_id"], *cards])
+
+def wilson_interval(wins : int, games : int, z : float = CONFIDENCE_Z):
+    if not games:
+        return 0.0, 0.0
+    win_rate = wins / games
+    center = win_rate + z * z / (2 * games)
+    margin = z * math.sqrt(win_rate * (1 - win_rate) / games + z * z / (4 * games * games))
+    denominator = 1 + z * z / games
+    return max(0.0, (center - margin) / denominator), min(1.0, (center + margin) / denominator)
+
+class WinRate:
+    # One row of a win rate table.
+    def __init__(self, key : str, wins : int, games : int, usage_games : int):
+        self.key = key
+        self.wins = wins
+        self.games = games
+        self.win_percentage = wins / games * 100 if games else 0
+        self.usage_percentage = games / usage_games * 100 if usage_games else 0
+        low, high = wilson_interval(wins, games)
+        self.low_percentage = low * 100
+        self.high_percentage = high * 100
+
+class MatchStats:
+    def __init__(self):
+        self.total_games = 0
+        self.first_player_wins = 0
+        self.total_turns = 0
+        self.total_time_used = 0.0
+        self.total_clocks = 0
+        self.oshi_games = Counter()
+        self.oshi_wins = Counter()
+        self.card_games = Counter()
+        self.card_wins = Counter()
+        self.deck_games = Counter()
+        self.deck_wins = Counter()
+
+    def add_match(self, match_data):
+        winner = match_data["winner"]
+        starting_player = match_data["starting_player"]
+        first_turn_player = match_data.get("first_turn_player", starting_player)
+        player_clocks = match_data["player_clocks"]
+
+        self.total_games += 1
+        for player in match_data["player_info"]:
+            oshi_id = player["oshi_id"]
+            deck_key = get_deck_key(player)
+            won = player["username"] == winner
+            self.oshi_games[oshi_id] += 1
+            self.deck_games[deck_key] += 1
+            self.card_games.update(player["deck"].keys())
+            if won:
+                self.oshi_wins[oshi_id] += 1
+                self.deck_wins[deck_key] += 1
+                self.card_wins.update(player["deck"].keys())
+
+        if first_turn_player == winner:
+            self.first_player_wins += 1
+        self.total_turns += match_data["turn_number"]
+        self.total_time_used += sum(player_clocks)
+        self.total_clocks += len(player_clocks)
+
+    def merge(self, other : "MatchStats"):
+        for field in TOTAL_FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        for field in COUNTER_FIELDS:
+            getattr(self, field).update(getattr(other, field))
+        return self
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TOTAL_FIELDS + COUNTER_FIELDS}
+
+    @staticmethod
+    def from_dict(data):
+        stats = MatchStats()
+        for field in TOTAL_FIELDS:
+            setattr(stats, field, data[field])
+        for field in COUNTER_FIELDS:
+            setattr(stats, field, Counter(data[field]))
+        return stats
+
+    def average_turns(self):
+        return self.total_turns / self.total_games if self.total_games else 0
+
+    def average_time_per_player(self):
+        return self.total_time_used / self.total_clocks if self.total_clocks else 0
+
+    def first_player_win_percentage(self):
+        return self.first_player_wins / self.total_games * 100 if self.total_games else 0
+
+    def win_rates(self, games : Counter, wins : Counter, usage_games : int):
+        # Sorted by win percentage, highest first.
+        rows = [WinRate(key, wins[key], count, usage_games) for key, count in games.items()]
+        rows.sort(key=lambda row: row.win_percentage, reverse=True)
+        return rows
+
+    def oshi_win_rates(self):
+        return self.win_rates(self.oshi_games, self.oshi_wins, sum(self.oshi_games.values()))
+
+    def card_win_rates(self):
+        # Usage is out of the decks played, two per game.
+        return self.win_rates(self.card_games, self.card_wins, self.total_games * 2)
+
+    def deck_win_rates(self):
+        return self.win_rates(self.deck_games, self.deck_wins, self.total_games)
+
+def read_match_stats(file_paths):
+    # Runs in the pool. Returns the stats and the file names they cover, logs that can't be read are
+    # left out so a later run tries them again.
+    stats = MatchStats()
+    match_ids = []
+    for file_path in file_paths:
+        try:
+            stats.add_match(read_match_summary(file_path))
+        except Exception as e:
+            logger.error(f"Could not read match log {file_path}: {e}")
+            continue
+        match_ids.append(os.path.basename(file_path))
+    return stats, match_ids
+
+def analyze_match_logs(match_logs_dir : str, skip_match_ids = (), processes : int = ANALYZE_PROCESSES):
+    # Reads the logs in the directory that aren't in skip_match_ids.
+    file_paths = [
+        os.path.join(match_logs_dir, file_name)
+        for file_name in sorted(os.listdir(match_logs_dir))
+        if is_match_log_file(file_name) and file_name not in skip_match_ids
+    ]
+    chunks = [file_paths[i:i + ANALYZE_CHUNK_SIZE] for i in range(0, len(file_paths), ANALYZE_CHUNK_SIZE)]
+    if len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes or None) as executor:
+            results = list(executor.map(read_match_stats, chunks))
+    else:
+        results = [read_match_stats(chunk) for chunk in chunks]
+    stats = MatchStats()
+    match_ids = []
+    for chunk_stats, chunk_match_ids in results:
+        stats.merge(chunk_stats)
+        match_ids.extend(chunk_match_ids)
+    return stats, match_ids
+
+def analyze_matches(matches, skip_match_ids = ()):
+    # Matches that are already summaries, like the match index's.
+    stats = MatchStats()
+    match_ids = []
+    for match_data in matches:
+        if match_data.get("match_id") in skip_match_ids:
+            continue
+        stats.add_match(match_data)
+        if "match_id" in match_data:
+            match_ids.append(match_data["match_id"])
+    return stats, match_ids
+
+def load_state(state_path : str):
+    # The stats and match ids from an earlier run, or empty ones.
+    if not os.path.exists(state_path):
+        return MatchStats(), set()
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    return MatchStats.from_dict(state["stats"]), set(state["match_ids"])
+
+def save_state(state_path : str, stats : MatchStats, match_ids):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"stats": stats.to_dict(), "match_ids": sorted(match_ids)}, f, ensure_ascii=False)
+    os.replace(temp_path, state_path)
@@ -1,13 +1,18 @@
-from dataclasses import dataclass, asdict
-from typing import Any, Dict, List
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional
 import json
+from app.serialization import encode_json
 
 @dataclass
 class Message:
     message_type: str
 
-    def as_dict(self) -> str:
-        return asdict(self)
+    def as_dict(self) -> Dict[str, Any]:
+        # Shallow, the values are only read to encode the message.
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    def to_json(self) -> str:
+        return encode_json(self.as_dict())
 
 # Server Outbound Messages
 @dataclass
@@ -17,6 +22,22 @@ class ServerInfoMessage(Message):
     players_info: List[Dict]
     your_id : str
     your_username : str
+    version : int = 0
+
+# Lobby changes since base_version, for clients that joined with lobby_deltas.
+# Added and changed entries are the full player/room info, removed ones are ids.
+@dataclass
+class ServerInfoDeltaMessage(Message):
+    base_version : int
+    version : int
+    players_added: List[Dict]
+    players_changed: List[Dict]
+    players_removed: List[str]
+    rooms_opened: List[Dict]
+    rooms_changed: List[Dict]
+    rooms_closed: List[str]
+    # None if the queues didn't change.
+    queue_info: Optional[List[Dict]] = None
 
 @dataclass
 class ErrorMessage(Message):
@@ -26,11 +47,20 @@ class ErrorMessage(Message):
 # Server Inbound Messages
 @dataclass
 class JoinServerMessage(Message):
+    lobby_deltas: bool = False
+    # Get the events from each game step as one game_event_batch instead of a game_event each.
+    game_event_batches: bool = False
+
+# Sent by delta clients that missed a version, answered with a full server_info.
+@dataclass
+class ResyncServerInfoMessage(Message):
     pass
 
 @dataclass
 class ObserveRoomMessage(Message):
     room_id: str
+    # Start from the latest observer_snapshot instead of catching up from the first event.
+    from_snapshot: bool = False
 
 @dataclass
 class ObserverGetEventsMessage(Message):
@@ -69,6 +99,8 @@ def parse_message(json_data: str) -> Message:
     match message_type:
         case "join_server":
             return JoinServerMessage(**data)
+        case "resync_server_info":
+            return ResyncServerInfoMessage(**data)
         case "join_matchmaking_queue":
             return JoinMatchmakingQueueMessage(**data)
         case "leave_matchmaking_queue":
@@ -0,0 +1,63 @@
+import asyncio
+import os
+from collections import deque
+import logging
+logger = logging.getLogger(__name__)
+
+# How many messages can wait for one connection before it counts as a slow consumer.
+OUTBOUND_QUEUE_LIMIT = int(os.getenv("OUTBOUND_QUEUE_LIMIT", "500"))
+
+class OutboundQueue:
+    # Messages for one connection, written in order by their own task, so a slow connection only
+    # holds up itself. When a message would go past the limit, the waiting messages and that one
+    # are dropped and on_overflow is called, the owner decides what happens to the connection.
+    def __init__(self, websocket, on_overflow, limit = OUTBOUND_QUEUE_LIMIT):
+        self.websocket = websocket
+        self.on_overflow = on_overflow
+        self.limit = limit
+
+        self.messages = deque()
+        self.writer = None
+        self.closed = False
+
+        self.messages_sent = 0
+        self.max_queued = 0
+        self.overflows = 0
+
+    def put(self, message : str):
+        # Returns False if the message won't be sent.
+        if self.closed:
+            return False
+        if len(self.messages) >= self.limit:
+            self.overflows += 1
+            self.messages.clear()
+            self.on_overflow()
+            return False
+
+        self.messages.append(message)
+        self.max_queued = max(self.max_queued, len(self.messages))
+        if self.writer is None:
+            self.writer = asyncio.create_task(self.write_messages())
+        return True
+
+    def close(self):
+        # Anything already queued is dropped, the message being written still goes out.
+        self.closed = True
+        self.messages.clear()
+
+    async def write_messages(self):
+        try:
+            while self.messages:
+                await self.websocket.send_text(self.messages.popleft())
+                self.messages_sent += 1
+        except Exception as e:
+            # The connection is gone, the server's disconnect handling removes the player.
+            logger.info(f"Outbound queue closed after a failed send: {e}")
+            self.close()
+        finally:
+            self.writer = None
+
+    async def drain(self):
+        # Waits until everything queued so far is written.
+        while self.writer is not None:
+            await self.writer
@@ -1,9 +1,13 @@
+import asyncio
 import os
 from fastapi import WebSocket
 from typing import Dict
-from app.message_types import ServerInfoMessage
+from app.serialization import encode_json, extend_json_object
+from app.outboundqueue import OutboundQueue
 import random
 import time
+import logging
+logger = logging.getLogger(__name__)
 
 def generate_username(num_results=1):
     directory_path = os.path.dirname(__file__)
@@ -24,6 +28,23 @@ def generate_username(num_results=1):
 
     return usernames
 
+class GameEventFrames:
+    # The frames for a group of encoded events, built once for everyone that gets the same events.
+    def __init__(self, event_jsons):
+        self.event_jsons = event_jsons
+        self.event_frames = None
+        self.batch_frame = None
+
+    def get_event_frames(self):
+        if self.event_frames is None:
+            self.event_frames = ['{"message_type":"game_event","event_data":' + event_json + '}' for event_json in self.event_jsons]
+        return self.event_frames
+
+    def get_batch_frame(self):
+        if self.batch_frame is None:
+            self.batch_frame = '{"message_type":"game_event_batch","events":[' + ",".join(self.event_jsons) + ']}'
+        return self.batch_frame
+
 class Player:
     def __init__(self, player_id: str, websocket: WebSocket):
         self.player_id = player_id
@@ -38,6 +59,16 @@ class Player:
         self.deck = []
         self.cheer_deck = []
 
+        # Clients that support it get lobby changes as deltas, see LobbyBroadcaster.
+        self.lobby_deltas = False
+        # The lobby version this player has, None until it got a snapshot.
+        self.lobby_version = None
+        # Clients that support it get the events from each game step in one frame.
+        self.game_event_batches = False
+
+        # Game events are queued here, so game rooms don't wait on this connection.
+        self.outbound = OutboundQueue(websocket, self.handle_outbound_overflow)
+
     def save_deck_info(self, oshi_id: str, deck: Dict[str, int], cheer_deck: Dict[str, int]):
         self.oshi_id = oshi_id
         self.deck = deck
@@ -73,11 +104,37 @@ class Player:
             "oshi_id": self.oshi_id,
         }
 
-    async def send_game_event(self, event):
-        await self.websocket.send_json({
-            "message_type": "game_event",
-            "event_data": event
-        })
+    def queue_game_event(self, event):
+        self.queue_game_events(GameEventFrames([encode_json(event)]))
+
+    def queue_game_events(self, frames : GameEventFrames):
+        if not frames.event_jsons:
+            return
+        if self.game_event_batches:
+            self.outbound.put(frames.get_batch_frame())
+        else:
+            for event_frame in frames.get_event_frames():
+                if not self.outbound.put(event_frame):
+                    # Overflowed, the rest would be missing the events before them.
+                    break
+
+    def handle_outbound_overflow(self):
+        # Observers can watch again from a catch up, players get disconnected since their game
+        # can't go on without the events they missed.
+        game_room = self.current_game_room
+        if game_room and self in game_room.observers:
+            game_room.drop_observer(self)
+        else:
+            logger.info(f"Disconnecting slow player {self.get_username()} - {self.player_id}")
+            self.outbound.close()
+            asyncio.create_task(self.close_connection())
+
+    async def close_connection(self):
+        # The server's receive loop sees the disconnect and cleans up as usual.
+        try:
+            await self.websocket.close()
+        except Exception as e:
+            logger.info(f"Error closing connection for {self.player_id}: {e}")
 
 class PlayerManager:
     def __init__(self):
@@ -98,34 +155,35 @@ class PlayerManager:
         return [player.get_public_player_info() for player in self.active_players.values()]
 
     async def broadcast_server_info(self, queue_info, game_rooms):
-        players_info = self.get_players_info()
-        failed_players = []
         room_info = []
         for room in game_rooms:
             if not room.is_ai_game():
                 room_info.append(room.get_room_info())
-        player_ids = list(self.active_players.keys())
-        for player_id in player_ids:
-            if player_id not in self.active_players:
-                continue
-            player = self.active_players[player_id]
-            if not player.connected:
+        self.send_server_info(list(self.active_players.values()), queue_info, room_info, self.get_players_info())
+
+    def send_server_info(self, players, queue_info, room_info, players_info, version = 0):
+        # Everything but your_id/your_username is the same for everyone, encode it once.
+        shared_message_json = encode_json({
+            "message_type": "server_info",
+            "version": version,
+            "queue_info": queue_info,
+            "room_info": room_info,
+            "players_info": players_info,
+        })
+        for player in players:
+            if player.player_id not in self.active_players or not player.connected:
                 continue
 
-            message = ServerInfoMessage(
-                message_type="server_info",
-                queue_info=queue_info,
-                room_info=room_info,
-                players_info=players_info,
-                your_id=player.player_id,
-                your_username=player.get_username()
-            )
-
-            try:
-                await player.websocket.send_json(message.as_dict())
-            except:
-                failed_players.append(player.player_id)
-
-        # Remove any players we can't contact anymore.
-        for player_id in failed_players:
-            self.remove_player(player_id)
\ No newline at end of file
+            player.outbound.put(extend_json_object(shared_message_json, {
+                "your_id": player.player_id,
+                "your_username": player.get_username(),
+            }))
+
+    def send_to_players(self, players, message_json):
+        # Queued like game events, so a slow connection doesn't hold up the others and lobby
+        # frames stay in order with the game frames. Failed connections are removed when the
+        # server sees the disconnect.
+        for player in players:
+            if player.player_id not in self.active_players or not player.connected:
+                continue
+            player.outbound.put(message_json)
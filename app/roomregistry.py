@@ -0,0 +1,44 @@
+from typing import Dict
+from app.gameroom import GameRoom
+from app.playermanager import Player
+
+class RoomRegistry:
+    # The open game rooms, by room id and by the id of each player or observer in them.
+    # Iterating gives the rooms in the order they were opened.
+    def __init__(self):
+        self.rooms_by_id : Dict[str, GameRoom] = {}
+        self.rooms_by_player_id : Dict[str, GameRoom] = {}
+
+    def __iter__(self):
+        return iter(list(self.rooms_by_id.values()))
+
+    def __len__(self):
+        return len(self.rooms_by_id)
+
+    def add_room(self, room : GameRoom):
+        self.rooms_by_id[room.room_id] = room
+        for player in room.players:
+            self.rooms_by_player_id[player.player_id] = room
+
+    def remove_room(self, room : GameRoom):
+        self.rooms_by_id.pop(room.room_id, None)
+        for player in room.players + room.observers:
+            if self.rooms_by_player_id.get(player.player_id) is room:
+                del self.rooms_by_player_id[player.player_id]
+
+    def add_member(self, room : GameRoom, player : Player):
+        # For observers, players are added with the room.
+        self.rooms_by_player_id[player.player_id] = room
+
+    def get_room(self, room_id : str) -> GameRoom:
+        return self.rooms_by_id.get(room_id)
+
+    def get_player_room(self, player : Player) -> GameRoom:
+        room = self.rooms_by_player_id.get(player.player_id)
+        if room is None:
+            return None
+        # Observers can leave the room on their own, drop the entry once they are gone.
+        if player not in room.players and player not in room.observers:
+            del self.rooms_by_player_id[player.player_id]
+            return None
+        return room
@@ -0,0 +1,39 @@
+import json
+import os
+
+# orjson is in requirements.txt, it is used when installed unless USE_ORJSON=false.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.getenv("USE_ORJSON", "true").lower() == "true"
+
+if USE_ORJSON:
+    # orjson writes dict and list subclasses from their own storage, which leaves out the fields
+    # GameCards read from their definition. Subclasses go through encode_subclass instead.
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_SUBCLASS
+
+    def encode_subclass(value):
+        if isinstance(value, dict):
+            return dict(value.items())
+        if isinstance(value, list):
+            return list(value)
+        raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+    def encode_json(value) -> str:
+        return orjson.dumps(value, default=encode_subclass, option=ORJSON_OPTIONS).decode("utf-8")
+else:
+    def encode_json(value) -> str:
+        # Same encoding as websocket.send_json.
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def extend_json_object(object_json: str, fields: dict) -> str:
+    # Adds fields to an encoded JSON object, so a message shared by many recipients
+    # is encoded once and only the fields that differ are encoded per recipient.
+    extra_json = ",".join(f"{encode_json(key)}:{encode_json(value)}" for key, value in fields.items())
+    if not extra_json:
+        return object_json
+    if object_json == "{}":
+        return "{" + extra_json + "}"
+    return object_json[:-1] + "," + extra_json + "}"
@@ -0,0 +1,101 @@
+"""
+Lobby server_info broadcast benchmark.
+
+Sends server_info to a full lobby through PlayerManager.broadcast_server_info with fake websockets
+and reports the messages per second, next to the old way of building and send_json'ing the message
+for every player.
+
+Run from the repository root:
+    python -m benchmarks.lobby_broadcast [player_count] [broadcast_count]
+Set USE_ORJSON=false to measure the standard json backend.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from dataclasses import asdict
+
+from app.message_types import ServerInfoMessage
+from app.playermanager import PlayerManager
+from app.serialization import USE_ORJSON
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent_bytes = 0
+
+    async def send_text(self, text):
+        self.sent_bytes += len(text)
+
+    async def send_json(self, data):
+        # Same as starlette's WebSocket.send_json.
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+class FakeRoom:
+    def __init__(self, index, players):
+        self.index = index
+        self.players = players
+
+    def is_ai_game(self):
+        return False
+
+    def get_room_info(self):
+        return {
+            "room_id": "room_%d" % self.index,
+            "room_name": "Match_room_%d" % self.index,
+            "queue_name": "main_matchmaking_normal",
+            "game_type": "versus",
+            "players": [player.get_public_player_info() for player in self.players],
+        }
+
+def build_lobby(player_count):
+    player_manager = PlayerManager()
+    for i in range(player_count):
+        player = player_manager.add_player("player_%d" % i, FakeWebSocket())
+        player.oshi_id = "hSD01-001"
+        player.set_queue("In Queue" if i % 10 == 0 else "")
+    # Half of the lobby is in a match.
+    players = list(player_manager.active_players.values())
+    game_rooms = [FakeRoom(i, players[i * 2:i * 2 + 2]) for i in range(player_count // 4)]
+    queue_info = [{"queue_name": "main_matchmaking_normal", "players_count": player_count // 10}]
+    return player_manager, game_rooms, queue_info
+
+async def broadcast_per_player(player_manager, queue_info, game_rooms):
+    # The previous implementation, one asdict and one json.dumps per player.
+    players_info = player_manager.get_players_info()
+    room_info = [room.get_room_info() for room in game_rooms if not room.is_ai_game()]
+    for player in list(player_manager.active_players.values()):
+        message = ServerInfoMessage(
+            message_type="server_info",
+            queue_info=queue_info,
+            room_info=room_info,
+            players_info=players_info,
+            your_id=player.player_id,
+            your_username=player.get_username()
+        )
+        await player.websocket.send_json(asdict(message))
+
+async def broadcast_encoded_once(player_manager, queue_info, game_rooms):
+    # Frames are queued on each player's connection, the broadcast is done when they are written.
+    await player_manager.broadcast_server_info(queue_info, game_rooms)
+    for player in player_manager.active_players.values():
+        await player.outbound.drain()
+
+async def measure(name, broadcast, player_manager, queue_info, game_rooms, broadcast_count):
+    start = time.perf_counter()
+    for _ in range(broadcast_count):
+        await broadcast(player_manager, queue_info, game_rooms)
+    elapsed = time.perf_counter() - start
+    messages = broadcast_count * len(player_manager.active_players)
+    print(f"{name:>14}: {messages / elapsed:>10.0f} messages/s  {elapsed / broadcast_count * 1000:>7.2f} ms/broadcast")
+
+async def main():
+    player_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    broadcast_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    player_manager, game_rooms, queue_info = build_lobby(player_count)
+    print(f"{player_count} players, {len(game_rooms)} rooms, {broadcast_count} broadcasts, orjson: {USE_ORJSON}")
+    await measure("per player", broadcast_per_player, player_manager, queue_info, game_rooms, broadcast_count)
+    await measure("encoded once", broadcast_encoded_once, player_manager, queue_info, game_rooms, broadcast_count)
+
+if __name__ == "__main__":
+    asyncio.run(main())
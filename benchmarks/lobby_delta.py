@@ -0,0 +1,128 @@
+"""
+Lobby traffic benchmark.
+
+Simulates a rush hour on the lobby: players connect and join, queue, get matched into rooms, finish
+their games and disconnect. Counts the lobby messages and bytes sent with the old behaviour (a full
+server_info to everyone after every change) and with the LobbyBroadcaster (changes coalesced over
+the broadcast window, deltas for clients that support them).
+
+Run from the repository root:
+    python -m benchmarks.lobby_delta [player_count] [changes_per_window]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+from app.gameroom import GameRoom
+from app.lobbybroadcaster import LobbyBroadcaster
+from app.matchmaking import Matchmaking
+from app.playermanager import PlayerManager
+
+class FakeWebSocket:
+    def __init__(self, counters):
+        self.counters = counters
+
+    async def send_text(self, text):
+        self.counters["messages"] += 1
+        self.counters["bytes"] += len(text.encode("utf-8"))
+
+class Lobby:
+    def __init__(self, lobby_deltas):
+        self.player_manager = PlayerManager()
+        self.matchmaking = Matchmaking()
+        self.game_rooms = []
+        self.lobby_deltas = lobby_deltas
+        self.counters = {"messages": 0, "bytes": 0}
+        self.players = []
+
+    def connect(self, player_id):
+        player = self.player_manager.add_player(player_id, FakeWebSocket(self.counters))
+        player.lobby_deltas = self.lobby_deltas
+        self.players.append(player)
+        return player
+
+    async def drain(self):
+        # Lobby frames are queued on each player's connection, counted once they are written.
+        for player in self.players:
+            await player.outbound.drain()
+
+    def queue(self, player):
+        player.save_deck_info("hSD01-001", {}, {})
+        room = self.matchmaking.add_player_to_queue(player, "main_matchmaking_normal", False, "versus")
+        if room:
+            self.game_rooms.append(room)
+
+    def finish_room(self, room : GameRoom):
+        self.game_rooms.remove(room)
+        for player in room.players:
+            player.current_game_room = None
+
+    def disconnect(self, player):
+        player.connected = False
+        self.matchmaking.remove_player_from_queue(player)
+        self.player_manager.remove_player(player.player_id)
+
+def build_schedule(lobby, player_count, rng):
+    # Each step changes the lobby and returns the player that joined, if any.
+    steps = []
+    players = []
+    def join(i):
+        player = lobby.connect("player_%d" % i)
+        players.append(player)
+        return player
+    for i in range(player_count):
+        steps.append(lambda i=i: join(i))
+        steps.append(lambda i=i: lobby.queue(players[i]))
+        # Games end and players leave while others keep arriving.
+        if i % 4 == 3:
+            steps.append(lambda: lobby.game_rooms and lobby.finish_room(lobby.game_rooms[0]))
+        if i % 5 == 4:
+            steps.append(lambda: lobby.disconnect(rng.choice([p for p in players if p.connected and not lobby.matchmaking.get_player_queue(p)])))
+    return steps
+
+async def run_full_broadcasts(player_count):
+    # The old server: every change sends the whole lobby to everyone.
+    lobby = Lobby(lobby_deltas=False)
+    for step in build_schedule(lobby, player_count, random.Random(0)):
+        step()
+        await lobby.player_manager.broadcast_server_info(lobby.matchmaking.get_queue_info(), lobby.game_rooms)
+        await lobby.drain()
+    return lobby.counters
+
+async def run_lobby_broadcaster(player_count, changes_per_window, lobby_deltas):
+    lobby = Lobby(lobby_deltas=lobby_deltas)
+    # Flushed by hand, one flush per broadcast window.
+    broadcaster = LobbyBroadcaster(lobby.player_manager, lobby.matchmaking, lobby.game_rooms, delay=3600)
+    for i, step in enumerate(build_schedule(lobby, player_count, random.Random(0))):
+        joined = step()
+        if joined:
+            broadcaster.request_snapshot(joined)
+        else:
+            broadcaster.request_update()
+        if i % changes_per_window == changes_per_window - 1:
+            await broadcaster.flush()
+            await lobby.drain()
+    await broadcaster.flush()
+    await lobby.drain()
+    broadcaster.flush_task.cancel()
+    return lobby.counters
+
+async def main():
+    player_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    changes_per_window = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{player_count} players, {changes_per_window} lobby changes per broadcast window")
+    runs = [
+        ("full broadcasts", run_full_broadcasts(player_count)),
+        ("coalesced full", run_lobby_broadcaster(player_count, changes_per_window, lobby_deltas=False)),
+        ("coalesced delta", run_lobby_broadcaster(player_count, changes_per_window, lobby_deltas=True)),
+    ]
+    for name, run in runs:
+        start = time.perf_counter()
+        counters = await run
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16}: {counters['messages']:>9} messages {counters['bytes'] / 1024 / 1024:>10.1f} MiB {elapsed:>7.1f} s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
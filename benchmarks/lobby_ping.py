@@ -0,0 +1,123 @@
+"""
+Lobby ping benchmark.
+
+Plays AI games (a person driven by an AIPlayer against the room's own AI) at a number of tables
+at once while a lobby client pings the server, and measures how long each ping waits for the event
+loop, and the longest engine call that ran on the loop (see AI_TIME_BUDGET_MS in app/gameroom.py).
+Compares running the room engines on the event loop with running them in engine processes. Each table starts a new game when one ends or the AIPlayer gets stuck, until it has taken its
+actions. The people's AIPlayers stand in for clients and run on the event loop either way.
+
+Run from the repository root:
+    python -m benchmarks.lobby_ping [table_count] [engine_processes] [actions_per_table]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from app.aiplayer import AIPlayer, DefaultAIDeck
+from app.card_database import CardDatabase
+from app.enginepool import EnginePool
+from app.gameroom import GameRoom
+from app.playermanager import Player
+
+PING_SECONDS = 0.01
+
+class FakeWebSocket:
+    def __init__(self):
+        self.events = []
+
+    async def send_text(self, text):
+        message = json.loads(text)
+        if message["message_type"] == "game_event_batch":
+            self.events += message["events"]
+        elif message["message_type"] == "game_event":
+            self.events.append(message["event_data"])
+
+    async def close(self):
+        pass
+
+async def play_game(card_db, engine_pool, room_id, max_actions):
+    player = Player("player_" + room_id, FakeWebSocket())
+    player.game_event_batches = True
+    player.save_deck_info(DefaultAIDeck["oshi_id"], DefaultAIDeck["deck"], DefaultAIDeck["cheer_deck"])
+    room = GameRoom(room_id, "Match", [player], "ai", "main_matchmaking_normal")
+    await room.start(card_db, engine_pool)
+
+    ai = AIPlayer(player.player_id)
+    next_event = 0
+    actions = 0
+    while actions < max_actions and not room.is_game_over():
+        await player.outbound.drain()
+        new_events = player.websocket.events[next_event:]
+        next_event = len(player.websocket.events)
+        performing, action = ai.ai_process_events(new_events)
+        if not performing:
+            break
+        await room.handle_game_message(player.player_id, action["action_type"], action["action_data"])
+        actions += 1
+    room.shutdown()
+    await room.action_worker
+    return actions, room.max_loop_blocking_seconds
+
+async def play_table(card_db, engine_pool, table_index, max_actions):
+    actions = 0
+    games = 0
+    max_blocking = 0
+    while actions < max_actions:
+        game_actions, game_max_blocking = await play_game(card_db, engine_pool, "room%d_%d" % (table_index, games), max_actions - actions)
+        actions += game_actions
+        max_blocking = max(max_blocking, game_max_blocking)
+        games += 1
+    return actions, games, max_blocking
+
+async def ping(latencies, stop):
+    # Stands in for a lobby client, how late each ping runs is how long its request would wait.
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PING_SECONDS)
+        latencies.append(time.perf_counter() - start - PING_SECONDS)
+
+async def run(card_db, engine_pool, table_count, actions_per_table):
+    random.seed(0)
+    latencies = []
+    stop = asyncio.Event()
+    ping_task = asyncio.create_task(ping(latencies, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[play_table(card_db, engine_pool, i, actions_per_table) for i in range(table_count)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ping_task
+    actions = sum(table_actions for table_actions, _, _ in results)
+    games = sum(table_games for _, table_games, _ in results)
+    max_blocking = max(table_max_blocking for _, _, table_max_blocking in results)
+    return latencies, actions, games, max_blocking, elapsed
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def main():
+    table_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    engine_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    actions_per_table = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    os.environ["DONT_UPLOAD_MATCHES"] = "true"
+    logging.disable(logging.CRITICAL)
+    card_db = CardDatabase()
+    print(f"{table_count} AI game tables, {actions_per_table} actions each, ping every {PING_SECONDS * 1000:.0f} ms")
+    engine_pool = EnginePool(engine_processes)
+    runs = [
+        ("event loop", None),
+        (f"{engine_processes} processes", engine_pool),
+    ]
+    for name, pool in runs:
+        latencies, actions, games, max_blocking, elapsed = await run(card_db, pool, table_count, actions_per_table)
+        print(f"{name:>14}: ping p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms  max {max(latencies) * 1000:>7.1f} ms  longest engine call {max_blocking * 1000:>6.1f} ms  {actions:>6} actions in {games:>4} games, {elapsed:>5.1f} s")
+    engine_pool.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
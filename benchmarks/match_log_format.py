@@ -0,0 +1,98 @@
+"""
+Match log format benchmark.
+
+Plays AI vs AI games and saves each one's match log in the legacy pretty printed .json format and in
+the compact .jsonl.gz format (app/matchlog.py). Compares the size on disk and how long it takes to
+write them and to read all of them back with read_match_log.
+
+Run from the repository root:
+    python -m benchmarks.match_log_format [game_count]
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.aiplayer import AIPlayer, DefaultAIDeck
+from app.card_database import CardDatabase
+from app.gameengine import GameEngine
+from app.matchlog import MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION, MatchLogStream, read_match_log
+
+MAX_ACTIONS = 300
+
+def play_game(card_db, game_index):
+    random.seed(game_index)
+    ais = [AIPlayer("player%d" % i) for i in range(2)]
+    player_infos = []
+    for ai in ais:
+        ai.set_deck(DefaultAIDeck)
+        player_infos.append(ai.get_player_game_info())
+    engine = GameEngine(card_db, "versus", player_infos)
+    engine.begin_game()
+    for _ in range(MAX_ACTIONS):
+        events = engine.grab_events()
+        if engine.is_game_over():
+            break
+        acted = False
+        for ai in ais:
+            performing, action = ai.ai_process_events(events)
+            if performing:
+                engine.handle_game_message(ai.player_id, action["action_type"], action["action_data"])
+                acted = True
+                break
+        if not acted:
+            break
+    return {**engine.get_match_log(), "queue_name": "benchmark"}
+
+def write_legacy(match_data, file_path):
+    # What upload_match_to_local_storage writes.
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(match_data, f, indent=2, ensure_ascii=False)
+
+def write_compact(match_data, file_path):
+    # The same records a room appends as its game goes.
+    match_log = MatchLogStream(file_path)
+    match_log.write_header(match_data)
+    match_log.append_game_messages(match_data["all_game_messages"])
+    match_log.append_events(match_data["all_events"])
+    match_log.finish(match_data)
+
+def time_writes(write, match_datas, file_paths):
+    start = time.perf_counter()
+    for match_data, file_path in zip(match_datas, file_paths):
+        write(match_data, file_path)
+    return time.perf_counter() - start, sum(os.path.getsize(file_path) for file_path in file_paths)
+
+def time_reads(file_paths):
+    start = time.perf_counter()
+    match_datas = [read_match_log(file_path) for file_path in file_paths]
+    return time.perf_counter() - start, match_datas
+
+def main():
+    game_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    logging.disable(logging.CRITICAL)
+    card_db = CardDatabase()
+    match_datas = [play_game(card_db, game_index) for game_index in range(game_count)]
+    event_count = sum(len(match_data["all_events"]) for match_data in match_datas)
+    print(f"{game_count} games, {event_count} events")
+    formats = [
+        ("legacy", LEGACY_MATCH_LOG_EXTENSION, write_legacy),
+        ("compact", MATCH_LOG_EXTENSION, write_compact),
+    ]
+    sizes = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, extension, write in formats:
+            file_paths = [os.path.join(temp_dir, "match%d%s" % (game_index, extension)) for game_index in range(game_count)]
+            write_seconds, size = time_writes(write, match_datas, file_paths)
+            read_seconds, read_match_datas = time_reads(file_paths)
+            assert [match_data["all_game_messages"] for match_data in read_match_datas] == json.loads(json.dumps([match_data["all_game_messages"] for match_data in match_datas]))
+            sizes.append(size)
+            print(f"{name + ' ' + extension:>18}: {size / 1024:>9.1f} KiB  write {write_seconds * 1000:>7.1f} ms  read {read_seconds * 1000:>7.1f} ms")
+    print(f"compact is {sizes[0] / sizes[1]:.1f}x smaller")
+
+if __name__ == "__main__":
+    main()
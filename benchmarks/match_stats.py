@@ -0,0 +1,75 @@
+"""
+Match statistics benchmark.
+
+Plays a few AI vs AI games and writes copies of their compact match logs (app/matchlog.py) under
+different players, oshis and winners. Then times computing the analyze_match_data.py stats three
+ways: reading every full log in one process (how the script used to work), reading only the
+summaries in one process, and reading the summaries across the process pool (app/matchstats.py).
+Then times an incremental run after a few more logs are added.
+
+Run from the repository root:
+    python -m benchmarks.match_stats [log_count] [processes]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from app.card_database import CardDatabase
+from app.matchlog import MATCH_LOG_EXTENSION, read_match_log
+from app.matchstats import MatchStats, analyze_match_logs
+from benchmarks.match_log_format import play_game, write_compact
+
+GAME_COUNT = 5
+OSHIS = ["hSD01-001", "hSD01-002", "hYS01-001", "hYS01-002", "hBP01-001"]
+NEW_LOG_COUNT = 100
+
+def write_logs(match_datas, match_logs_dir, first_index, log_count):
+    for log_index in range(first_index, first_index + log_count):
+        match_data = match_datas[log_index % len(match_datas)]
+        player_info = [{
+            **player,
+            "username": "player%d" % ((log_index + player_index) % 1000),
+            "oshi_id": OSHIS[(log_index + player_index * 2) % len(OSHIS)],
+        } for player_index, player in enumerate(match_data["player_info"])]
+        winner = player_info[log_index % 3 == 0]["username"]
+        write_compact({**match_data, "player_info": player_info, "winner": winner}, os.path.join(match_logs_dir, "match%06d%s" % (log_index, MATCH_LOG_EXTENSION)))
+
+def analyze_full_logs(match_logs_dir):
+    stats = MatchStats()
+    for file_name in sorted(os.listdir(match_logs_dir)):
+        stats.add_match(read_match_log(os.path.join(match_logs_dir, file_name)))
+    return stats
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    log_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    logging.disable(logging.CRITICAL)
+    card_db = CardDatabase()
+    match_datas = [play_game(card_db, game_index) for game_index in range(GAME_COUNT)]
+    with tempfile.TemporaryDirectory() as match_logs_dir:
+        write_logs(match_datas, match_logs_dir, 0, log_count)
+        event_count = sum(len(match_datas[log_index % GAME_COUNT]["all_events"]) for log_index in range(log_count))
+        print(f"{log_count} logs, {event_count} events, {processes or os.cpu_count()} processes")
+
+        full_seconds, expected = timed(analyze_full_logs, match_logs_dir)
+        summary_seconds, (stats, match_ids) = timed(analyze_match_logs, match_logs_dir, (), 1)
+        pool_seconds, (pool_stats, _) = timed(analyze_match_logs, match_logs_dir, (), processes)
+        assert stats.to_dict() == expected.to_dict() and pool_stats.to_dict() == expected.to_dict()
+        for name, seconds in [("full logs", full_seconds), ("summaries", summary_seconds), ("summaries, pool", pool_seconds)]:
+            print(f"{name:>18}: {seconds:>7.2f} s  {log_count / seconds:>9.0f} logs/s")
+
+        write_logs(match_datas, match_logs_dir, log_count, NEW_LOG_COUNT)
+        incremental_seconds, (new_stats, new_match_ids) = timed(analyze_match_logs, match_logs_dir, set(match_ids), processes)
+        assert len(new_match_ids) == NEW_LOG_COUNT
+        print(f"{'incremental':>18}: {incremental_seconds:>7.2f} s  for {NEW_LOG_COUNT} new logs")
+
+if __name__ == "__main__":
+    main()
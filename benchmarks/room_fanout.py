@@ -0,0 +1,182 @@
+"""
+Game room fan-out benchmark.
+
+Plays AI vs AI games in a GameRoom with observers attached and measures how long the acting player
+waits from sending an action until it has all of the events it caused. Compares sending the way the
+room used to (every event written to every recipient before the room moves on) with the
+per-connection outbound queues, with one frame per event and with game_event_batch frames. A few of
+the observers are slow connections.
+
+Run from the repository root:
+    python -m benchmarks.room_fanout [observer_count] [action_count]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from app.aiplayer import AIPlayer, DefaultAIDeck
+from app.card_database import CardDatabase
+from app.gameroom import GameRoom
+from app.playermanager import Player
+
+PLAYER_SEND_SECONDS = 0.0002
+OBSERVER_SEND_SECONDS = 0.0005
+SLOW_OBSERVER_SEND_SECONDS = 0.01
+SLOW_OBSERVER_COUNT = 2
+
+class FakeWebSocket:
+    def __init__(self, send_seconds, counters):
+        self.send_seconds = send_seconds
+        self.counters = counters
+        self.events = []
+        self.last_event_number = -1
+        self.received = asyncio.Event()
+
+    async def send_text(self, text):
+        # Stands in for the time the write takes on a real connection.
+        await asyncio.sleep(self.send_seconds)
+        self.counters["frames"] += 1
+        message = json.loads(text)
+        if message["message_type"] == "game_event":
+            events = [message["event_data"]]
+        elif message["message_type"] == "game_event_batch":
+            events = message["events"]
+        else:
+            return
+        for event in events:
+            self.events.append(event)
+            self.last_event_number = max(self.last_event_number, event.get("event_number", -1))
+        self.received.set()
+
+    async def close(self):
+        pass
+
+    async def wait_for_event(self, event_number):
+        while self.last_event_number < event_number:
+            self.received.clear()
+            await self.received.wait()
+
+class BlockingPlayer(Player):
+    # The previous fan-out, events are written by the room itself.
+    def __init__(self, player_id, websocket, pending_sends):
+        super().__init__(player_id, websocket)
+        self.pending_sends = pending_sends
+
+    def queue_game_events(self, frames):
+        for event_frame in frames.get_event_frames():
+            self.pending_sends.append((self.websocket, event_frame))
+
+class BlockingGameRoom(GameRoom):
+    # Writes every event to every recipient, one at a time, before taking the next action.
+    def __init__(self, *args, pending_sends):
+        super().__init__(*args)
+        self.pending_sends = pending_sends
+
+    async def write_pending_sends(self):
+        sends = list(self.pending_sends)
+        self.pending_sends.clear()
+        for websocket, text in sends:
+            await websocket.send_text(text)
+
+    async def apply_start(self, card_db):
+        await super().apply_start(card_db)
+        await self.write_pending_sends()
+
+    async def apply_join_as_observer(self, player):
+        await super().apply_join_as_observer(player)
+        await self.write_pending_sends()
+
+    async def apply_game_message(self, player_id, action_type, action_data):
+        await super().apply_game_message(player_id, action_type, action_data)
+        await self.write_pending_sends()
+
+def create_player(mode, player_id, send_seconds, pending_sends, counters):
+    websocket = FakeWebSocket(send_seconds, counters)
+    if mode == "blocking":
+        player = BlockingPlayer(player_id, websocket, pending_sends)
+    else:
+        player = Player(player_id, websocket)
+        player.game_event_batches = mode == "batches"
+    player.save_deck_info(DefaultAIDeck["oshi_id"], DefaultAIDeck["deck"], DefaultAIDeck["cheer_deck"])
+    return player
+
+async def play_game(card_db, mode, game_index, observer_count, latencies, counters, max_actions):
+    pending_sends = []
+    players = [create_player(mode, "player%d" % i, PLAYER_SEND_SECONDS, pending_sends, counters) for i in range(2)]
+    observers = []
+    for i in range(observer_count):
+        send_seconds = SLOW_OBSERVER_SEND_SECONDS if i < SLOW_OBSERVER_COUNT else OBSERVER_SEND_SECONDS
+        observers.append(create_player(mode, "observer%d" % i, send_seconds, pending_sends, counters))
+
+    room_args = ("room%d" % game_index, "Match", players, "versus", "main_matchmaking_normal")
+    room = BlockingGameRoom(*room_args, pending_sends=pending_sends) if mode == "blocking" else GameRoom(*room_args)
+    random.seed(game_index)
+    await room.start(card_db)
+    for observer in observers:
+        await room.join_as_observer(observer)
+
+    ais = [AIPlayer(player.player_id) for player in players]
+    next_event = [0, 0]
+    actions = 0
+    while actions < max_actions and not room.engine.is_game_over():
+        for player in players:
+            await player.outbound.drain()
+        acted = False
+        for i, player in enumerate(players):
+            new_events = player.websocket.events[next_event[i]:]
+            next_event[i] = len(player.websocket.events)
+            performing, action = ais[i].ai_process_events(new_events)
+            if not performing:
+                continue
+            start = time.perf_counter()
+            await room.handle_game_message(player.player_id, action["action_type"], action["action_data"])
+            await player.websocket.wait_for_event(len(room.engine.all_events) - 1)
+            latencies.append(time.perf_counter() - start)
+            actions += 1
+            acted = True
+            break
+        if not acted:
+            break
+
+    room.shutdown()
+    dropped = sum(1 for observer in observers if observer not in room.observers)
+    return actions, dropped
+
+async def run(card_db, mode, observer_count, action_count):
+    latencies = []
+    counters = {"frames": 0}
+    dropped = 0
+    game_index = 0
+    while len(latencies) < action_count:
+        _, game_dropped = await play_game(card_db, mode, game_index, observer_count, latencies, counters, action_count - len(latencies))
+        dropped += game_dropped
+        game_index += 1
+    return latencies, counters["frames"], dropped
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def main():
+    observer_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    action_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    os.environ["DONT_UPLOAD_MATCHES"] = "true"
+    logging.disable(logging.CRITICAL)
+    card_db = CardDatabase()
+    print(f"{observer_count} observers ({SLOW_OBSERVER_COUNT} slow), {action_count} actions")
+    runs = [
+        ("room sends", "blocking"),
+        ("outbound queues", "events"),
+        ("batched frames", "batches"),
+    ]
+    for name, mode in runs:
+        latencies, frames, dropped = await run(card_db, mode, observer_count, action_count)
+        print(f"{name:>16}: p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms  max {max(latencies) * 1000:>7.1f} ms  {frames:>7} frames  observers dropped {dropped}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,9 @@
 import traceback
+import asyncio
 import os
 import uuid
 import time
-from typing import List
+from typing import Dict, Set
 import tempfile
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
@@ -12,10 +13,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.matchmaking import Matchmaking
 import app.message_types as message_types
 from app.playermanager import PlayerManager, Player
-from app.gameengine import GamePhase
-from app.gameroom import GameRoom
+from app.lobbybroadcaster import LobbyBroadcaster
+from app.roomregistry import RoomRegistry
+from app.idlereaper import IdleReaper
+from app.cluster import ClusterClient, ClusterMatchmaking, RemotePlayer, RemoteRoom
+from app.gameroom import GameRoom, send_room_closed
+from app.enginepool import EnginePool, ENGINE_PROCESSES
 from app.card_database import CardDatabase
-from app.dbaccess import download_and_extract_game_package
+from app.dbaccess import download_and_extract_game_package, match_log_writer
 import logging
 from dotenv import load_dotenv
 
@@ -57,10 +62,20 @@ async def lifespan(app: FastAPI):
             async def game_not_available():
                 return {"message": "Game package not available"}
 
+    idle_reaper_task = asyncio.create_task(idle_reaper.run())
+    if cluster:
+        await cluster.connect(handle_cluster_message)
+
     yield  # Application runs here
 
     # Actions to perform during shutdown (if needed)
     # Clean up or additional teardown actions can be added here if necessary.
+    idle_reaper_task.cancel()
+    if cluster:
+        await cluster.close()
+    if engine_pool:
+        engine_pool.shutdown()
+    await match_log_writer.flush()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -79,6 +94,20 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy", "service": "holoduel-server"}
 
+@app.get("/metrics/idle_reaper")
+async def idle_reaper_metrics():
+    return idle_reaper.get_metrics()
+
+@app.get("/metrics/engine_pool")
+async def engine_pool_metrics():
+    if not engine_pool:
+        return {"processes": 0}
+    return engine_pool.get_metrics()
+
+@app.get("/metrics/rooms")
+async def room_metrics():
+    return [room.get_engine_metrics() for room in game_rooms]
+
 # Redirect from root (/) to /game/index.html
 @app.get("/")
 async def root():
@@ -97,16 +126,15 @@ async def websocket_info():
 # Store connected clients
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
 
     async def connect(self, websocket: WebSocket):
         # accept는 이미 websocket_endpoint에서 호출됨
-        if websocket not in self.active_connections:
-            self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     async def disconnect(self, websocket: WebSocket, send_disconnection = False):
         if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+            self.active_connections.discard(websocket)
             if send_disconnection:
                 try:
                     await websocket.close()
@@ -114,23 +142,34 @@ class ConnectionManager:
                     pass
 
     async def broadcast(self, message : message_types.Message):
-        dict_message = message.as_dict()
-        for connection in self.active_connections:
+        message_json = message.to_json()
+        for connection in list(self.active_connections):
             try:
-                await connection.send_json(dict_message)
+                await connection.send_text(message_json)
             except:
                 pass
 
 manager = ConnectionManager()
 
+# With CLUSTER_SOCKET set, this is one of several worker processes that share matchmaking and the
+# lobby through app/coordinator.py. Each room runs on one worker, the others pass on the messages
+# from their players in it.
+cluster_socket = os.getenv("CLUSTER_SOCKET")
+cluster : ClusterClient = ClusterClient(cluster_socket, str(os.getpid())) if cluster_socket else None
+# Rooms on other workers that players here are in, by room id.
+remote_rooms : Dict[str, RemoteRoom] = {}
+
 player_manager : PlayerManager = PlayerManager()
-game_rooms : List[GameRoom] = []
-matchmaking : Matchmaking = Matchmaking()
+game_rooms : RoomRegistry = RoomRegistry()
+matchmaking : Matchmaking = ClusterMatchmaking(cluster) if cluster else Matchmaking()
 card_db : CardDatabase = CardDatabase()
-last_idle_check = time.time()
+# With ENGINE_PROCESSES set, room engines run in that many worker processes instead of on the event loop.
+engine_pool : EnginePool = EnginePool(ENGINE_PROCESSES) if ENGINE_PROCESSES > 0 else None
+lobby_broadcaster : LobbyBroadcaster = LobbyBroadcaster(player_manager, matchmaking, game_rooms, cluster=cluster)
 
-async def broadcast_server_info():
-    await player_manager.broadcast_server_info(matchmaking.get_queue_info(), game_rooms)
+def broadcast_server_info():
+    # Coalesced with other lobby changes, see LobbyBroadcaster.
+    lobby_broadcaster.request_update()
 
 async def send_error_message(websocket: WebSocket, error_id, error_str : str):
     message = message_types.ErrorMessage(
@@ -138,7 +177,7 @@ async def send_error_message(websocket: WebSocket, error_id, error_str : str):
         error_id = error_id,
         error_message=error_str,
     )
-    await websocket.send_json(message.as_dict())
+    await websocket.send_text(message.to_json())
 
 
 @app.websocket("/ws")
@@ -154,9 +193,10 @@ async def websocket_endpoint(websocket: WebSocket):
             player.websocket = websocket
         else:
             player = player_manager.add_player(player_id, websocket)
+        idle_reaper.track(player)
 
         # ConnectionManager에 추가 (이미 accept됨)
-        manager.active_connections.append(websocket)
+        manager.active_connections.add(websocket)
         
     except Exception as e:
         logger.error(f"WebSocket connection error: {e}")
@@ -174,23 +214,31 @@ async def websocket_endpoint(websocket: WebSocket):
             player.last_seen = time.time()
 
             if isinstance(message, message_types.JoinServerMessage):
-                await broadcast_server_info()
+                player.lobby_deltas = message.lobby_deltas
+                player.game_event_batches = message.game_event_batches
+                player.lobby_version = None
+                lobby_broadcaster.request_snapshot(player)
+
+            elif isinstance(message, message_types.ResyncServerInfoMessage):
+                lobby_broadcaster.request_snapshot(player)
 
             elif isinstance(message, message_types.ObserveRoomMessage):
-                room_id = message.room_id
-                for room in game_rooms:
-                    if room.room_id == room_id:
-                        player.current_game_room = room
-                        await room.join_as_observer(player)
-                        await broadcast_server_info()
-                        break
+                room = game_rooms.get_room(message.room_id) or get_remote_room(message.room_id)
+                if room:
+                    player.current_game_room = room
+                    game_rooms.add_member(room, player)
+                    await room.join_as_observer(player, message.from_snapshot)
+                    check_cleanup_room(room)
+                    broadcast_server_info()
                 else:
                     await send_error_message(websocket, "invalid_room", f"ERROR: Match not found.")
             elif isinstance(message, message_types.ObserverGetEventsMessage):
                 if not player.current_game_room:
                     await send_error_message(websocket, "not_in_room", f"ERROR: Not in a game room.")
                     break
-                await player.current_game_room.observer_request_next_events(player, message.next_event_index)
+                player_room = player.current_game_room
+                await player_room.observer_request_next_events(player, message.next_event_index)
+                check_cleanup_room(player_room)
             elif isinstance(message, message_types.JoinMatchmakingQueueMessage):
                 # Ensure player is in a joinable state.
                 if not can_player_join_queue(player):
@@ -221,23 +269,23 @@ async def websocket_endpoint(websocket: WebSocket):
                                 game_type=message.game_type,
                             )
                             if match:
-                                game_rooms.append(match)
-                                await match.start(card_db)
+                                game_rooms.add_room(match)
+                                await match.start(card_db, engine_pool)
 
-                            await broadcast_server_info()
+                            broadcast_server_info()
                         else:
                             await send_error_message(websocket, "joinmatch_invaliddeck", "Invalid deck list.")
 
             elif isinstance(message, message_types.LeaveMatchmakingQueueMessage):
                 matchmaking.remove_player_from_queue(player)
-                await broadcast_server_info()
+                broadcast_server_info()
 
             elif isinstance(message, message_types.LeaveGameMessage):
                 player_room : GameRoom = player.current_game_room
                 if player_room is not None:
                     await player_room.handle_player_quit(player)
                     check_cleanup_room(player_room)
-                    await broadcast_server_info()
+                    broadcast_server_info()
                 else:
                     await send_error_message(websocket, "not_in_room", f"ERROR: Not in a game room to leave.")
 
@@ -255,51 +303,53 @@ async def websocket_endpoint(websocket: WebSocket):
                 player_room : GameRoom = player.current_game_room
                 if player_room and not player_room.is_ready_for_cleanup():
                     await player_room.handle_emote_message(player.player_id, message.emote_id)
+                    check_cleanup_room(player_room)
                 else:
                     logger.warning(f"Player {player.get_username()} - {player.player_id} tried to send emote but not in a game room")
                     await send_error_message(websocket, "not_in_room", f"ERROR: Not in a game room to send emote.")
             else:
                 await send_error_message(websocket, "invalid_game_message", f"ERROR: Invalid message: {data}")
 
-            await check_idle_users_task()
-
     except WebSocketDisconnect:
         logger.info(f"Client disconnected: {player.get_username()} - {player.player_id}")
         player.connected = False
         matchmaking.remove_player_from_queue(player)
-        for room in game_rooms:
-            if player in room.players or player in room.observers:
-                await room.handle_player_disconnect(player)
-                check_cleanup_room(room)
-                break
+        room = game_rooms.get_player_room(player)
+        if room:
+            await room.handle_player_disconnect(player)
+            check_cleanup_room(room)
 
         player_manager.remove_player(player_id)
+        idle_reaper.untrack(player)
         await manager.disconnect(websocket)
-        await broadcast_server_info()
+        broadcast_server_info()
     except Exception as e:
         error_details = traceback.format_exc()
         logger.error(f"Error websocket loop from player {player.get_username()} - {player.player_id}: {e} Callstack: {error_details}")
 
 def cleanup_room(room: GameRoom):
     logger.info("Cleanup game room ID: %s" % room.room_id)
-    game_rooms.remove(room)
+    game_rooms.remove_room(room)
+    room.shutdown()
     for player in room.players:
         player.current_game_room = None
     for observer in room.observers:
         observer.current_game_room = None
 
+    if cluster:
+        remote_rooms.pop(room.room_id, None)
+        # Let the workers with players or observers in the room clean up their side.
+        remote_workers = {member.worker_id for member in room.players + room.observers if isinstance(member, RemotePlayer)}
+        for worker_id in remote_workers:
+            cluster.forward(worker_id, {"type": "room_closed", "room_id": room.room_id})
+
 def check_cleanup_room(room: GameRoom):
     if room.is_ready_for_cleanup():
         cleanup_room(room)
-    else:
-        state = "NO_ENGINE"
-        if room.engine:
-            state = room.engine.phase
-        if state == GamePhase.GameOver:
-            last_event = room.engine.all_events[-1]
-            last_message = room.engine.all_game_messages[-1]
-            logger.error(f"Room {room.room_id} open after game over.  Event: {last_event}  Message: {last_message}  PlayerCount: {len(room.players)}\n")
-            cleanup_room(room)
+    elif room.is_game_over():
+        # The engine may be in an engine process, so only what the room holds is logged.
+        logger.error(f"Room {room.room_id} open after game over.  GameType: {room.game_type}  Queue: {room.queue_name}  PlayerCount: {len(room.players)}  ObserverCount: {len(room.observers)}\n")
+        cleanup_room(room)
 
 def can_player_join_queue(player: Player):
     # If the player is in a queue or in a game room, then they can't join another queue.
@@ -307,37 +357,185 @@ def can_player_join_queue(player: Player):
         return False
     return True
 
-async def check_idle_users_task():
-    global last_idle_check
-    if last_idle_check + IDLE_TASK_TIMER > time.time():
+async def remove_idle_player(player: Player):
+    if not player_manager.get_player(player.player_id):
+        # Already gone, probably disconnected during an await.
         return
-    last_idle_check = time.time()
+    logger.info(f"Player timed out: {player.get_username()} - {player.player_id}")
+    matchmaking.remove_player_from_queue(player)
+    room = game_rooms.get_player_room(player)
+    if room:
+        await room.handle_player_quit(player)
+        check_cleanup_room(room)
+    player.connected = False
+    player_manager.remove_player(player.player_id)
+    await manager.disconnect(player.websocket, True)
+    broadcast_server_info()
+
+def get_remote_room(room_id : str):
+    if not cluster:
+        return None
+    room = remote_rooms.get(room_id)
+    if room:
+        return room
+    worker_id = cluster.get_room_worker(room_id)
+    if worker_id is None:
+        return None
+    room_name = cluster.remote_lobby_states[worker_id]["rooms_info"][room_id]["room_name"]
+    room = RemoteRoom(cluster, room_id, room_name, worker_id, [])
+    remote_rooms[room_id] = room
+    return room
+
+cluster_tasks = set()
+
+def run_cluster_task(coroutine):
+    # Started in the order the messages came in, so room actions are queued in that order too.
+    task = asyncio.create_task(coroutine)
+    cluster_tasks.add(task)
+    task.add_done_callback(cluster_tasks.discard)
+
+def handle_cluster_message(message):
+    match message["type"]:
+        case "queue_info":
+            matchmaking.queue_info = message["queue_info"]
+            broadcast_server_info()
+        case "lobby_states":
+            broadcast_server_info()
+        case "match":
+            run_cluster_task(start_cluster_match(message))
+        case "frame":
+            player = player_manager.get_player(message["player_id"])
+            if player and player.connected:
+                player.outbound.put(message["text"])
+        case "room_closed":
+            room = remote_rooms.get(message["room_id"])
+            if room:
+                close_remote_room(room, message.get("worker_lost", False))
+                broadcast_server_info()
+        case "coordinator_lost":
+            run_cluster_task(close_cluster_rooms())
+        case "coordinator_reconnected":
+            # The coordinator forgot the queued players along with this worker.
+            matchmaking.requeue_players()
+            broadcast_server_info()
+        case _:
+            run_cluster_task(handle_remote_room_message(message))
+
+def close_remote_room(room : RemoteRoom, worker_lost : bool):
+    # Its worker is gone without ending the game, so the players and observers here are told.
+    if worker_lost:
+        for member in room.players + room.observers:
+            send_room_closed(member)
+    room.closed = True
+    cleanup_room(room)
+
+async def close_cluster_rooms():
+    # Nothing gets to or from the other workers without the coordinator, and it closes their side.
+    for room in list(remote_rooms.values()):
+        close_remote_room(room, True)
+    for room in game_rooms:
+        for member in [member for member in room.players + room.observers if isinstance(member, RemotePlayer)]:
+            if member in room.observers:
+                room.observers.remove(member)
+            elif not room.is_ready_for_cleanup():
+                member.connected = False
+                await room.handle_player_disconnect(member)
+        check_cleanup_room(room)
+    broadcast_server_info()
+
+def get_matched_player(player_info):
+    player = player_manager.get_player(player_info["player_id"])
+    if player is None:
+        # Left while the coordinator was making the match, they resign once the room is up.
+        player = Player(player_info["player_id"], None)
+        player.connected = False
+        player.username = player_info["username"]
+        player.save_deck_info(player_info["oshi_id"], player_info["deck"], player_info["cheer_deck"])
+    matchmaking.remove_matched_player(player)
+    return player
 
-    # Check for idle players.
-    removed_players = False
-    player_keys = list(player_manager.active_players.keys())
-    for player_id in player_keys:
-        player = player_manager.get_player(player_id)
-        if player:
-            if time.time() - player.last_seen > PLAYER_TIMEOUT_THRESHOLD:
-                logger.info(f"Player timed out: {player.get_username()} - {player.player_id}")
-                matchmaking.remove_player_from_queue(player)
-                for room in game_rooms:
-                    if player in room.players or player in room.observers:
-                        await room.handle_player_quit(player)
-                        check_cleanup_room(room)
-                        break
-                player.connected = False
-                player_manager.remove_player(player_id)
-                await manager.disconnect(player.websocket, True)
-                removed_players = True
+async def start_cluster_match(message):
+    try:
+        players = []
+        local_players = []
+        for player_info in message["players"]:
+            if player_info["worker_id"] == cluster.worker_id:
+                player = get_matched_player(player_info)
+                local_players.append(player)
+            else:
+                player = RemotePlayer(cluster, player_info)
+            players.append(player)
+
+        if message["owner_worker_id"] == cluster.worker_id:
+            room = GameRoom(message["room_id"], message["room_name"], players, message["game_type"], message["queue_name"])
+            game_rooms.add_room(room)
+            await room.start(card_db, engine_pool)
         else:
-            # Don't know exactly how this could happen but it did?
-            # Probably during an await something else removed the player.
-            player_manager.remove_player(player_id)
-            removed_players = True
-    if removed_players:
-        await broadcast_server_info()
+            room = RemoteRoom(cluster, message["room_id"], message["room_name"], message["owner_worker_id"], local_players)
+            remote_rooms[room.room_id] = room
+            for player in local_players:
+                game_rooms.add_member(room, player)
+
+        for player in local_players:
+            if not player.connected:
+                await room.handle_player_disconnect(player)
+        check_cleanup_room(room)
+        broadcast_server_info()
+    except Exception as e:
+        error_details = traceback.format_exc()
+        logger.error(f"Error starting cluster match {message['room_id']}: {e} Callstack: {error_details}")
+
+async def handle_remote_room_message(message):
+    # Messages from players and observers on other workers, for rooms on this one.
+    try:
+        room : GameRoom = game_rooms.get_room(message["room_id"])
+        if room is None:
+            logger.info(f"Ignoring {message['type']} for closed room {message['room_id']}")
+            return
+
+        if message["type"] == "room_observe":
+            observer = RemotePlayer(cluster, message["player"])
+            game_rooms.add_member(room, observer)
+            await room.join_as_observer(observer, message.get("from_snapshot", False))
+            check_cleanup_room(room)
+            broadcast_server_info()
+            return
+
+        player_id = message["player_id"]
+        member = next((member for member in room.players + room.observers if member.player_id == player_id), None)
+        if member is None:
+            logger.info(f"Ignoring {message['type']} from {player_id}, not in room {room.room_id}")
+            return
+
+        match message["type"]:
+            case "room_action":
+                if not room.is_ready_for_cleanup():
+                    await room.handle_game_message(player_id, message["action_type"], message["action_data"])
+                    check_cleanup_room(room)
+            case "room_emote":
+                if not room.is_ready_for_cleanup():
+                    await room.handle_emote_message(player_id, message["emote_id"])
+                    check_cleanup_room(room)
+            case "room_observer_events":
+                await room.observer_request_next_events(member, message["next_event_index"])
+                check_cleanup_room(room)
+            case "room_quit":
+                await room.handle_player_quit(member)
+                check_cleanup_room(room)
+                broadcast_server_info()
+            case "room_disconnect":
+                member.connected = False
+                await room.handle_player_disconnect(member)
+                check_cleanup_room(room)
+                broadcast_server_info()
+            case _:
+                logger.warning(f"Unknown cluster message {message['type']}")
+    except Exception as e:
+        error_details = traceback.format_exc()
+        logger.error(f"Error handling cluster message {message['type']}: {e} Callstack: {error_details}")
+
+# Checks for idle players in the background, at least every IDLE_TASK_TIMER seconds.
+idle_reaper : IdleReaper = IdleReaper(PLAYER_TIMEOUT_THRESHOLD, remove_idle_player, IDLE_TASK_TIMER)
 
 
 if __name__ == "__main__":
@@ -3,4 +3,10 @@ set -e
 pwd
 
 export PORT=${PORT:-8000}
-gunicorn --bind=0.0.0.0:$PORT --timeout 600 -w 1 -k uvicorn.workers.UvicornWorker server:app --error-logfile /home/LogFiles/gunicorn_error.log --access-logfile /home/LogFiles/gunicorn_access.log
+# More than one worker shares matchmaking and the lobby through the coordinator, see app/coordinator.py.
+export WORKERS=${WORKERS:-1}
+if [ "$WORKERS" -gt 1 ]; then
+    export CLUSTER_SOCKET=${CLUSTER_SOCKET:-/tmp/holoduel_coordinator.sock}
+    python -m app.coordinator "$CLUSTER_SOCKET" >> /home/LogFiles/coordinator.log 2>&1 &
+fi
+gunicorn --bind=0.0.0.0:$PORT --timeout 600 -w $WORKERS -k uvicorn.workers.UvicornWorker server:app --error-logfile /home/LogFiles/gunicorn_error.log --access-logfile /home/LogFiles/gunicorn_access.log
@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 import os, json
 from pathlib import Path
@@ -390,7 +391,7 @@ def end_turn_events(for_validation=True, new_center=False) -> list:
 def change_oshi(self: unittest.TestCase, player: PlayerState, oshi_id: str) -> list:
     engine: GameEngine = self.engine
 
-    oshi_card = engine.card_db.get_card_by_id(oshi_id)
+    oshi_card = engine.card_db.copy_card_by_id(oshi_id)
     self.assertIsNotNone(oshi_card, f"Invalid oshi id: {oshi_id}")
     self.assertEqual(oshi_card["card_type"], "oshi", f"Card {oshi_id} is not an oshi card")
 
@@ -398,4 +399,50 @@ def change_oshi(self: unittest.TestCase, player: PlayerState, oshi_id: str) -> l
     player.oshi_card = oshi_card
     player.oshi_card["game_card_id"] = player.player_id + "_oshi"
 
-    return reset_mainstep(self)
\ No newline at end of file
+    return reset_mainstep(self)
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, text):
+        self.messages.append(json.loads(text))
+
+class StuckWebSocket(FakeWebSocket):
+    # Nothing is sent until unstuck is set.
+    def __init__(self):
+        super().__init__()
+        self.unstuck = asyncio.Event()
+
+    async def send_text(self, text):
+        await self.unstuck.wait()
+        await super().send_text(text)
+
+MATCH_OSHIS = ["hSD01-001", "hSD01-002", "hYS01-001"]
+
+def make_match_data(index = 0, usernames = None, oshi_ids = None, winner = None):
+    # A finished match as it is logged, players, oshis and decks vary with the index.
+    usernames = usernames or ["player%d" % index, "player%d" % (index + 1)]
+    oshi_ids = oshi_ids or [MATCH_OSHIS[(index + player_index) % len(MATCH_OSHIS)] for player_index in range(len(usernames))]
+    player_info = [{
+        "username": username,
+        "oshi_id": oshi_id,
+        "deck": {"hSD01-003": 4, "hSD01-%03d" % (4 + index % 3): 2},
+        "cheer_deck": {"hY01-001": 20},
+    } for username, oshi_id in zip(usernames, oshi_ids)]
+    return {
+        "player_info": player_info,
+        "game_type": "versus",
+        "queue_name": "main_matchmaking_normal",
+        "winner": winner or usernames[index % 2],
+        "game_over_reason": "resign, conceded",
+        "starting_player": usernames[0],
+        "first_turn_player": usernames[index % 3 == 0],
+        "turn_number": index,
+        "player_clocks": [10.0, 20.5],
+        "player_final_life": ["0", "3"],
+        "seed": 2**32 - 1,
+        "all_events": [{"event_type": "draw", "event_player_id": usernames[0], "text": "a\n  \"b\": 1,"} for _ in range(20)],
+        "all_game_messages": [{"action_type": "pass", "player_id": usernames[1]}],
+        "all_game_cards_map": {"%s_1" % usernames[0]: "hSD01-003"},
+    }
@@ -3,6 +3,8 @@ import logging
 logger = logging.getLogger('app.card_database')
 
 from tests.helpers import *
+from app.card_database import GameCard
+from app.gameengine import CompiledCondition, compile_condition, copy_effects, replace_field_in_conditions
 
 class Test_CardDatabase(TestCase):
 
@@ -129,4 +131,129 @@ class Test_CardDatabase(TestCase):
       "hBP01-051": 4,     # 1st buzz Iroha Alt
     }, { "hY01-001": 10, "hY02-001": 10 })
     self.assertTrue(result)
-    mock_logger.assert_not_called()
\ No newline at end of file
+    mock_logger.assert_not_called()
+
+  def test_card_index_matches_all_cards(self):
+    for card in card_db.all_cards:
+      self.assertIs(card_db.get_card_by_id(card["card_id"]), card)
+    self.assertIsNone(card_db.get_card_by_id("INVALID CARD"))
+
+    alt_group = card_db.get_cards_by_alt_id("hBP01-071")
+    self.assertTrue(any(card["card_id"] == "hBP01-071" for card in alt_group))
+    self.assertTrue(any(card["card_id"] == "hBP01-071_UR" for card in alt_group))
+    self.assertEqual(card_db.get_cards_by_alt_id("INVALID CARD"), [])
+
+
+  def test_shared_definitions_are_read_only(self):
+    card = card_db.get_card_by_id("hBP01-009")
+    with self.assertRaises(TypeError):
+      card["damage"] = 10
+    with self.assertRaises(TypeError):
+      card["tags"].append("#Test")
+    with self.assertRaises(TypeError):
+      card["arts"][0]["power"] = 999
+    self.assertNotIn("damage", card_db.get_card_by_id("hBP01-009"))
+
+
+  def test_copy_card_by_id_is_mutable(self):
+    card = card_db.copy_card_by_id("hBP01-009")
+    card["damage"] = 10
+    card["tags"].append("#Test")
+    card["arts"][0]["power"] = 999
+
+    original = card_db.get_card_by_id("hBP01-009")
+    self.assertNotIn("damage", original)
+    self.assertNotIn("#Test", original["tags"])
+    self.assertNotEqual(original["arts"][0]["power"], 999)
+    self.assertIsNone(card_db.copy_card_by_id("INVALID CARD"))
+
+
+  def test_game_card_reads_through_definition(self):
+    definition = card_db.get_card_by_id("hBP01-009")
+    card = GameCard(definition, game_card_id="p1_1", damage=0)
+
+    self.assertEqual(card["card_id"], "hBP01-009")
+    self.assertEqual(card["hp"], definition["hp"])
+    self.assertIn("tags", card)
+    self.assertIsNone(card.get("missing_field"))
+    with self.assertRaises(KeyError):
+      card["missing_field"]
+
+    expected = deepcopy(definition)
+    expected.update(game_card_id="p1_1", damage=0)
+    self.assertEqual(dict(card), expected)
+    self.assertEqual(len(card), len(expected))
+
+
+  def test_game_card_writes_stay_on_instance(self):
+    definition = card_db.get_card_by_id("hBP01-009")
+    card = GameCard(definition, game_card_id="p1_1", damage=0)
+    other = GameCard(definition, game_card_id="p1_2", damage=0)
+
+    card["hp"] = 10
+    card["damage"] = 20
+    self.assertEqual(card["hp"], 10)
+    self.assertEqual(other["hp"], definition["hp"])
+    self.assertEqual(other["damage"], 0)
+    self.assertNotEqual(card, other)
+
+    copied = deepcopy(card)
+    copied["damage"] = 30
+    self.assertEqual(card["damage"], 20)
+    self.assertIs(copied.definition, definition)
+
+
+  def test_definition_conditions_are_compiled(self):
+    def find_conditions(value):
+      if isinstance(value, dict):
+        for key, item in value.items():
+          if key.endswith("conditions") and isinstance(item, list):
+            yield from item
+          else:
+            yield from find_conditions(item)
+      elif isinstance(value, list):
+        for item in value:
+          yield from find_conditions(item)
+
+    conditions = [condition for card in card_db.all_cards for condition in find_conditions(card)]
+    self.assertGreater(len(conditions), 0)
+    for condition in conditions:
+      self.assertIsInstance(condition, CompiledCondition)
+      self.assertTrue(callable(condition.evaluate))
+
+
+  def test_compile_condition_rejects_unknown_condition(self):
+    with self.assertRaises(NotImplementedError):
+      compile_condition({"condition": "not_a_condition"})
+
+
+  def test_compiled_conditions_are_shared_by_effect_copies(self):
+    condition = compile_condition({"condition": "performer_is_specific_id", "required_id": ""})
+    effect = {"effect_type": "power_boost", "conditions": [condition]}
+
+    copied = deepcopy(effect)
+    self.assertIs(copied["conditions"][0], condition)
+    with self.assertRaises(TypeError):
+      condition["required_id"] = "p1_1"
+
+    replace_field_in_conditions(copied, "required_id", "p1_1")
+    self.assertEqual(copied["conditions"][0]["required_id"], "p1_1")
+    self.assertEqual(condition["required_id"], "")
+
+
+  def test_effect_copies_share_definition_data(self):
+    definition = next(card for card in card_db.all_cards if any("and" in effect for effect in card.get("effects", [])))
+    effects = copy_effects(definition["effects"])
+    effect = next(effect for effect in effects if "and" in effect)
+
+    # Only the top level is copied, nested definition data stays shared.
+    self.assertIs(type(effect), dict)
+    self.assertIs(effect["and"], definition["effects"][effects.index(effect)]["and"])
+    effect["player_id"] = "p1"
+    self.assertNotIn("player_id", definition["effects"][effects.index(effect)])
+
+    # Dicts built at runtime are copied all the way down.
+    runtime_effect = {"effect_type": "power_boost", "turn_effect": {"amount": 10}}
+    copied = copy_effects([runtime_effect])[0]
+    copied["turn_effect"]["amount"] = 20
+    self.assertEqual(runtime_effect["turn_effect"]["amount"], 10)
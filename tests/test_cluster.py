@@ -0,0 +1,185 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+from app.aiplayer import DefaultAIDeck
+import app.cluster as cluster
+from app.cluster import ClusterClient, ClusterMatchmaking, RemotePlayer, RemoteRoom
+from app.coordinator import Coordinator
+from app.playermanager import Player
+from helpers import FakeWebSocket
+
+class Worker:
+    # Just enough of server.py to see what a worker gets from the coordinator.
+    def __init__(self, socket_path, worker_id):
+        self.cluster = ClusterClient(socket_path, worker_id)
+        self.matchmaking = ClusterMatchmaking(self.cluster)
+        self.players = {}
+        self.messages = []
+        self.received = asyncio.Event()
+
+    def on_message(self, message):
+        self.messages.append(message)
+        if message["type"] == "queue_info":
+            self.matchmaking.queue_info = message["queue_info"]
+        elif message["type"] == "frame":
+            self.players[message["player_id"]].outbound.put(message["text"])
+        elif message["type"] == "coordinator_reconnected":
+            self.matchmaking.requeue_players()
+        self.received.set()
+
+    async def wait_until(self, condition):
+        while not condition():
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), 5)
+
+    async def wait_for(self, message_type):
+        await self.wait_until(lambda: any(message["type"] == message_type for message in self.messages))
+        return next(message for message in self.messages if message["type"] == message_type)
+
+    def add_player(self, player_id):
+        player = Player(player_id, FakeWebSocket())
+        player.save_deck_info(DefaultAIDeck["oshi_id"], DefaultAIDeck["deck"], DefaultAIDeck["cheer_deck"])
+        self.players[player_id] = player
+        return player
+
+class TestCluster(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        socket_path = os.path.join(self.temp_dir.name, "coordinator.sock")
+        self.socket_path = socket_path
+        self.coordinator = Coordinator(socket_path)
+        await self.coordinator.start()
+        self.workers = [Worker(socket_path, "worker%d" % i) for i in [1, 2]]
+        for worker in self.workers:
+            await worker.cluster.connect(worker.on_message)
+
+    async def asyncTearDown(self):
+        for worker in self.workers:
+            await worker.cluster.close()
+        await self.coordinator.stop()
+        self.temp_dir.cleanup()
+
+    async def test_players_on_different_workers_are_matched(self):
+        worker1, worker2 = self.workers
+        player1 = worker1.add_player("player1")
+        player2 = worker2.add_player("player2")
+        worker1.matchmaking.add_player_to_queue(player1, "main_matchmaking_normal", False, "versus")
+        self.assertEqual(worker1.matchmaking.get_player_queue(player1), "main_matchmaking_normal")
+        self.assertEqual(player1.queue_name, "In Queue")
+        await worker1.cluster.drain()
+        while "player1" not in self.coordinator.queued_players:
+            await asyncio.sleep(0.01)
+        worker2.matchmaking.add_player_to_queue(player2, "main_matchmaking_normal", False, "versus")
+
+        match1 = await worker1.wait_for("match")
+        match2 = await worker2.wait_for("match")
+        self.assertEqual(match1, match2)
+        # The room goes to the worker of the player that was waiting first.
+        self.assertEqual(match1["owner_worker_id"], "worker1")
+        self.assertEqual([player["player_id"] for player in match1["players"]], ["player1", "player2"])
+        self.assertEqual([player["worker_id"] for player in match1["players"]], ["worker1", "worker2"])
+        self.assertEqual(self.coordinator.queued_players, {})
+
+        # Events for the remote player go through the coordinator to its connection.
+        remote_player = RemotePlayer(worker1.cluster, match1["players"][1])
+        remote_player.queue_game_event({"event_type": "test", "event_number": 0})
+        await remote_player.outbound.drain()
+        await worker2.wait_for("frame")
+        await player2.outbound.drain()
+        self.assertEqual(player2.websocket.messages, [{"message_type": "game_event", "event_data": {"event_type": "test", "event_number": 0}}])
+
+    async def queue_match(self, first_worker, first_player, second_worker, second_player):
+        first_worker.matchmaking.add_player_to_queue(first_player, "main_matchmaking_normal", False, "versus")
+        await first_worker.cluster.drain()
+        while first_player.player_id not in self.coordinator.queued_players:
+            await asyncio.sleep(0.01)
+        second_worker.matchmaking.add_player_to_queue(second_player, "main_matchmaking_normal", False, "versus")
+        await second_worker.cluster.drain()
+        await first_worker.wait_until(lambda: any(message["type"] == "match" and message["players"][0]["player_id"] == first_player.player_id for message in first_worker.messages))
+        return next(message for message in first_worker.messages if message["type"] == "match" and message["players"][0]["player_id"] == first_player.player_id)
+
+    async def test_rooms_are_closed_when_their_worker_leaves(self):
+        worker1, worker2 = self.workers
+        match1 = await self.queue_match(worker1, worker1.add_player("player1"), worker2, worker2.add_player("player2"))
+        match2 = await self.queue_match(worker2, worker2.add_player("player4"), worker1, worker1.add_player("player3"))
+        self.assertEqual(set(self.coordinator.cluster_rooms), {match1["room_id"], match2["room_id"]})
+
+        # A room worker1 published on its own, that someone on worker2 could be watching.
+        worker1.cluster.publish_lobby_state({}, {"room3": {"room_id": "room3", "room_name": "Match_room3"}})
+        await worker1.cluster.drain()
+        await worker2.wait_until(lambda: "worker1" in worker2.cluster.remote_lobby_states)
+
+        await worker1.cluster.close()
+        await worker2.wait_until(lambda: len([message for message in worker2.messages if message["type"] == "room_closed"]) == 2)
+        closed_room_ids = {message["room_id"] for message in worker2.messages if message["type"] == "room_closed"}
+        self.assertEqual(closed_room_ids, {match1["room_id"], "room3"})
+        # The room worker2 runs sees worker1's player disconnect.
+        await worker2.wait_for("room_disconnect")
+        disconnect = await worker2.wait_for("room_disconnect")
+        self.assertEqual((disconnect["room_id"], disconnect["player_id"]), (match2["room_id"], "player3"))
+        self.assertEqual(self.coordinator.cluster_rooms, {match2["room_id"]: {"owner_worker_id": "worker2", "player_workers": {"player4": "worker2", "player3": "worker1"}}})
+
+        # Players that leave a remote room are out of it right away.
+        player = worker2.players["player2"]
+        room = RemoteRoom(worker2.cluster, match1["room_id"], match1["room_name"], "worker1", [player])
+        # Only the owning worker closes it, not the game over check.
+        self.assertFalse(room.is_game_over())
+        await room.handle_player_quit(player)
+        self.assertIsNone(player.current_game_room)
+        self.assertEqual(room.players, [])
+
+    async def test_workers_reconnect_to_a_new_coordinator(self):
+        worker1, worker2 = self.workers
+        player1 = worker1.add_player("player1")
+        worker1.matchmaking.add_player_to_queue(player1, "main_matchmaking_normal", False, "versus")
+        worker1.cluster.publish_lobby_state({"player1": {"player_id": "player1"}}, {})
+        await worker1.cluster.drain()
+        await worker2.wait_until(lambda: "worker1" in worker2.cluster.remote_lobby_states)
+
+        with mock.patch.object(cluster, "RECONNECT_RETRY_SECONDS", 0.05):
+            await self.coordinator.stop()
+            await worker1.wait_for("coordinator_lost")
+            self.assertFalse(worker1.cluster.connected)
+            self.assertEqual(worker2.cluster.remote_lobby_states, {})
+            # Players can still queue, they are sent once the coordinator is back.
+            player2 = worker1.add_player("player2")
+            worker1.matchmaking.add_player_to_queue(player2, "main_matchmaking_normal", False, "versus")
+
+            self.coordinator = Coordinator(self.socket_path)
+            await self.coordinator.start()
+            await worker1.wait_for("coordinator_reconnected")
+            await worker2.wait_for("coordinator_reconnected")
+
+        # Queued in the same order, so they are matched, and the lobby is published again.
+        match = await worker1.wait_for("match")
+        self.assertEqual([player["player_id"] for player in match["players"]], ["player1", "player2"])
+        await worker2.wait_until(lambda: "worker1" in worker2.cluster.remote_lobby_states)
+        self.assertEqual(list(worker2.cluster.get_remote_lobby_state()[0]), ["player1"])
+
+    async def test_lobby_is_shared_between_workers(self):
+        worker1, worker2 = self.workers
+        worker1.cluster.publish_lobby_state({"player1": {"player_id": "player1"}}, {"room1": {"room_id": "room1", "room_name": "Match_room1"}})
+        await worker1.cluster.drain()
+        await worker2.wait_until(lambda: "worker1" in worker2.cluster.remote_lobby_states)
+
+        players_info, rooms_info = worker2.cluster.get_remote_lobby_state()
+        self.assertEqual(list(players_info), ["player1"])
+        self.assertEqual(worker2.cluster.get_room_worker("room1"), "worker1")
+        self.assertIsNone(worker1.cluster.get_room_worker("room1"))
+
+        # Queues are shared too, and a player leaving is taken out of them.
+        player2 = worker2.add_player("player2")
+        worker2.matchmaking.add_player_to_queue(player2, "main_matchmaking_normal", False, "versus")
+        await worker2.cluster.drain()
+        await worker1.wait_until(lambda: any(queue["players_count"] for queue in worker1.matchmaking.get_queue_info()))
+        worker2.matchmaking.remove_player_from_queue(player2)
+        self.assertIsNone(worker2.matchmaking.get_player_queue(player2))
+        await worker2.cluster.drain()
+        await worker1.wait_until(lambda: not any(queue["players_count"] for queue in worker1.matchmaking.get_queue_info()))
+        self.assertEqual(self.coordinator.queued_players, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
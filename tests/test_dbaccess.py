@@ -0,0 +1,72 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import app.dbaccess as dbaccess
+from app.dbaccess import MatchLogWriter
+from app.matchindex import MatchIndex
+from helpers import make_match_data
+
+class TestMatchLogWriter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        for name, path in [("MATCH_LOGS_DIR", "match_logs"), ("GAME_PACKAGE_DIR", "game_package")]:
+            patcher = mock.patch.object(dbaccess, name, os.path.join(self.temp_dir.name, path))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(dbaccess, "match_index", MatchIndex(os.path.join(self.temp_dir.name, "match_index.sqlite3")))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_logs_are_saved_off_the_event_loop(self):
+        writer = MatchLogWriter(queue_size=2)
+        threads = set()
+        upload = dbaccess.upload_match_to_blob_storage
+        def upload_in_thread(match_data):
+            threads.add(threading.get_ident())
+            upload(match_data)
+
+        with mock.patch.object(dbaccess, "upload_match_to_blob_storage", upload_in_thread):
+            for i in range(5):
+                await writer.write(make_match_data(i))
+            # Only the bounded queue is waiting, the rest have been taken by the worker.
+            self.assertLessEqual(writer.queue.qsize(), 2)
+            await writer.flush()
+
+        self.assertNotIn(threading.get_ident(), threads)
+        file_names = sorted(os.listdir(dbaccess.MATCH_LOGS_DIR))
+        # Written to a temp file and renamed, nothing half written is left.
+        self.assertEqual(len(file_names), 5)
+        self.assertTrue(all(file_name.endswith(".json") for file_name in file_names))
+        turn_numbers = []
+        for file_name in file_names:
+            with open(os.path.join(dbaccess.MATCH_LOGS_DIR, file_name), "r", encoding="utf-8") as f:
+                turn_numbers.append(json.load(f)["turn_number"])
+        self.assertEqual(sorted(turn_numbers), list(range(5)))
+        self.assertIsNone(writer.worker)
+
+        # Date range downloads come from the index.
+        self.assertEqual(dbaccess.match_index.get_match_ids(), set(file_names))
+        download_path = os.path.join(self.temp_dir.name, "download")
+        now = datetime.now(timezone.utc)
+        dbaccess.download_match_logs_between_dates(now - timedelta(days=1), now, download_path)
+        self.assertEqual(sorted(os.listdir(download_path)), file_names)
+        dbaccess.download_match_logs_between_dates(now - timedelta(days=2), now - timedelta(days=1), download_path + "_old")
+        self.assertEqual(os.listdir(download_path + "_old"), [])
+
+        # Logs that didn't make it into the index are added before it is queried.
+        unindexed_name = "match_unindexed.json"
+        with open(os.path.join(dbaccess.MATCH_LOGS_DIR, unindexed_name), "w", encoding="utf-8") as f:
+            json.dump(make_match_data(5, usernames=["unindexed1", "unindexed2"], winner="unindexed1"), f, indent=2)
+        dbaccess.download_match_logs_between_dates(now - timedelta(days=1), datetime.now(timezone.utc), download_path + "_new")
+        self.assertEqual(sorted(os.listdir(download_path + "_new")), sorted(file_names + [unindexed_name]))
+        self.assertEqual(dbaccess.match_index.find_matches(username="unindexed2")[0]["winner"], "unindexed1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@ import os
 import json
 from pathlib import Path
 import unittest
+from unittest import mock
 from app.gameengine import GameEngine, UNKNOWN_CARD_ID, ids_from_cards
+from app.serialization import encode_json
 from app.gameengine import EventType
 from app.gameengine import GameAction, GamePhase
 from app.card_database import CardDatabase
@@ -684,6 +686,159 @@ class TestGameEngine(unittest.TestCase):
         events = self.engine.grab_events()
         self.assertEqual(player2.backstage[-1]["resting"], False)
 
+    def test_card_index_tracks_zone_changes(self):
+        self.engine.begin_game()
+        player1 = self.engine.get_player(self.player1)
+        card = player1.deck[0]
+        card_id = card["game_card_id"]
+
+        found, zone, zone_name = player1.find_card(card_id)
+        self.assertIs(found, card)
+        self.assertIs(zone, player1.deck)
+        self.assertEqual(zone_name, "deck")
+
+        player1.move_card(card_id, "hand", no_events=True)
+        self.assertEqual(player1.find_card(card_id)[2], "hand")
+
+        # Zones can be reassigned directly, including slices of themselves.
+        player1.hand = player1.hand[:-1]
+        self.assertEqual(player1.find_card(card_id), (None, None, None))
+        player1.archive += [card]
+        self.assertEqual(player1.find_card(card_id)[2], "archive")
+        self.engine.shuffle_list(player1.archive)
+        player1.verify_card_index()
+
+        # Cards of the other player are not found in this player's zones.
+        player2 = self.engine.get_player(self.player2)
+        self.assertEqual(player2.find_card(card_id), (None, None, None))
+
+    def test_card_index_tracks_attachments(self):
+        player1 = self.engine.get_player(self.player1)
+        holomem = player1.deck[0]
+        cheer = player1.cheer_deck[0]
+        player1.deck.remove(holomem)
+        player1.cheer_deck.remove(cheer)
+        holomem["attached_cheer"].append(cheer)
+
+        # Attachments only count while the holder is on stage.
+        self.assertEqual(player1.find_attached(cheer["game_card_id"]), (None, None))
+        player1.center.append(holomem)
+        self.assertIs(self.engine.find_card(cheer["game_card_id"]), cheer)
+        attached, zone = player1.find_attached(cheer["game_card_id"])
+        self.assertIs(zone.holder, holomem)
+
+        holomem["attached_cheer"] = []
+        self.assertEqual(player1.find_attached(cheer["game_card_id"]), (None, None))
+        player1.verify_card_index()
+
+    def test_card_index_verify_detects_untracked_changes(self):
+        player1 = self.engine.get_player(self.player1)
+        player1.verify_card_index()
+        list.append(player1.hand, player1.deck[0])
+        with self.assertRaises(Exception):
+            player1.verify_card_index()
+
+    def test_mainstep_actions_follow_zone_changes(self):
+        self.engine.begin_game()
+        # The second starter deck has holomems.
+        self.engine.active_player_id = self.player2
+        player2 = self.engine.get_player(self.player2)
+        debuts = [card for card in player2.hand + player2.deck if card["card_type"] == "holomem_debut"]
+        for card in debuts[:3]:
+            player2.find_card(card["game_card_id"])[1].remove(card)
+        player2.center.append(debuts[0])
+        player2.backstage.append(debuts[1])
+        player2.hand.append(debuts[2])
+
+        actions = self.engine.get_available_mainstep_actions()
+        self.assertEqual(actions, self.engine.build_mainstep_actions(player2, {}))
+        self.assertIn({"action_type": GameAction.MainStepPlaceHolomem, "card_id": debuts[2]["game_card_id"]}, actions)
+        self.assertIn({"action_type": GameAction.MainStepCollab, "card_id": debuts[1]["game_card_id"]}, actions)
+
+        # Nothing changed, the same actions come back.
+        self.assertEqual(self.engine.get_available_mainstep_actions(), actions)
+
+        # Moving cards and changing card fields are picked up.
+        player2.hand.remove(debuts[2])
+        debuts[1]["resting"] = True
+        actions = self.engine.get_available_mainstep_actions()
+        self.assertEqual(actions, self.engine.build_mainstep_actions(player2, {}))
+        self.assertNotIn({"action_type": GameAction.MainStepPlaceHolomem, "card_id": debuts[2]["game_card_id"]}, actions)
+        self.assertNotIn({"action_type": GameAction.MainStepCollab, "card_id": debuts[1]["game_card_id"]}, actions)
+
+
+    def test_effect_registry_follows_stage_and_turn_effects(self):
+        self.players[1]["deck"] = {**sora_starter["deck"], "hBP02-009": 1}
+        engine = GameEngine(card_db, "versus", self.players)
+        player2 = engine.get_player(self.player2)
+        gift_card = next(card for card in player2.deck if card["card_id"] == "hBP02-009")
+        self.assertEqual(player2.get_effects_at_timing("before_art", None), [])
+
+        # Gift effects count while the holomem is on stage.
+        player2.deck.remove(gift_card)
+        player2.backstage.append(gift_card)
+        effects = player2.get_effects_at_timing("before_art", None)
+        self.assertEqual([effect["source_card_id"] for effect in effects], [gift_card["game_card_id"]])
+        self.assertIsNot(effects[0], gift_card["gift_effects"][0])
+        player2.backstage.remove(gift_card)
+        self.assertEqual(player2.get_effects_at_timing("before_art", None), [])
+
+        player2.add_turn_effect({"timing": "before_art", "effect_type": "power_boost", "amount": 10})
+        effects = player2.get_effects_at_timing("before_art", None)
+        self.assertEqual([effect["amount"] for effect in effects], [10])
+        player2.turn_effects = []
+        self.assertEqual(player2.get_effects_at_timing("before_art", None), [])
+
+    def test_card_stats_are_cached_until_the_card_changes(self):
+        self.players[1]["deck"] = {**sora_starter["deck"], "hBP01-119": 1}
+        engine = GameEngine(card_db, "versus", self.players)
+        player2 = engine.get_player(self.player2)
+        holomem = next(card for card in player2.deck if card["card_type"] == "holomem_debut")
+        support = next(card for card in player2.deck if card["card_id"] == "hBP01-119")
+        player2.deck.remove(holomem)
+        player2.deck.remove(support)
+        player2.center.append(holomem)
+        base_hp = holomem["hp"]
+        self.assertEqual(player2.get_card_hp(holomem), base_hp)
+        self.assertEqual(player2.get_cheer_color_counts(holomem), (0, 0, 0, 0, 0, 0))
+
+        # Nothing changed, so no effects are looked up again.
+        holomem["damage"] = 10
+        with mock.patch.object(player2, "get_effects_at_timing") as get_effects_at_timing:
+            self.assertEqual(player2.get_card_hp(holomem), base_hp)
+            self.assertEqual(player2.get_cheer_color_counts(holomem), (0, 0, 0, 0, 0, 0))
+            get_effects_at_timing.assert_not_called()
+
+        holomem["attached_support"].append(support)
+        self.assertEqual(player2.get_card_hp(holomem), base_hp + 10)
+        holomem["attached_cheer"].append(player2.cheer_deck.pop(0))
+        self.assertEqual(sum(player2.get_cheer_color_counts(holomem)), 1)
+
+        holomem["attached_support"].remove(support)
+        self.assertEqual(player2.get_card_hp(holomem), base_hp)
+
+    def test_broadcast_event_sanitizes_each_audience_once(self):
+        engine = GameEngine(card_db, "versus", self.players)
+        engine.broadcast_event({
+            "event_type": EventType.EventType_Draw,
+            "drawing_player_id": self.player1,
+            "hidden_info_player": self.player1,
+            "hidden_info_fields": ["drawn_card_ids"],
+            "hidden_info_erase": [],
+            "drawn_card_ids": ["player1_1", "player1_2"],
+        })
+        p1_event, p2_event = engine.grab_events()
+        observer_event, = engine.grab_observer_events()
+        self.assertEqual(p1_event["drawn_card_ids"], ["player1_1", "player1_2"])
+        self.assertEqual(p2_event["drawn_card_ids"], [UNKNOWN_CARD_ID] * 2)
+        self.assertEqual(observer_event["drawn_card_ids"], [UNKNOWN_CARD_ID] * 2)
+        self.assertEqual(observer_event["event_player_id"], "observer")
+        self.assertIsNot(p1_event.audience, p2_event.audience)
+        self.assertIs(p2_event.audience, observer_event.audience)
+
+        # The shared encoding gives the same json as encoding each event.
+        for event in [p1_event, p2_event, observer_event]:
+            self.assertEqual(json.loads(event.to_json()), json.loads(encode_json(dict(event))))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import json
+import random
+import tempfile
+from pathlib import Path
+import unittest
+from unittest import mock
+from app.gameengine import GameAction, EventType
+from app.gameroom import GameRoom
+from app.enginepool import EnginePool
+import app.dbaccess as dbaccess
+from app.card_database import CardDatabase
+from app.playermanager import Player
+from app.aiplayer import DefaultAIDeck
+from helpers import StuckWebSocket
+
+card_db = CardDatabase()
+
+decks_path = os.path.join(Path(__file__).parent.parent, "decks")
+with open(os.path.join(decks_path, "starter_sts.json"), "r") as f:
+    azki_starter = json.load(f)
+with open(os.path.join(decks_path, "starter_sora.json"), "r") as f:
+    sora_starter = json.load(f)
+
+class SlowWebSocket:
+    def __init__(self, rng):
+        self.rng = rng
+        self.message_types = []
+        self.events = []
+
+    async def send_text(self, text):
+        # Every send yields, so anything that isn't serialized gets interleaved.
+        await asyncio.sleep(self.rng.random() * 0.002)
+        message = json.loads(text)
+        self.message_types.append(message["message_type"])
+        if message["message_type"] == "game_event_batch":
+            self.events += message["events"]
+        else:
+            self.events.append(message["event_data"])
+
+class TestGameRoom(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Same game every run, none of them gets to an upload.
+        random.seed(2)
+        patcher = mock.patch.dict(os.environ, {"DONT_UPLOAD_MATCHES": "true"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_player(self, player_id, deck, rng):
+        player = Player(player_id, SlowWebSocket(rng))
+        player.save_deck_info(deck["oshi_id"], deck["deck"], deck["cheer_deck"])
+        return player
+
+    def strip_wall_clock(self, events):
+        # Clocks and emote times are wall clock, everything else comes from the seed.
+        for event in events:
+            for key in ["timestamp", "your_clock_used", "opponent_clock_used"]:
+                event.pop(key, None)
+        return events
+
+    def get_event_numbers(self, player):
+        return [event["event_number"] for event in player.websocket.events if event.get("event_number", -1) >= 0]
+
+    async def test_concurrent_messages_are_applied_and_sent_in_order(self):
+        rng = random.Random(0)
+        player1 = self.create_player("player1", azki_starter, rng)
+        player2 = self.create_player("player2", sora_starter, rng)
+        observer = self.create_player("observer", azki_starter, rng)
+        player1.game_event_batches = True
+        observer.game_event_batches = True
+        room = GameRoom("room", "Match", [player1, player2], "versus", "main_matchmaking_normal")
+        await room.start(card_db)
+
+        # Both players spam the mulligan decision while an observer joins, only the ones for the
+        # active player are valid and the rest get error events.
+        messages = [room.handle_game_message(room.engine.starting_player_id, GameAction.EffectResolution_MakeChoice, {"choice_index": 0})]
+        for i in range(40):
+            player = player1 if i % 2 else player2
+            messages.append(room.handle_game_message(player.player_id, GameAction.Mulligan, {"do_mulligan": False}))
+        messages.insert(15, room.join_as_observer(observer))
+        await asyncio.gather(*messages)
+        room.shutdown()
+        await room.action_worker
+        for player in [player1, player2, observer]:
+            await player.outbound.drain()
+
+        all_event_numbers = list(range(len(room.engine.all_events)))
+        self.assertGreater(len(all_event_numbers), 0)
+        self.assertEqual(self.get_event_numbers(player1), all_event_numbers)
+        self.assertEqual(self.get_event_numbers(player2), all_event_numbers)
+        # Catch up events first, then the live ones, with nothing missed or repeated.
+        self.assertEqual(self.get_event_numbers(observer), all_event_numbers)
+        errors = [event for event in player1.websocket.events + player2.websocket.events if event["event_type"] == EventType.EventType_GameError]
+        self.assertGreater(len(errors), 0)
+
+        # Closed rooms ignore anything that comes in late.
+        await room.handle_game_message(player1.player_id, GameAction.Mulligan, {"do_mulligan": False})
+        self.assertEqual(self.get_event_numbers(player1), all_event_numbers)
+
+    async def test_batches_have_the_events_from_one_step(self):
+        rng = random.Random(0)
+        player1 = self.create_player("player1", azki_starter, rng)
+        player2 = self.create_player("player2", sora_starter, rng)
+        player1.game_event_batches = True
+        room = GameRoom("room", "Match", [player1, player2], "versus", "main_matchmaking_normal")
+        await room.start(card_db)
+        await room.handle_game_message(room.engine.starting_player_id, GameAction.EffectResolution_MakeChoice, {"choice_index": 0})
+        await player1.outbound.drain()
+        await player2.outbound.drain()
+        room.shutdown()
+
+        # Old clients get the same events, a frame each.
+        self.assertEqual(player1.websocket.message_types, ["game_event_batch", "game_event_batch"])
+        self.assertEqual(set(player2.websocket.message_types), {"game_event"})
+        self.assertEqual(len(player2.websocket.message_types), len(player2.websocket.events))
+        self.assertEqual(self.get_event_numbers(player1), self.get_event_numbers(player2))
+        self.assertGreater(len(self.get_event_numbers(player1)), 2)
+
+    async def test_slow_observers_do_not_hold_up_the_game(self):
+        rng = random.Random(0)
+        player1 = self.create_player("player1", azki_starter, rng)
+        player2 = self.create_player("player2", sora_starter, rng)
+        observer = Player("observer", StuckWebSocket())
+        room = GameRoom("room", "Match", [player1, player2], "versus", "main_matchmaking_normal")
+        await room.start(card_db)
+        await room.join_as_observer(observer)
+        self.assertIn(observer, room.observers)
+        # Stuck writing the first catch up event, with room for a couple more.
+        await asyncio.sleep(0)
+        observer.outbound.limit = len(observer.outbound.messages) + 2
+
+        await room.handle_game_message(room.engine.starting_player_id, GameAction.EffectResolution_MakeChoice, {"choice_index": 0})
+        for _ in range(2):
+            await room.handle_game_message(room.engine.active_player_id, GameAction.Mulligan, {"do_mulligan": False})
+        await player1.outbound.drain()
+        await player2.outbound.drain()
+        all_event_numbers = list(range(len(room.engine.all_events)))
+        self.assertEqual(self.get_event_numbers(player1), all_event_numbers)
+        self.assertEqual(self.get_event_numbers(player2), all_event_numbers)
+
+        # The observer is dropped and told about it, after the message it was stuck on.
+        self.assertNotIn(observer, room.observers)
+        self.assertIsNone(observer.current_game_room)
+        observer.websocket.unstuck.set()
+        await observer.outbound.drain()
+        self.assertEqual(len(observer.websocket.messages), 2)
+        self.assertEqual(observer.websocket.messages[-1]["error_id"], "observer_dropped")
+        room.shutdown()
+
+    async def play_opening(self, engine_pool):
+        random.seed(2)
+        rng = random.Random(0)
+        player1 = self.create_player("player1", azki_starter, rng)
+        player2 = self.create_player("player2", sora_starter, rng)
+        observer = self.create_player("observer", azki_starter, rng)
+        room = GameRoom("room", "Match", [player1, player2], "versus", "main_matchmaking_normal")
+        await room.start(card_db, engine_pool)
+        await room.join_as_observer(observer)
+        await player1.outbound.drain()
+        starting_player = player1 if player1.websocket.events[0]["starting_player"] == player1.player_id else player2
+        await room.handle_game_message(starting_player.player_id, GameAction.EffectResolution_MakeChoice, {"choice_index": 0})
+        await room.handle_game_message(starting_player.player_id, GameAction.Mulligan, {"do_mulligan": False})
+        await room.handle_emote_message(player2.player_id, 1)
+        room.shutdown()
+        await room.action_worker
+        for player in [player1, player2, observer]:
+            await player.outbound.drain()
+        return room, [player.websocket.events for player in [player1, player2, observer]]
+
+    async def test_engine_processes_send_the_same_events(self):
+        _, local_events = await self.play_opening(None)
+        engine_pool = EnginePool(1)
+        self.addCleanup(engine_pool.shutdown)
+        room, pool_events = await self.play_opening(engine_pool)
+
+        self.assertIsNone(room.engine)
+        self.assertEqual(engine_pool.room_slots, {})
+        for events in local_events + pool_events:
+            self.strip_wall_clock(events)
+        self.assertEqual(pool_events, local_events)
+        self.assertGreater(len(pool_events[0]), 2)
+        self.assertEqual(pool_events[2][-1]["event_type"], EventType.EventType_Emote)
+
+    async def test_rooms_end_when_their_engine_process_dies(self):
+        engine_pool = EnginePool(1)
+        self.addCleanup(engine_pool.shutdown)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        for patcher in [mock.patch.object(dbaccess, "MATCH_LOGS_DIR", temp_dir.name), mock.patch.dict(os.environ)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop("DONT_UPLOAD_MATCHES")
+
+        players = [Player(player_id, StuckWebSocket()) for player_id in ["player1", "player2", "observer"]]
+        for player, deck in zip(players, [azki_starter, sora_starter, azki_starter]):
+            player.websocket.unstuck.set()
+            player.save_deck_info(deck["oshi_id"], deck["deck"], deck["cheer_deck"])
+        room = GameRoom("room", "Match", players[:2], "versus", "main_matchmaking_normal")
+        await room.start(card_db, engine_pool)
+        await room.join_as_observer(players[2])
+        self.assertEqual(len(os.listdir(temp_dir.name)), 1)
+
+        for process in list(engine_pool.executors[0]._processes.values()):
+            process.kill()
+        await room.handle_game_message("player1", GameAction.EffectResolution_MakeChoice, {"choice_index": 0})
+
+        # The room is over and everyone in it is told, its unfinished log is removed.
+        self.assertTrue(room.is_ready_for_cleanup())
+        self.assertEqual(engine_pool.room_slots, {})
+        self.assertEqual(engine_pool.room_counts, [0])
+        self.assertEqual(os.listdir(temp_dir.name), [])
+        for player in players:
+            await player.outbound.drain()
+            self.assertEqual(player.websocket.messages[-1]["error_id"], "room_closed")
+        await room.handle_emote_message("player2", 1)
+        room.shutdown()
+        await room.action_worker
+
+        # New rooms get a new process.
+        room = GameRoom("room2", "Match", players[:2], "versus", "main_matchmaking_normal")
+        await room.start(card_db, engine_pool)
+        self.assertEqual(engine_pool.room_counts, [1])
+        self.assertFalse(room.is_ready_for_cleanup())
+        room.shutdown()
+        await room.action_worker
+
+    async def start_ai_game(self, ticks):
+        # The AI goes first and takes its whole first turn as the game starts.
+        random.seed(0)
+        player = self.create_player("player1", DefaultAIDeck, random.Random(0))
+        player.game_event_batches = True
+        room = GameRoom("room", "Match", [player], "ai", "main_matchmaking_normal")
+        ticks_before = ticks[0]
+        await room.start(card_db)
+        ticks_during_start = ticks[0] - ticks_before
+        room.shutdown()
+        await player.outbound.drain()
+        return room, self.strip_wall_clock(player.websocket.events), ticks_during_start
+
+    async def test_ai_turns_give_up_the_event_loop(self):
+        ticks = [0]
+        async def tick():
+            while True:
+                ticks[0] += 1
+                await asyncio.sleep(0)
+        ticker = asyncio.create_task(tick())
+        self.addCleanup(ticker.cancel)
+
+        with mock.patch("app.gameroom.AI_TIME_BUDGET_SECONDS", 1000):
+            _, whole_turn_events, whole_turn_ticks = await self.start_ai_game(ticks)
+        with mock.patch("app.gameroom.AI_TIME_BUDGET_SECONDS", 0):
+            room, sliced_events, sliced_ticks = await self.start_ai_game(ticks)
+
+        # Same game either way, only with the loop given up between the AI's actions.
+        self.assertEqual(sliced_events, whole_turn_events)
+        self.assertGreater(len(sliced_events), 20)
+        self.assertGreater(sliced_ticks, whole_turn_ticks + 10)
+        self.assertGreater(room.engine_calls, 10)
+        self.assertGreater(room.loop_blocking_seconds, 0)
+        self.assertLessEqual(room.max_loop_blocking_seconds, room.loop_blocking_seconds)
+
+    async def test_observers_can_start_from_a_snapshot(self):
+        random.seed(0)
+        rng = random.Random(0)
+        player = self.create_player("player1", DefaultAIDeck, rng)
+        observer = self.create_player("observer", azki_starter, rng)
+        snapshot_observer = self.create_player("snapshot_observer", azki_starter, rng)
+        room = GameRoom("room", "Match", [player], "ai", "main_matchmaking_normal")
+        with mock.patch("app.gameengine.OBSERVER_SNAPSHOT_EVENTS", 5):
+            await room.start(card_db)
+        await room.join_as_observer(observer)
+        await observer.outbound.drain()
+        while observer.websocket.events[-1]["event_type"] != EventType.EventType_ObserverCaughtUp:
+            await room.observer_request_next_events(observer, len(observer.websocket.events))
+            await observer.outbound.drain()
+        await room.join_as_observer(snapshot_observer, True)
+        await snapshot_observer.outbound.drain()
+        room.shutdown()
+
+        # The snapshot stands in for the events before it, the rest are the same as catching up.
+        catchup_events = observer.websocket.events[:-1]
+        start_info, snapshot, *snapshot_events = snapshot_observer.websocket.events
+        self.assertEqual(start_info, catchup_events[0])
+        self.assertEqual(snapshot["event_type"], EventType.EventType_ObserverSnapshot)
+        self.assertGreater(snapshot["next_event_index"], 5)
+        self.assertEqual(snapshot_events, catchup_events[snapshot["next_event_index"]:] + [observer.websocket.events[-1]])
+        self.assertEqual(snapshot, room.engine.observer_snapshot)
+        # Hidden zones are only counted.
+        self.assertEqual([set(state) & {"hand", "deck", "life"} for state in snapshot["player_states"]], [set(), set()])
+
+    async def test_slow_players_are_disconnected(self):
+        player = Player("player1", StuckWebSocket())
+        player.websocket.close = mock.AsyncMock()
+        player.outbound.limit = 3
+        for i in range(4):
+            player.queue_game_event({"event_number": i})
+        await asyncio.sleep(0)
+        player.websocket.close.assert_awaited_once()
+        self.assertTrue(player.outbound.closed)
+        self.assertFalse(player.outbound.put("{}"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import time
+import unittest
+from unittest import mock
+import app.idlereaper as idlereaper
+from app.idlereaper import IdleReaper
+from app.playermanager import Player
+
+class TestIdleReaper(unittest.IsolatedAsyncioTestCase):
+    async def test_only_idle_players_are_reaped(self):
+        reaped = []
+        async def on_idle(player):
+            reaped.append(player.player_id)
+        reaper = IdleReaper(timeout=60, on_idle=on_idle, max_sleep=60)
+
+        now = time.time()
+        idle, active, new = Player("idle", None), Player("active", None), Player("new", None)
+        idle.last_seen = now - 120
+        active.last_seen = now - 120
+        for player in [idle, active, new]:
+            reaper.track(player)
+        # Sent a message since it was tracked.
+        active.last_seen = now
+
+        await reaper.reap()
+        self.assertEqual(reaped, ["idle"])
+        metrics = reaper.get_metrics()
+        self.assertEqual(metrics["tracked_players"], 2)
+        self.assertEqual(metrics["players_reaped"], 1)
+        self.assertEqual(metrics["deadlines_moved"], 1)
+        # Nothing else is due before the next deadline.
+        self.assertGreater(reaper.get_sleep_time(), 50)
+
+        reaper.untrack(new)
+        new.last_seen = now - 120
+        active.last_seen = now - 120
+        reaper.deadlines = [(now - 1, player_id) for _, player_id in reaper.deadlines]
+        await reaper.reap()
+        self.assertEqual(reaped, ["idle", "active"])
+
+    async def test_players_are_reaped_when_removing_one_fails(self):
+        reaped = []
+        async def on_idle(player):
+            reaped.append(player.player_id)
+            if player.player_id == "first":
+                raise RuntimeError("remove failed")
+        reaper = IdleReaper(timeout=60, on_idle=on_idle, max_sleep=60)
+
+        first, second = Player("first", None), Player("second", None)
+        first.last_seen = time.time() - 180
+        second.last_seen = time.time() - 120
+        reaper.track(first)
+        reaper.track(second)
+
+        with mock.patch.object(idlereaper.logger, "error") as log_error:
+            idle_players = await reaper.reap()
+        log_error.assert_called_once()
+        self.assertEqual(reaped, ["first", "second"])
+        self.assertEqual(idle_players, [first, second])
+        self.assertEqual(reaper.get_metrics()["tracked_players"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
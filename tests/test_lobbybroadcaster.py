@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from app.lobbybroadcaster import LobbyBroadcaster
+from app.matchmaking import Matchmaking
+from app.playermanager import PlayerManager
+from helpers import FakeWebSocket, StuckWebSocket
+
+class TestLobbyBroadcaster(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.player_manager = PlayerManager()
+        self.broadcaster = LobbyBroadcaster(self.player_manager, Matchmaking(), [], delay=3600)
+
+    def add_player(self, player_id, lobby_deltas):
+        player = self.player_manager.add_player(player_id, FakeWebSocket())
+        player.lobby_deltas = lobby_deltas
+        self.broadcaster.request_snapshot(player)
+        return player
+
+    async def flush(self):
+        await self.broadcaster.flush()
+        for player in list(self.player_manager.active_players.values()):
+            await player.outbound.drain()
+
+    async def asyncTearDown(self):
+        if self.broadcaster.flush_task:
+            self.broadcaster.flush_task.cancel()
+
+    async def test_changes_are_coalesced_into_one_delta(self):
+        player1 = self.add_player("player1", lobby_deltas=True)
+        await self.flush()
+        snapshot, = player1.websocket.messages
+        self.assertEqual(snapshot["message_type"], "server_info")
+        self.assertEqual(snapshot["your_id"], "player1")
+        self.assertEqual([info["player_id"] for info in snapshot["players_info"]], ["player1"])
+
+        player2 = self.add_player("player2", lobby_deltas=True)
+        self.add_player("player3", lobby_deltas=False)
+        self.player_manager.remove_player("player3")
+        player1.set_queue("In Queue")
+        self.broadcaster.request_update()
+        await self.flush()
+
+        delta = player1.websocket.messages[-1]
+        self.assertEqual(len(player1.websocket.messages), 2)
+        self.assertEqual(delta["message_type"], "server_info_delta")
+        self.assertEqual((delta["base_version"], delta["version"]), (snapshot["version"], snapshot["version"] + 1))
+        self.assertEqual([info["player_id"] for info in delta["players_added"]], ["player2"])
+        self.assertEqual([info["queue"] for info in delta["players_changed"]], ["In Queue"])
+        self.assertEqual(delta["players_removed"], [])
+        # The new player gets a snapshot at the same version instead.
+        snapshot2, = player2.websocket.messages
+        self.assertEqual(snapshot2["version"], delta["version"])
+
+        # Nothing changed, nothing sent.
+        await self.flush()
+        self.assertEqual(len(player1.websocket.messages), 2)
+
+    async def test_clients_without_deltas_get_full_server_info(self):
+        player1 = self.add_player("player1", lobby_deltas=False)
+        await self.flush()
+        self.add_player("player2", lobby_deltas=True)
+        await self.flush()
+
+        message = player1.websocket.messages[-1]
+        self.assertEqual(message["message_type"], "server_info")
+        self.assertEqual([info["player_id"] for info in message["players_info"]], ["player1", "player2"])
+
+        self.player_manager.remove_player("player2")
+        self.broadcaster.request_update()
+        await self.flush()
+        self.assertEqual([info["player_id"] for info in player1.websocket.messages[-1]["players_info"]], ["player1"])
+
+    async def test_a_stuck_client_does_not_hold_up_the_others(self):
+        stuck = self.player_manager.add_player("stuck", StuckWebSocket())
+        stuck.lobby_deltas = True
+        self.broadcaster.request_snapshot(stuck)
+        player1 = self.add_player("player1", lobby_deltas=True)
+        await asyncio.wait_for(self.broadcaster.flush(), 5)
+        self.add_player("player2", lobby_deltas=True)
+        await asyncio.wait_for(self.broadcaster.flush(), 5)
+
+        await asyncio.wait_for(player1.outbound.drain(), 5)
+        self.assertEqual([message["message_type"] for message in player1.websocket.messages], ["server_info", "server_info_delta"])
+        # Queued behind the first snapshot, in order.
+        self.assertEqual(len(stuck.outbound.messages), 1)
+        stuck.outbound.close()
+        stuck.outbound.writer.cancel()
+
+
+if __name__ == '__main__':
+    unittest.main()
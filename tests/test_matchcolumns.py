@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import unittest
+from app.card_database import CardDatabase
+from app.matchcolumns import MatchColumns, card_cooccurrence, card_win_rate_deltas, export_match_logs, get_column_path
+from app.matchlog import MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION
+from app.matchstats import MatchStats
+from helpers import make_match_data
+from test_matchstats import write_match_log
+
+card_db = CardDatabase()
+
+class TestMatchColumns(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.match_logs_dir = os.path.join(self.temp_dir.name, "match_logs")
+        self.export_dir = os.path.join(self.temp_dir.name, "match_columns")
+        os.makedirs(self.match_logs_dir)
+
+    def open_columns(self):
+        columns = MatchColumns(self.export_dir)
+        self.addCleanup(columns.close)
+        return columns
+
+    def test_logs_are_exported_incrementally(self):
+        for index in range(6):
+            write_match_log(self.match_logs_dir, index, [MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION][index % 2])
+        self.assertEqual(export_match_logs(self.match_logs_dir, self.export_dir, card_db), 6)
+        self.assertEqual(export_match_logs(self.match_logs_dir, self.export_dir, card_db), 0)
+
+        # Values from an export that didn't get to its manifest are cut off by the next one.
+        with open(get_column_path(self.export_dir, "won"), "ab") as f:
+            f.write(b"\x01\x01")
+        match_data = make_match_data(6)
+        match_data["player_info"][1]["deck"]["hXX99-001"] = 3
+        file_path = os.path.join(self.match_logs_dir, "match006" + LEGACY_MATCH_LOG_EXTENSION)
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(match_data, f, indent=2)
+        self.assertEqual(export_match_logs(self.match_logs_dir, self.export_dir, card_db), 1)
+
+        columns = self.open_columns()
+        self.assertEqual(columns.row_count, 14)
+        self.assertEqual(len(columns.won), 14)
+        self.assertEqual(os.path.getsize(get_column_path(self.export_dir, "won")), 14)
+        # Card indexes are the card database's, cards it doesn't have come after them.
+        self.assertEqual(columns.card_ids[:len(card_db.cards_by_id)], list(card_db.cards_by_id))
+        self.assertEqual(columns.card_ids[-1], "hXX99-001")
+
+        for row in range(columns.row_count):
+            match_index = columns.match[row]
+            expected = make_match_data(match_index) if match_index < 6 else match_data
+            player = expected["player_info"][columns.player_index[row]]
+            extension = LEGACY_MATCH_LOG_EXTENSION if match_index % 2 or match_index == 6 else MATCH_LOG_EXTENSION
+            self.assertEqual(columns.match_ids[match_index], "match%03d%s" % (match_index, extension))
+            self.assertEqual(columns.won[row], player["username"] == expected["winner"])
+            self.assertEqual(columns.went_first[row], player["username"] == expected["first_turn_player"])
+            self.assertEqual(columns.card_ids[columns.oshi[row]], player["oshi_id"])
+            self.assertEqual(columns.turn_number[row], expected["turn_number"])
+            start = columns.card_end[row - 1] if row else 0
+            cards = {columns.card_ids[columns.card_index[i]]: columns.card_count[i] for i in range(start, columns.card_end[row])}
+            self.assertEqual(cards, {**player["deck"], **player["cheer_deck"]})
+
+    def test_card_stats_come_from_the_columns(self):
+        stats = MatchStats()
+        for index in range(10):
+            stats.add_match(write_match_log(self.match_logs_dir, index, MATCH_LOG_EXTENSION))
+        export_match_logs(self.match_logs_dir, self.export_dir, card_db)
+        columns = self.open_columns()
+
+        deltas = {card_id: (games, win_percentage, delta) for card_id, games, win_percentage, delta in card_win_rate_deltas(columns)}
+        for row in stats.card_win_rates():
+            games, win_percentage, delta = deltas[row.key]
+            self.assertEqual(games, row.games)
+            self.assertAlmostEqual(win_percentage, row.win_percentage)
+        # In every deck, so there are no decks without it to compare to.
+        self.assertIsNone(deltas["hSD01-003"][2])
+        # One winner per game, so the decks without the card won the rest.
+        other_win_percentage = (stats.total_games - stats.card_wins["hSD01-004"]) / (stats.total_games * 2 - stats.card_games["hSD01-004"]) * 100
+        self.assertAlmostEqual(deltas["hSD01-004"][2], deltas["hSD01-004"][1] - other_win_percentage)
+
+        pairs = card_cooccurrence(columns)
+        card_indexes = {card_id: card_index for card_index, card_id in enumerate(columns.card_ids)}
+        self.assertEqual(pairs[tuple(sorted([card_indexes["hSD01-003"], card_indexes["hY01-001"]]))], 20)
+        self.assertEqual(pairs[tuple(sorted([card_indexes["hSD01-003"], card_indexes["hSD01-004"]]))], stats.card_games["hSD01-004"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import app.matchindex as matchindex
+from app.matchindex import MatchIndex
+from app.matchlog import HISTORY_FIELDS, MATCH_LOG_EXTENSION, MatchLogStream
+from helpers import make_match_data
+
+class TestMatchIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.match_index = MatchIndex(os.path.join(self.temp_dir.name, "match_index.sqlite3"))
+
+    def test_matches_are_found_by_date_player_and_oshi(self):
+        # The schema is only created on the first connection.
+        with mock.patch.object(self.match_index, "create", wraps=self.match_index.create) as create:
+            self.match_index.add_match("match1.json", make_match_data(usernames=["alice", "bob"], oshi_ids=["hSD01-001", "hSD01-002"], winner="alice"), 100)
+            self.match_index.add_match("match2.jsonl.gz", make_match_data(usernames=["bob", "carol"], oshi_ids=["hSD01-002", "hYS01-001"], winner="carol"), 200)
+            self.match_index.add_match("match3.jsonl.gz", make_match_data(usernames=["carol", "alice"], oshi_ids=["hYS01-001", "hSD01-001"], winner="carol"), 300)
+        create.assert_called_once_with()
+
+        def match_ids(**filters):
+            return [match["match_id"] for match in self.match_index.find_matches(**filters)]
+        self.assertEqual(match_ids(), ["match1.json", "match2.jsonl.gz", "match3.jsonl.gz"])
+        self.assertEqual(match_ids(start_time=150, end_time=300), ["match2.jsonl.gz", "match3.jsonl.gz"])
+        self.assertEqual(match_ids(username="alice"), ["match1.json", "match3.jsonl.gz"])
+        self.assertEqual(match_ids(oshi_id="hSD01-002", end_time=150), ["match1.json"])
+        self.assertEqual(match_ids(username="alice", oshi_id="hSD01-002"), ["match1.json"])
+
+        # Matches look like match logs without the history, for analyze_match_data.py.
+        match = self.match_index.find_matches(username="bob", start_time=150)[0]
+        expected = make_match_data(usernames=["bob", "carol"], oshi_ids=["hSD01-002", "hYS01-001"], winner="carol")
+        for key, value in expected.items():
+            if key not in HISTORY_FIELDS:
+                self.assertEqual(match[key], value, key)
+
+        # Adding a match again replaces it.
+        self.match_index.add_match("match1.json", make_match_data(usernames=["alice", "dave"], oshi_ids=["hSD01-001", "hSD01-002"], winner="dave"), 100)
+        self.assertEqual(match_ids(username="bob"), ["match2.jsonl.gz"])
+        self.assertEqual(match_ids(username="dave"), ["match1.json"])
+
+    def test_logs_from_before_the_index_are_added(self):
+        match_logs_dir = os.path.join(self.temp_dir.name, "match_logs")
+        os.makedirs(match_logs_dir)
+        match_data = make_match_data(usernames=["alice", "bob"], oshi_ids=["hSD01-001", "hSD01-002"], winner="bob")
+        for file_name in ["match1" + MATCH_LOG_EXTENSION, "match2" + MATCH_LOG_EXTENSION]:
+            match_log = MatchLogStream(os.path.join(match_logs_dir, file_name))
+            match_log.write_header(match_data)
+            match_log.finish(match_data)
+        self.match_index.add_match("match1" + MATCH_LOG_EXTENSION, make_match_data(usernames=["alice", "bob"], oshi_ids=["hSD01-001", "hSD01-002"], winner="bob"))
+        with open(os.path.join(match_logs_dir, "notes.txt"), "w") as f:
+            f.write("not a match log")
+
+        # Only the summary is read from each new log.
+        with mock.patch.object(matchindex, "read_match_summary", wraps=matchindex.read_match_summary) as read_summary:
+            self.assertEqual(self.match_index.add_unindexed_logs(match_logs_dir), 1)
+        read_summary.assert_called_once_with(os.path.join(match_logs_dir, "match2" + MATCH_LOG_EXTENSION))
+        self.assertEqual(self.match_index.get_match_ids(), {"match1" + MATCH_LOG_EXTENSION, "match2" + MATCH_LOG_EXTENSION})
+        self.assertEqual(self.match_index.add_unindexed_logs(match_logs_dir), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
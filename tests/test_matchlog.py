@@ -0,0 +1,88 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+import app.dbaccess as dbaccess
+from app.card_database import CardDatabase
+from app.gameengine import GameAction
+from app.gameroom import GameRoom
+from app.matchindex import MatchIndex
+from app.matchlog import MATCH_LOG_EXTENSION, read_match_log
+from app.playermanager import Player
+from test_gameroom import SlowWebSocket, azki_starter, sora_starter
+
+card_db = CardDatabase()
+
+class TestMatchLog(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        random.seed(2)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.match_logs_dir = os.path.join(self.temp_dir.name, "match_logs")
+        self.match_index = MatchIndex(os.path.join(self.temp_dir.name, "match_index.sqlite3"))
+        self.match_log_writer = dbaccess.MatchLogWriter()
+        for patcher in [
+            mock.patch.object(dbaccess, "MATCH_LOGS_DIR", self.match_logs_dir),
+            mock.patch.object(dbaccess, "match_index", self.match_index),
+            mock.patch("app.gameroom.match_log_writer", self.match_log_writer),
+            mock.patch.object(dbaccess, "GAME_PACKAGE_DIR", os.path.join(self.temp_dir.name, "game_package")),
+            mock.patch.dict(os.environ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop("DONT_UPLOAD_MATCHES", None)
+
+    async def start_room(self):
+        rng = random.Random(0)
+        players = []
+        for player_id, deck in [("player1", azki_starter), ("player2", sora_starter)]:
+            player = Player(player_id, SlowWebSocket(rng))
+            player.save_deck_info(deck["oshi_id"], deck["deck"], deck["cheer_deck"])
+            players.append(player)
+        room = GameRoom("room", "Match", players, "versus", "main_matchmaking_normal")
+        await room.start(card_db)
+        await room.handle_emote_message("player2", 1)
+        return room
+
+    async def test_logs_are_written_as_the_game_goes(self):
+        room = await self.start_room()
+        # Written so far, under a temp name until the game is over.
+        file_names = os.listdir(self.match_logs_dir)
+        self.assertEqual(len(file_names), 1)
+        self.assertTrue(file_names[0].endswith(MATCH_LOG_EXTENSION + ".tmp"))
+
+        # With these decks the game is over in the first draw.
+        await room.handle_game_message(room.engine.starting_player_id, GameAction.EffectResolution_MakeChoice, {"choice_index": 0})
+        self.assertTrue(room.is_game_over())
+        room.shutdown()
+        await room.action_worker
+        await self.match_log_writer.flush()
+        file_name, = os.listdir(self.match_logs_dir)
+        self.assertTrue(file_name.endswith(MATCH_LOG_EXTENSION))
+        match_data = read_match_log(os.path.join(self.match_logs_dir, file_name))
+
+        # The same as the legacy log, which read_match_log also reads.
+        expected = json.loads(json.dumps({**room.engine.get_match_log(), "queue_name": "main_matchmaking_normal"}))
+        self.assertEqual(match_data, expected)
+        self.assertGreater(len(match_data["all_events"]), 5)
+        dbaccess.upload_match_to_local_storage(expected)
+        legacy_file_name, = [name for name in os.listdir(self.match_logs_dir) if name != file_name]
+        self.assertEqual(read_match_log(os.path.join(self.match_logs_dir, legacy_file_name)), expected)
+
+        # Both are indexed once saved.
+        indexed_matches = {match["match_id"]: match for match in self.match_index.find_matches(username=expected["player_info"][0]["username"])}
+        self.assertEqual(set(indexed_matches), {file_name, legacy_file_name})
+        self.assertEqual(indexed_matches[file_name]["winner"], expected["winner"])
+        self.assertEqual(indexed_matches[file_name]["queue_name"], "main_matchmaking_normal")
+
+    async def test_unfinished_logs_are_removed(self):
+        room = await self.start_room()
+        room.shutdown()
+        await room.action_worker
+        self.assertEqual(os.listdir(self.match_logs_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
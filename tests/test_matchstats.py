@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import app.matchstats as matchstats
+from app.matchlog import HISTORY_FIELDS, MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION, MatchLogStream, read_match_log, read_match_summary
+from app.matchstats import MatchStats, analyze_match_logs, load_state, save_state, wilson_interval
+from helpers import make_match_data
+
+def write_match_log(match_logs_dir, index, extension):
+    match_data = make_match_data(index)
+    file_path = os.path.join(match_logs_dir, "match%03d%s" % (index, extension))
+    if extension == MATCH_LOG_EXTENSION:
+        match_log = MatchLogStream(file_path)
+        match_log.write_header({**match_data, "winner": None})
+        match_log.append_game_messages(match_data["all_game_messages"])
+        match_log.append_events(match_data["all_events"])
+        match_log.finish(match_data)
+    else:
+        # As upload_match_to_local_storage writes them.
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(match_data, f, indent=2, ensure_ascii=False)
+    return match_data
+
+class TestMatchStats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.match_logs_dir = os.path.join(self.temp_dir.name, "match_logs")
+        os.makedirs(self.match_logs_dir)
+
+    def test_summaries_leave_out_the_history(self):
+        for index, extension in enumerate([MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION]):
+            match_data = write_match_log(self.match_logs_dir, index, extension)
+            file_path = os.path.join(self.match_logs_dir, "match%03d%s" % (index, extension))
+            expected = {key: value for key, value in read_match_log(file_path).items() if key not in HISTORY_FIELDS}
+            self.assertEqual(read_match_summary(file_path), expected)
+            self.assertEqual(expected["winner"], match_data["winner"])
+
+    def test_logs_are_analyzed_in_chunks_and_incrementally(self):
+        expected = MatchStats()
+        for index in range(12):
+            expected.add_match(write_match_log(self.match_logs_dir, index, [MATCH_LOG_EXTENSION, LEGACY_MATCH_LOG_EXTENSION][index % 2]))
+        with open(os.path.join(self.match_logs_dir, "notes.txt"), "w") as f:
+            f.write("not a match log")
+
+        with mock.patch.object(matchstats, "ANALYZE_CHUNK_SIZE", 5):
+            stats, match_ids = analyze_match_logs(self.match_logs_dir, processes=2)
+        self.assertEqual(stats.to_dict(), expected.to_dict())
+        self.assertEqual(len(match_ids), 12)
+        self.assertEqual(stats.oshi_games["hSD01-001"], 8)
+        self.assertEqual(stats.card_games["hSD01-003"], 24)
+
+        # A later run only reads the new logs, on top of the saved state.
+        state_path = os.path.join(self.temp_dir.name, "match_stats.json")
+        save_state(state_path, stats, match_ids)
+        for index in range(12, 15):
+            expected.add_match(write_match_log(self.match_logs_dir, index, MATCH_LOG_EXTENSION))
+        stats, analyzed_match_ids = load_state(state_path)
+        with mock.patch.object(matchstats, "read_match_summary", wraps=read_match_summary) as read_summary:
+            new_stats, new_match_ids = analyze_match_logs(self.match_logs_dir, analyzed_match_ids)
+        self.assertEqual(read_summary.call_count, 3)
+        self.assertEqual(stats.merge(new_stats).to_dict(), expected.to_dict())
+        self.assertEqual(len(analyzed_match_ids.union(new_match_ids)), 15)
+
+    def test_win_rates_have_confidence_intervals(self):
+        low, high = wilson_interval(5, 10)
+        self.assertAlmostEqual(low, 0.2366, places=4)
+        self.assertAlmostEqual(high, 0.7634, places=4)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 0.0))
+
+        stats = MatchStats()
+        for index in range(30):
+            stats.add_match(make_match_data(index))
+        rows = stats.oshi_win_rates()
+        self.assertEqual([row.win_percentage for row in rows], sorted([row.win_percentage for row in rows], reverse=True))
+        self.assertEqual(sum(row.games for row in rows), 60)
+        for row in rows:
+            self.assertLess(row.low_percentage, row.win_percentage)
+            self.assertGreater(row.high_percentage, row.win_percentage)
+        deck_keys = {row.key for row in stats.deck_win_rates()}
+        self.assertIn("hSD01-001,hSD01-003:4,hSD01-004:2,hY01-001:20", deck_keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ from app.gameengine import GameEngine, UNKNOWN_CARD_ID, ids_from_cards, PlayerSt
 from app.gameengine import EventType, GameOverReason
 from app.gameengine import GameAction, GamePhase
 from app.card_database import CardDatabase
+from app.matchlog import read_match_log
 from helpers import RandomOverride, initialize_game_to_third_turn, validate_event, validate_actions, do_bloom, reset_mainstep, add_card_to_hand, do_cheer_step_on_card
 from helpers import end_turn, validate_last_event_is_error, validate_last_event_not_error, do_collab_get_events, set_next_die_rolls
 from helpers import put_card_in_play, spawn_cheer_on_card, reset_performancestep
@@ -24,9 +25,8 @@ class TestReplayMatch(unittest.TestCase):
         # For each match log, load the match and replay it.
         match_logs_path = os.path.join(Path(__file__).parent, "test_match_logs")
         for match_log in os.listdir(match_logs_path):
-            with open(os.path.join(match_logs_path, match_log), "r") as f:
-                match_data = json.load(f)
-                self.replay_match(match_data)
+            match_data = read_match_log(os.path.join(match_logs_path, match_log))
+            self.replay_match(match_data)
 
     def replay_match(self, match_data):
 
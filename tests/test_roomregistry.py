@@ -0,0 +1,34 @@
+import unittest
+from app.gameroom import GameRoom
+from app.playermanager import Player
+from app.roomregistry import RoomRegistry
+
+class TestRoomRegistry(unittest.TestCase):
+    def test_rooms_are_found_by_id_and_member(self):
+        registry = RoomRegistry()
+        player1, player2, observer = Player("player1", None), Player("player2", None), Player("observer", None)
+        rooms = [GameRoom("room%d" % i, "Match", [Player("other%d" % i, None)], "ai", "main_matchmaking_ai") for i in range(100)]
+        room = GameRoom("room", "Match", [player1, player2], "versus", "main_matchmaking_normal")
+        for other_room in rooms + [room]:
+            registry.add_room(other_room)
+
+        self.assertIs(registry.get_room("room"), room)
+        self.assertIs(registry.get_player_room(player2), room)
+        self.assertIsNone(registry.get_player_room(observer))
+        self.assertEqual(len(registry), 101)
+
+        room.observers.append(observer)
+        registry.add_member(room, observer)
+        self.assertIs(registry.get_player_room(observer), room)
+        # Observers leave through the room itself.
+        room.observers.remove(observer)
+        self.assertIsNone(registry.get_player_room(observer))
+
+        registry.remove_room(room)
+        self.assertIsNone(registry.get_room("room"))
+        self.assertIsNone(registry.get_player_room(player1))
+        self.assertNotIn(room, list(registry))
+
+
+if __name__ == '__main__':
+    unittest.main()
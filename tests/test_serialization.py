@@ -0,0 +1,42 @@
+import json
+import unittest
+from app.card_database import CardDatabase, GameCard
+from app.serialization import encode_json, extend_json_object
+from app.message_types import ServerInfoMessage
+
+class TestSerialization(unittest.TestCase):
+    def test_encode_json_matches_stdlib(self):
+        value = {"event_type": "draw", "ids": ["p1_1", None], "amount": 10, "clock": 1.5, "name": "ときのそら", 3: True}
+        self.assertEqual(json.loads(encode_json(value)), json.loads(json.dumps(value)))
+
+    def test_game_cards_are_encoded_with_their_definition(self):
+        # GameCards keep only their per-game fields in the dict itself, the rest is read from the definition.
+        definition = CardDatabase().get_card_by_id("hSD01-003")
+        game_card = GameCard(definition, game_card_id="p1_1", damage=10)
+        value = {"card": game_card, "cards": [game_card], "definition": definition}
+        expected = {"card": dict(game_card.items()), "cards": [dict(game_card.items())], "definition": json.loads(json.dumps(definition))}
+        self.assertEqual(json.loads(encode_json(value)), expected)
+        self.assertEqual(json.loads(encode_json(value))["card"]["card_id"], "hSD01-003")
+
+    def test_extend_json_object(self):
+        shared_json = encode_json({"message_type": "server_info", "players_info": []})
+        message_json = extend_json_object(shared_json, {"your_id": "id", "your_username": "name"})
+        self.assertEqual(json.loads(message_json), {"message_type": "server_info", "players_info": [], "your_id": "id", "your_username": "name"})
+        self.assertEqual(json.loads(extend_json_object("{}", {"a": 1})), {"a": 1})
+        self.assertEqual(extend_json_object(shared_json, {}), shared_json)
+
+    def test_message_to_json(self):
+        message = ServerInfoMessage(
+            message_type="server_info",
+            queue_info={},
+            room_info=[],
+            players_info=[{"player_id": "id"}],
+            your_id="id",
+            your_username="name",
+        )
+        self.assertEqual(json.loads(message.to_json())["players_info"], [{"player_id": "id"}])
+        self.assertEqual(json.loads(message.to_json())["your_username"], "name")
+
+
+if __name__ == '__main__':
+    unittest.main()